@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Activity
+from .models import Activity, ActivityOutbox
 
 
 @admin.register(Activity)
@@ -35,3 +35,12 @@ class ActivityAdmin(admin.ModelAdmin):
 
     readonly_fields = ("created_date",)
     filter_horizontal = ("related_users_ids",)
+
+
+@admin.register(ActivityOutbox)
+class ActivityOutboxAdmin(admin.ModelAdmin):
+    list_display = ("id", "activity", "user", "attempts", "available_at", "created_date")
+    search_fields = ("user__email", "activity__id")
+    readonly_fields = ("created_date",)
+    ordering = ("id",)
+    list_per_page = 50
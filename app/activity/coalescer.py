@@ -0,0 +1,56 @@
+"""
+Per-user coalescing of transaction pushes
+"""
+import logging
+from django.db import transaction
+from activity.fanout import deliver_pending_activities, get_coalesce_window
+from core.backends import ProcessInstance
+from core.batching import WindowBatcher
+
+logger = logging.getLogger(__name__)
+
+
+class PushCoalescer(WindowBatcher):
+    """
+    Holds the transaction activities of a process for a short window, then sends them merged.
+
+    On flush, each recipient gets one push with the latest state of every
+    transaction it is related to, and the payloads of all recipients are
+    built together. Activities still held when the process stops are sent
+    then, see core.batching.
+    """
+
+    def add(self, activity_id, exclude_user=None) -> None:
+        """
+        Hold the push of a transaction activity until the window ends.
+
+        Args:
+            activity_id (int): The committed activity to deliver.
+            exclude_user (str): User who should not receive the push.
+        """
+        super().add((activity_id, exclude_user))
+
+    def handle(self, items) -> int:
+        sent = deliver_pending_activities(items)
+        logger.debug("Coalesced %d activities into %d pushes", len(items), sent)
+        return sent
+
+
+_push_coalescer = ProcessInstance(lambda: PushCoalescer(get_coalesce_window()))
+
+
+def get_push_coalescer() -> PushCoalescer:
+    """Get the push coalescer of this process, with the ACTIVITY_PUSH_COALESCE_WINDOW setting."""
+    return _push_coalescer.get()
+
+
+def schedule_coalesced_push(activity, exclude_user=None) -> None:
+    """
+    Hold the push of a transaction activity once the surrounding transaction commits.
+
+    Args:
+        activity (Activity): The activity to deliver.
+        exclude_user (str): User who should not receive the push.
+    """
+    activity_id = activity.id
+    transaction.on_commit(lambda: get_push_coalescer().add(activity_id, exclude_user))
@@ -0,0 +1,407 @@
+"""
+WebSocket fan-out of activities
+"""
+import logging
+import time
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Prefetch
+from activity.models import Activity, ActivityOutbox, ActivityType
+from core.push import encode_frame, filter_online_users, send_user_frame
+from transaction.utils import TransactionHelper
+
+TRANSACTION_ACTIVITY_TYPES = [ActivityType.ADDED_TRANSACTION, ActivityType.MODIFIED_TRANSACTION, ActivityType.DELETED_TRANSACTION, ActivityType.RESTORED_TRANSACTION]
+FRIEND_ACTIVITY_TYPES = [ActivityType.ADDED_YOU_AS_FRIEND, ActivityType.REMOVED_YOU_AS_FRIEND]
+GROUP_ACTIVITY_TYPES = [ActivityType.ADDED_TO_GROUP, ActivityType.REMOVED_FROM_GROUP, ActivityType.GROUP_CREATED, ActivityType.GROUP_DELETED, ActivityType.GROUP_RESTORED]
+COALESCED_MESSAGE_TYPE = 'bulk_transaction_message'
+
+logger = logging.getLogger(__name__)
+
+
+class PushFormat:
+    SNAPSHOT = 'snapshot'
+    DELTA = 'delta'
+
+
+DELTA_PUSH_VERSION = 1
+
+
+class FanoutMode:
+    SYNC = 'sync'
+    CELERY = 'celery'
+    OUTBOX = 'outbox'
+
+
+def get_fanout_mode() -> str:
+    return getattr(settings, 'ACTIVITY_FANOUT_MODE', FanoutMode.SYNC)
+
+
+def get_push_format() -> str:
+    return getattr(settings, 'TRANSACTION_PUSH_FORMAT', PushFormat.SNAPSHOT)
+
+
+def get_coalesce_window() -> float:
+    return getattr(settings, 'ACTIVITY_PUSH_COALESCE_WINDOW', 0)
+
+
+def get_fanout_batch_size() -> int:
+    return getattr(settings, 'ACTIVITY_FANOUT_BATCH_SIZE', 50)
+
+
+def chunked(items, size):
+    if not size:
+        yield items
+        return
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
+
+def schedule_activity_fanout(activity, exclude_user=None) -> None:
+    """
+    Hand the fan-out of an activity to a Celery worker once the surrounding transaction commits.
+
+    Args:
+        activity (Activity): The activity to deliver.
+        exclude_user (str): User who should not receive the push.
+    """
+    from activity.tasks import deliver_activity_fanout
+
+    activity_id = activity.id
+    transaction.on_commit(lambda: deliver_activity_fanout.delay(activity_id, exclude_user, time.time()))
+
+
+def record_activity_outbox(activity, exclude_user=None) -> int:
+    """
+    Write one outbox entry per recipient of an activity, for `relay_outbox` to publish.
+
+    Args:
+        activity (Activity): The activity to deliver.
+        exclude_user (str): User who should not receive the push.
+
+    Returns:
+        int: Number of outbox entries written.
+    """
+    entries = ActivityOutbox.objects.bulk_create([
+        ActivityOutbox(activity=activity, user_id=user_id)
+        for user_id in filter_online_users(get_activity_recipients(activity, exclude_user))
+    ])
+    return len(entries)
+
+
+def get_activity_recipients(activity, exclude_user=None) -> list:
+    """
+    Get the users who should receive the push of an activity.
+
+    Args:
+        activity (Activity): The activity to deliver.
+        exclude_user (str): User who should not receive the push.
+
+    Returns:
+        list: Recipient user IDs.
+    """
+    associated_members = activity.get_related_user_ids()
+
+    if activity.activity_type in TRANSACTION_ACTIVITY_TYPES:
+        return [user_id for user_id in associated_members if not (exclude_user and exclude_user == str(user_id))]
+    elif activity.activity_type in FRIEND_ACTIVITY_TYPES:
+        return [user_id for user_id in associated_members if user_id != activity.user_id_id]
+    elif activity.activity_type in GROUP_ACTIVITY_TYPES:
+        return associated_members
+    return []
+
+
+def build_activity_frames(activity, recipient_ids, batch_size=None):
+    """
+    Build the encoded WebSocket frames of an activity.
+
+    Frames that are the same for every recipient are encoded once.
+
+    Args:
+        activity (Activity): The activity to deliver.
+        recipient_ids (list): The user IDs to build frames for.
+        batch_size (int): Number of recipients whose transaction payloads are built together.
+            All recipients are built at once when not given.
+
+    Yields:
+        tuple: (user_id, frame) for each recipient.
+    """
+    if not recipient_ids:
+        return
+    activity_ws_data = activity.get_activity_data()
+
+    if activity.activity_type in TRANSACTION_ACTIVITY_TYPES and get_push_format() == PushFormat.DELTA:
+        transactions_data, changed_pairs = TransactionHelper.get_transactions_delta_data(
+            [activity.transaction_id], all_pairs=activity.activity_type == ActivityType.MODIFIED_TRANSACTION
+        )
+        transaction_data = transactions_data[activity.transaction_id_id]
+        for batch in chunked(recipient_ids, batch_size):
+            ledger_by_user = TransactionHelper.get_ledger_changes_for_users(changed_pairs, batch)
+            for user_id in batch:
+                yield user_id, encode_frame({
+                    'type': 'transaction_message',
+                    'data': {
+                        **transaction_data,
+                        **ledger_by_user[user_id],
+                        'format': PushFormat.DELTA,
+                        'version': DELTA_PUSH_VERSION,
+                        'activity': activity_ws_data
+                    }
+                })
+
+    elif activity.activity_type in TRANSACTION_ACTIVITY_TYPES:
+        for batch in chunked(recipient_ids, batch_size):
+            transaction_data_by_user = TransactionHelper.get_transaction_ws_data_for_users(activity.transaction_id, batch)
+            for user_id in batch:
+                transaction_data = transaction_data_by_user[user_id]
+                transaction_data.update({
+                    "activity": activity_ws_data
+                })
+                yield user_id, encode_frame({
+                    'type': 'transaction_message',
+                    'data': transaction_data
+                })
+
+    elif activity.activity_type in FRIEND_ACTIVITY_TYPES:
+        user = activity.user_id
+        frame = encode_frame({
+            'type': 'transaction_message',
+            'data': {
+                "activity": activity_ws_data,
+                "user": {
+                    "id": user.id,
+                    "name": user.name,
+                    "email": user.email,
+                    "image_url": user.image_url
+                },
+                "message": activity.comments.get('message')
+            }
+        })
+        for user_id in recipient_ids:
+            yield user_id, frame
+
+    elif activity.activity_type in GROUP_ACTIVITY_TYPES:
+        group_details = activity.group_id.get_group_ws_data()
+        group_members = activity.group_id.get_group_members()
+        participants = activity.user_id.get_users_details(group_members)
+        frame = encode_frame({
+            'type': 'transaction_message',
+            'data': {
+                "type": activity.activity_type,
+                "group_details": group_details,
+                "activity": activity_ws_data,
+                "participant_details": participants
+            }
+        })
+        for user_id in recipient_ids:
+            yield user_id, frame
+
+
+def get_push_key(activity_id) -> str:
+    """Key of the push of an activity in the replay buffer, so a retried delivery is kept once."""
+    return f"activity:{activity_id}"
+
+
+def deliver_activity(activity, exclude_user=None, batch_size=None) -> int:
+    """
+    Build and send the WebSocket pushes of an activity to its related users.
+
+    Args:
+        activity (Activity): The activity to deliver.
+        exclude_user (str): User who should not receive the push.
+        batch_size (int): Number of recipients whose transaction payloads are built together.
+            All recipients are built at once when not given.
+
+    Returns:
+        int: Number of pushes sent.
+    """
+    recipient_ids = filter_online_users(get_activity_recipients(activity, exclude_user))
+    channel_layer = get_channel_layer()
+    sent = sent_bytes = 0
+    for user_id, frame in build_activity_frames(activity, recipient_ids, batch_size):
+        send_user_frame(user_id, frame, channel_layer, key=get_push_key(activity.id))
+        sent += 1
+        sent_bytes += len(frame)
+    logger.debug("Activity %s: %d pushes, %d bytes", activity.id, sent, sent_bytes)
+    return sent
+
+
+def load_activities(activity_ids) -> list:
+    """Load activities with what building their frames needs, in the order of `activity_ids`."""
+    activities = Activity.objects.select_related('user_id', 'group_id', 'transaction_id').prefetch_related(
+        Prefetch('related_users_ids', get_user_model().objects.only('id'))
+    ).in_bulk(activity_ids)
+    return [activities[activity_id] for activity_id in activity_ids if activity_id in activities]
+
+
+def group_activities_by_user(pending) -> dict:
+    """
+    Group transaction activities by recipient, keeping the latest activity of each transaction.
+
+    Recipients without an open socket are left out, see filter_online_users.
+
+    Args:
+        pending (iterable): (activity, exclude_user) pairs, activities with their related users prefetched.
+
+    Returns:
+        dict: Lists of activities ordered by ID, keyed by recipient ID.
+    """
+    latest_by_user = {}
+    for activity, exclude_user in pending:
+        for user_id in get_activity_recipients(activity, exclude_user):
+            latest = latest_by_user.setdefault(user_id, {})
+            current = latest.get(activity.transaction_id_id)
+            if current is None or current.id < activity.id:
+                latest[activity.transaction_id_id] = activity
+    return {
+        user_id: sorted(latest_by_user[user_id].values(), key=lambda activity: activity.id)
+        for user_id in filter_online_users(list(latest_by_user))
+    }
+
+
+def build_coalesced_frames(activities_by_user):
+    """
+    Build one encoded WebSocket frame per recipient of several transaction activities.
+
+    Each recipient gets the data of all its transactions in a single
+    `bulk_transaction_message` push, instead of one push per transaction.
+
+    Args:
+        activities_by_user (dict): The activities to send, keyed by recipient ID, see group_activities_by_user.
+
+    Yields:
+        tuple: (user_id, frame) for each recipient.
+    """
+    if get_push_format() == PushFormat.DELTA:
+        yield from build_coalesced_delta_frames(activities_by_user)
+        return
+
+    activity_ws_data = {}
+    for user_id, user_activities in activities_by_user.items():
+        transactions_data = TransactionHelper.get_transactions_ws_data_for_user(
+            [activity.transaction_id_id for activity in user_activities], user_id
+        )
+        for activity, transaction_data in zip(user_activities, transactions_data):
+            if activity.id not in activity_ws_data:
+                activity_ws_data[activity.id] = activity.get_activity_data()
+            transaction_data["activity"] = activity_ws_data[activity.id]
+        yield user_id, encode_frame({
+            'type': COALESCED_MESSAGE_TYPE,
+            'data': {
+                'transactions': transactions_data
+            }
+        })
+
+
+def build_coalesced_delta_frames(activities_by_user):
+    """
+    Build the delta frames of a batch of transaction activities, see build_coalesced_frames.
+
+    Transactions and the balances they changed are loaded once for the whole
+    batch, each recipient gets its transactions and its own changed balances.
+
+    Args:
+        activities_by_user (dict): The activities to send, keyed by recipient ID.
+
+    Yields:
+        tuple: (user_id, frame) for each recipient.
+    """
+    activities = {activity.id: activity for user_activities in activities_by_user.values() for activity in user_activities}
+    transactions_data, changed_pairs = TransactionHelper.get_transactions_delta_data(
+        [activity.transaction_id for activity in activities.values()],
+        all_pairs=any(activity.activity_type == ActivityType.MODIFIED_TRANSACTION for activity in activities.values())
+    )
+    ledger_by_user = TransactionHelper.get_ledger_changes_for_users(changed_pairs, list(activities_by_user))
+    activity_ws_data = {activity_id: activity.get_activity_data() for activity_id, activity in activities.items()}
+
+    for user_id, user_activities in activities_by_user.items():
+        yield user_id, encode_frame({
+            'type': COALESCED_MESSAGE_TYPE,
+            'data': {
+                'transactions': [
+                    {**transactions_data[activity.transaction_id_id], 'activity': activity_ws_data[activity.id]}
+                    for activity in user_activities
+                ],
+                **ledger_by_user[user_id],
+                'format': PushFormat.DELTA,
+                'version': DELTA_PUSH_VERSION
+            }
+        })
+
+
+def deliver_coalesced_activities(activity_ids, exclude_user=None) -> int:
+    """
+    Send the pushes of a batch of transaction activities, one per recipient.
+
+    Args:
+        activity_ids (list): IDs of the activities to deliver.
+        exclude_user (str): User who should not receive the push.
+
+    Returns:
+        int: Number of pushes sent.
+    """
+    activities_by_user = group_activities_by_user(
+        (activity, exclude_user) for activity in load_activities(activity_ids)
+    )
+    sent, sent_bytes = send_frames(build_coalesced_frames(activities_by_user))
+    logger.debug("Activities %s: %d coalesced pushes, %d bytes", activity_ids, sent, sent_bytes)
+    return sent
+
+
+def deliver_pending_activities(pending) -> int:
+    """
+    Send the pushes of transaction activities held by the push coalescer, one per recipient.
+
+    Args:
+        pending (list): (activity_id, exclude_user) pairs in the order they were held.
+
+    Returns:
+        int: Number of pushes sent.
+    """
+    activities = {activity.id: activity for activity in load_activities(list(dict.fromkeys(
+        activity_id for activity_id, _ in pending
+    )))}
+    activities_by_user = group_activities_by_user(
+        (activities[activity_id], exclude_user) for activity_id, exclude_user in pending if activity_id in activities
+    )
+    sent, sent_bytes = send_frames(build_coalesced_frames(activities_by_user))
+    logger.debug("%d held activities: %d coalesced pushes, %d bytes", len(pending), sent, sent_bytes)
+    return sent
+
+
+def send_frames(frames) -> tuple:
+    """Send (user_id, frame) pairs, returning the number of pushes and bytes sent."""
+    channel_layer = get_channel_layer()
+    sent = sent_bytes = 0
+    for user_id, frame in frames:
+        send_user_frame(user_id, frame, channel_layer)
+        sent += 1
+        sent_bytes += len(frame)
+    return sent, sent_bytes
+
+
+def dispatch_coalesced_activities(activity_ids, exclude_user=None) -> None:
+    """
+    Deliver a batch of transaction activities the way the fan-out mode delivers single activities.
+
+    In outbox mode, entries are still written per activity and recipient, as the
+    relay publishes entries one by one.
+
+    Args:
+        activity_ids (list): IDs of the activities to deliver.
+        exclude_user (str): User who should not receive the push.
+    """
+    fanout_mode = get_fanout_mode()
+    if fanout_mode == FanoutMode.OUTBOX:
+        ActivityOutbox.objects.bulk_create([
+            ActivityOutbox(activity=activity, user_id=user_id)
+            for activity in load_activities(activity_ids)
+            for user_id in filter_online_users(get_activity_recipients(activity, exclude_user))
+        ])
+    elif fanout_mode == FanoutMode.CELERY:
+        from activity.tasks import deliver_coalesced_activity_fanout
+
+        transaction.on_commit(lambda: deliver_coalesced_activity_fanout.delay(activity_ids, exclude_user, time.time()))
+    else:
+        deliver_coalesced_activities(activity_ids, exclude_user)
@@ -0,0 +1,39 @@
+"""
+Django command to build the activity inbox from related users of activities
+"""
+from typing import Any
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from activity.models import Activity, ActivityInbox
+
+
+class Command(BaseCommand):
+    """Django command to backfill ActivityInbox from the Activity.related_users_ids rows"""
+
+    help = "Copy related users of existing activities into ActivityInbox, in activity id ranges."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help="Activity ids copied per transaction.")
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        """Entrypoint for command"""
+        through = Activity.related_users_ids.through
+        quote = connection.ops.quote_name
+        insert_sql = (
+            f"INSERT INTO {quote(ActivityInbox._meta.db_table)} (user_id, activity_id) "
+            f"SELECT user_id, activity_id FROM {quote(through._meta.db_table)} "
+            f"WHERE activity_id > %s AND activity_id <= %s "
+            f"ON CONFLICT (user_id, activity_id) DO NOTHING"
+        )
+
+        last_id = through.objects.aggregate(last_id=Max('activity_id'))['last_id'] or 0
+        batch_size = options['batch_size']
+        copied = 0
+        for start in range(0, last_id, batch_size):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(insert_sql, [start, start + batch_size])
+                copied += cursor.rowcount
+            self.stdout.write(f"Activities up to {min(start + batch_size, last_id)} of {last_id}: {copied} rows copied")
+
+        self.stdout.write(self.style.SUCCESS(f"Activity inbox backfilled, {copied} rows copied."))
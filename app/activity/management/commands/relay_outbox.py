@@ -0,0 +1,78 @@
+"""
+Django command to publish the activity outbox to the channel layer
+"""
+import time
+from typing import Any
+from django.core.management.base import BaseCommand, CommandError
+from activity.outbox import relay_outbox_batch
+
+
+class Command(BaseCommand):
+    """Django command to relay ActivityOutbox entries to the channel layer"""
+
+    help = "Publish pending activity pushes from the outbox, run with ACTIVITY_FANOUT_MODE=outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help="Entries published per transaction.")
+        parser.add_argument('--interval', type=float, default=0.5, help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument('--metrics-interval', type=float, default=30, help="Seconds between throughput reports.")
+        parser.add_argument('--once', action='store_true', help="Publish until the outbox is empty, then exit.")
+        parser.add_argument(
+            '--partition', default=None,
+            help="INDEX/COUNT to only relay users with user_id % COUNT == INDEX, for running several relays."
+        )
+
+    def parse_partition(self, value):
+        """Parse INDEX/COUNT into a tuple."""
+        if not value:
+            return None
+        try:
+            index, count = (int(part) for part in value.split('/'))
+        except ValueError:
+            raise CommandError("--partition must look like INDEX/COUNT, e.g. 0/4.")
+        if count < 1 or not 0 <= index < count:
+            raise CommandError("--partition INDEX must be between 0 and COUNT - 1.")
+        return index, count
+
+    def write_metrics(self, totals, window_started_at):
+        """Report throughput since the last report."""
+        elapsed = max(time.monotonic() - window_started_at, 1e-9)
+        self.stdout.write(
+            f"Relayed {totals['sent']} pushes in {elapsed:.1f}s ({totals['sent'] / elapsed:.1f}/s), "
+            f"{totals['sent_bytes'] / max(totals['sent'], 1):.0f} bytes per push, "
+            f"{totals['failed']} retried, {totals['dropped']} dropped, "
+            f"{totals['batches']} batches averaging {totals['elapsed_ms'] / max(totals['batches'], 1):.1f} ms"
+        )
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        """Entrypoint for command"""
+        partition = self.parse_partition(options['partition'])
+        self.stdout.write('Relaying activity outbox' + (f' partition {partition[0]}/{partition[1]}' if partition else ''))
+
+        totals = dict.fromkeys(['sent', 'sent_bytes', 'failed', 'dropped', 'batches', 'elapsed_ms'], 0)
+        window_started_at = time.monotonic()
+        try:
+            while True:
+                result = relay_outbox_batch(options['batch_size'], partition)
+                if result.claimed:
+                    totals['sent'] += result.sent
+                    totals['sent_bytes'] += result.sent_bytes
+                    totals['failed'] += result.failed
+                    totals['dropped'] += result.dropped
+                    totals['batches'] += 1
+                    totals['elapsed_ms'] += result.elapsed_ms
+
+                if time.monotonic() - window_started_at >= options['metrics_interval']:
+                    self.write_metrics(totals, window_started_at)
+                    totals = dict.fromkeys(totals, 0)
+                    window_started_at = time.monotonic()
+
+                if not result.claimed:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.write_metrics(totals, window_started_at)
+        self.stdout.write(self.style.SUCCESS("Outbox relay stopped."))
@@ -1,5 +1,9 @@
-from django.db import models
+from django.db import models, transaction as db_transaction
+from django.db.models import Max
 from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from core.cache import cache_is_shared, cache_set_max
 from group.models import Group
 from transaction.models import Transaction
 
@@ -28,14 +32,21 @@ class Activity(models.Model):
     comments = models.JSONField(blank=True, null=True)
     created_date = models.DateTimeField(auto_now_add=True)
 
+    def get_related_user_ids(self) -> list:
+        """Get the ids of the related users, reusing prefetched users when available."""
+        if 'related_users_ids' in getattr(self, '_prefetched_objects_cache', {}):
+            return [user.id for user in self.related_users_ids.all()]
+        return list(self.related_users_ids.values_list("id", flat=True))
+
     def get_activity_data(self):
+        related_users_ids = self.get_related_user_ids()
         return {
             "id": str(self.id),
-            "user_id": str(self.user_id.id),
-            "group_id": str(self.group_id.id) if self.group_id else "",
-            "transaction_id": str(self.transaction_id.id) if self.transaction_id else "",
+            "user_id": str(self.user_id_id),
+            "group_id": str(self.group_id_id) if self.group_id_id else "",
+            "transaction_id": str(self.transaction_id_id) if self.transaction_id_id else "",
             "activity_type": self.activity_type,
-            "related_users_ids": list(map(str, list(self.related_users_ids.values_list("id", flat=True)))),
+            "related_users_ids": list(map(str, related_users_ids)),
             "comments": self.comments,
             "created_date": self.created_date.isoformat(),
         }
@@ -69,8 +80,141 @@ class Activity(models.Model):
 
         return " ".join(messages)
 
+    @staticmethod
+    def latest_activity_cache_key(user_id) -> str:
+        return f"activity:latest:{user_id}"
+
+    @classmethod
+    def get_latest_activity_id(cls, user_id) -> int:
+        """
+        Get the id of the latest activity related to a user.
+
+        Served from the cache, and computed from the database on a miss. The
+        cache is only filled with `add`, so a value written on commit of a new
+        activity is never replaced by an older one read before that commit.
+        A cache kept by this process misses activities committed through other
+        processes, so without a shared cache it is always computed.
+
+        Args:
+            user_id (int): The user whose latest activity is wanted.
+
+        Returns:
+            int: Latest related activity id, 0 when there is none.
+        """
+        if not cache_is_shared():
+            return ActivityInbox.get_latest_activity_id(user_id)
+
+        key = cls.latest_activity_cache_key(user_id)
+        latest_id = cache.get(key)
+        if latest_id is None:
+            latest_id = ActivityInbox.get_latest_activity_id(user_id)
+            cache.add(key, latest_id, settings.ACTIVITY_LATEST_ID_CACHE_TIMEOUT)
+        return latest_id
+
+    @classmethod
+    def set_latest_activity_id(cls, user_ids, activity_id) -> None:
+        """Record a committed activity as the latest of its related users, unless they already have a newer one."""
+        cache_set_max(
+            [cls.latest_activity_cache_key(user_id) for user_id in user_ids],
+            activity_id,
+            settings.ACTIVITY_LATEST_ID_CACHE_TIMEOUT
+        )
+
+    @classmethod
+    def add_related_users_in_bulk(cls, related_user_ids) -> None:
+        """
+        Add related users to several activities at once.
+
+        Writes what `related_users_ids.add` and its `m2m_changed` receivers write
+        for each activity (the relation rows, the inbox rows and the latest
+        activity ids on commit) with one query per table, without the per-activity
+        fan-out, which the caller dispatches for the whole batch.
+
+        Args:
+            related_user_ids (dict): Related user IDs keyed by activity ID.
+        """
+        through = cls.related_users_ids.through
+        pairs = [(activity_id, user_id) for activity_id, user_ids in related_user_ids.items() for user_id in set(user_ids)]
+        through.objects.bulk_create(
+            [through(activity_id=activity_id, user_id=user_id) for activity_id, user_id in pairs],
+            ignore_conflicts=True
+        )
+        ActivityInbox.objects.bulk_create(
+            [ActivityInbox(activity_id=activity_id, user_id=user_id) for activity_id, user_id in pairs],
+            ignore_conflicts=True
+        )
+
+        latest_ids = {}
+        for activity_id, user_id in pairs:
+            latest_ids[user_id] = max(latest_ids.get(user_id, 0), activity_id)
+        users_by_latest_id = {}
+        for user_id, activity_id in latest_ids.items():
+            users_by_latest_id.setdefault(activity_id, []).append(user_id)
+
+        def set_latest_activity_ids():
+            for activity_id, user_ids in users_by_latest_id.items():
+                cls.set_latest_activity_id(user_ids, activity_id)
+        db_transaction.on_commit(set_latest_activity_ids)
+
     class Meta:
         ordering = ["-created_date"]
 
     def __str__(self):
         return f"{self.user_id} - {self.activity_type} at {self.created_date}"
+
+
+class ActivityInbox(models.Model):
+    """
+    Activities of a user, one row per related user of an activity.
+
+    Mirrors `Activity.related_users_ids` and is keyed on (user, activity), so
+    reading a user's activities after an id is an index-only range scan.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+", db_index=False)
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name="inbox_entries")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "activity"], name="activity_inbox_user_activity_unique"),
+        ]
+
+    @classmethod
+    def get_latest_activity_id(cls, user_id) -> int:
+        """Get the id of the user's latest activity from the inbox, 0 when there is none."""
+        return cls.objects.filter(user_id=user_id).aggregate(latest_id=Max('activity_id'))['latest_id'] or 0
+
+    @classmethod
+    def get_activity_ids(cls, user_id, since_id, limit) -> list:
+        """Get up to `limit` ids of the user's activities after `since_id`, oldest first."""
+        return list(cls.objects.filter(
+            user_id=user_id,
+            activity_id__gt=since_id
+        ).order_by('activity_id').values_list('activity_id', flat=True)[:limit])
+
+    def __str__(self):
+        return f"{self.activity_id} for {self.user_id}"
+
+
+class ActivityOutbox(models.Model):
+    """
+    Pending WebSocket push of an activity to one user.
+
+    Written in the same database transaction as the activity and published
+    to the channel layer by `manage.py relay_outbox`, so rolled back writes
+    never reach a socket and a channel layer outage never fails a write.
+    """
+    activity = models.ForeignKey(Activity, on_delete=models.CASCADE, related_name="outbox_entries")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["user", "id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.activity_id} to {self.user_id} ({self.attempts} attempts)"
@@ -0,0 +1,153 @@
+"""
+Relay of the activity outbox to the channel layer
+"""
+import time
+import logging
+from collections import namedtuple
+from datetime import timedelta
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.db.models.functions import Mod
+from django.utils import timezone
+from activity.fanout import build_activity_frames, get_push_key
+from activity.models import Activity, ActivityOutbox
+from core.push import send_user_frame
+
+logger = logging.getLogger(__name__)
+
+RelayResult = namedtuple('RelayResult', ['claimed', 'sent', 'failed', 'dropped', 'elapsed_ms', 'sent_bytes'])
+
+
+def get_retry_delay(attempts) -> timedelta:
+    """Exponential backoff for an entry that failed `attempts` times, capped at ACTIVITY_OUTBOX_MAX_RETRY_DELAY."""
+    base_delay = getattr(settings, 'ACTIVITY_OUTBOX_RETRY_DELAY', 1)
+    max_delay = getattr(settings, 'ACTIVITY_OUTBOX_MAX_RETRY_DELAY', 300)
+    return timedelta(seconds=min(base_delay * 2 ** (attempts - 1), max_delay))
+
+
+def claim_outbox_batch(batch_size, partition=None) -> list:
+    """
+    Lock the next publishable outbox entries, skipping entries locked by another relay.
+
+    An entry is held back while an older entry of the same user waits for a retry,
+    so every user receives pushes in the order they were written.
+
+    Args:
+        batch_size (int): Maximum number of entries to claim.
+        partition (tuple): (index, count) to only claim users with `user_id % count == index`.
+
+    Returns:
+        list: The claimed ActivityOutbox entries ordered by id. Must be called inside a transaction.
+    """
+    now = timezone.now()
+    earlier_pending = ActivityOutbox.objects.filter(
+        user_id=OuterRef('user_id'),
+        id__lt=OuterRef('id'),
+        available_at__gt=now
+    )
+    entries = ActivityOutbox.objects.filter(available_at__lte=now).filter(~Exists(earlier_pending))
+    if partition:
+        index, count = partition
+        entries = entries.alias(user_partition=Mod(F('user_id'), count)).filter(user_partition=index)
+    return list(entries.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+
+
+def build_outbox_frames(entries) -> tuple:
+    """
+    Build the WebSocket frame of every entry, building each activity once for all its recipients.
+
+    Returns:
+        tuple: ({entry_id: frame}, {entry_id: error}) for the entries that could and could not be built.
+    """
+    entries_by_activity = {}
+    for entry in entries:
+        entries_by_activity.setdefault(entry.activity_id, []).append(entry)
+
+    activities = Activity.objects.select_related('user_id', 'group_id', 'transaction_id').in_bulk(entries_by_activity.keys())
+    frames, errors = {}, {}
+    for activity_id, activity_entries in entries_by_activity.items():
+        try:
+            built = dict(build_activity_frames(activities[activity_id], [entry.user_id for entry in activity_entries]))
+        except Exception as error:
+            logger.exception("Could not build outbox frames for activity %s", activity_id)
+            built = {}
+            errors.update({entry.id: repr(error) for entry in activity_entries})
+        for entry in activity_entries:
+            if entry.user_id in built:
+                frames[entry.id] = built[entry.user_id]
+    return frames, errors
+
+
+def relay_outbox_batch(batch_size=None, partition=None, channel_layer=None) -> RelayResult:
+    """
+    Publish one batch of outbox entries to the channel layer.
+
+    Published entries are deleted. A failed entry is retried with exponential backoff
+    until ACTIVITY_OUTBOX_MAX_ATTEMPTS, after which it is dropped. Once an entry of a
+    user fails, the user's later entries of the batch wait for it.
+
+    Args:
+        batch_size (int): Maximum number of entries to publish. Defaults to ACTIVITY_OUTBOX_BATCH_SIZE.
+        partition (tuple): (index, count) to only relay users with `user_id % count == index`.
+        channel_layer: Channel layer to publish to. Defaults to the configured layer.
+
+    Returns:
+        RelayResult: Entries claimed, sent, failed, dropped, time spent in milliseconds and bytes of the frames sent.
+    """
+    started_at = time.perf_counter()
+    batch_size = batch_size or getattr(settings, 'ACTIVITY_OUTBOX_BATCH_SIZE', 100)
+    max_attempts = getattr(settings, 'ACTIVITY_OUTBOX_MAX_ATTEMPTS', 10)
+    channel_layer = channel_layer or get_channel_layer()
+
+    with transaction.atomic():
+        entries = claim_outbox_batch(batch_size, partition)
+        if not entries:
+            return RelayResult(claimed=0, sent=0, failed=0, dropped=0, elapsed_ms=0.0, sent_bytes=0)
+
+        frames, errors = build_outbox_frames(entries)
+        done_ids, failed_entries, blocked_users = [], [], set()
+        for entry in entries:
+            if entry.user_id in blocked_users:
+                continue
+            if entry.id in frames:
+                try:
+                    send_user_frame(entry.user_id, frames[entry.id], channel_layer, key=get_push_key(entry.activity_id))
+                    done_ids.append(entry.id)
+                    continue
+                except Exception as error:
+                    errors[entry.id] = repr(error)
+            elif entry.id not in errors:
+                # The activity no longer has a frame for this user
+                done_ids.append(entry.id)
+                continue
+            blocked_users.add(entry.user_id)
+            failed_entries.append(entry)
+
+        now = timezone.now()
+        dropped_ids = []
+        for entry in failed_entries:
+            entry.attempts += 1
+            entry.last_error = errors[entry.id]
+            if entry.attempts >= max_attempts:
+                logger.error("Dropping outbox entry %s after %d attempts: %s", entry.id, entry.attempts, entry.last_error)
+                dropped_ids.append(entry.id)
+            else:
+                entry.available_at = now + get_retry_delay(entry.attempts)
+
+        ActivityOutbox.objects.filter(id__in=done_ids + dropped_ids).delete()
+        ActivityOutbox.objects.bulk_update(
+            [entry for entry in failed_entries if entry.id not in dropped_ids],
+            ['attempts', 'last_error', 'available_at']
+        )
+
+    elapsed_ms = (time.perf_counter() - started_at) * 1000
+    return RelayResult(
+        claimed=len(entries),
+        sent=len(done_ids),
+        failed=len(failed_entries) - len(dropped_ids),
+        dropped=len(dropped_ids),
+        elapsed_ms=elapsed_ms,
+        sent_bytes=sum(len(frames[entry_id]) for entry_id in done_ids if entry_id in frames)
+    )
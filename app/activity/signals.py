@@ -1,79 +1,48 @@
+from django.db import transaction
 from django.db.models.signals import m2m_changed
-from asgiref.sync import async_to_sync
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from activity.models import Activity, ActivityType
-from transaction.utils import TransactionHelper
+from activity.models import Activity, ActivityInbox
+from activity.coalescer import schedule_coalesced_push
+from activity.fanout import (
+    TRANSACTION_ACTIVITY_TYPES, FanoutMode, get_coalesce_window, get_fanout_mode, deliver_activity, schedule_activity_fanout,
+    record_activity_outbox
+)
 from core.context import get_custom_context
 
 
+@receiver(m2m_changed, sender=Activity.related_users_ids.through)
+def sync_activity_inbox(sender, instance, action, reverse, pk_set, **kwargs):
+    """Mirror related users of activities into ActivityInbox."""
+    if action == "post_add":
+        pairs = [(instance.id, pk) if reverse else (pk, instance.id) for pk in pk_set]
+        ActivityInbox.objects.bulk_create(
+            [ActivityInbox(user_id=user_id, activity_id=activity_id) for user_id, activity_id in pairs],
+            ignore_conflicts=True
+        )
+    elif action == "post_remove":
+        field = "activity_id__in" if reverse else "user_id__in"
+        owner = "user_id" if reverse else "activity_id"
+        ActivityInbox.objects.filter(**{owner: instance.id, field: pk_set}).delete()
+    elif action == "pre_clear":
+        ActivityInbox.objects.filter(**{"user_id" if reverse else "activity_id": instance.id}).delete()
+
+
 @receiver(m2m_changed, sender=Activity.related_users_ids.through)
 def track_activity_creation(sender, instance, action, pk_set, **kwargs):
     if action != "post_add":
         return
+    activity_id, user_ids = instance.id, list(pk_set)
+    transaction.on_commit(lambda: Activity.set_latest_activity_id(user_ids, activity_id))
+
     exclude_user = get_custom_context('exclude_user')
     exclude_user = str(exclude_user) if exclude_user else None
-    associated_members = instance.related_users_ids.all().values_list('id', flat=True)
-    activity_ws_data = instance.get_activity_data()
-
-    channel_layer = get_channel_layer()
-    if instance.activity_type in [ActivityType.ADDED_TRANSACTION, ActivityType.MODIFIED_TRANSACTION, ActivityType.DELETED_TRANSACTION, ActivityType.RESTORED_TRANSACTION]:
-        for user_id in associated_members:
-            if exclude_user and exclude_user == str(user_id):
-                continue
-            transaction_data = TransactionHelper.get_transaction_ws_data(instance.transaction_id, user_id)
-            transaction_data.update({
-                "activity": activity_ws_data
-            })
-            data = {
-                'type': 'transaction_message',
-                'data': transaction_data
-            }
-            async_to_sync(channel_layer.group_send)(
-                f"user_{user_id}",
-                data
-            )
-
-    elif instance.activity_type in [ActivityType.ADDED_YOU_AS_FRIEND, ActivityType.REMOVED_YOU_AS_FRIEND]:
-        activity_ws_data = instance.get_activity_data()
-        for user_id in associated_members:
-            if user_id == instance.user_id.id:
-                continue
-            user = instance.user_id
-            data = {
-                'type': 'transaction_message',
-                'data': {
-                    "activity": activity_ws_data,
-                    "user": {
-                        "id": user.id,
-                        "name": user.name,
-                        "email": user.email,
-                        "image_url": user.image_url
-                    },
-                    "message": instance.comments.get('message')
-                }
-            }
-            async_to_sync(channel_layer.group_send)(
-                f"user_{user_id}",
-                data
-            )
 
-    elif instance.activity_type in [ActivityType.ADDED_TO_GROUP, ActivityType.REMOVED_FROM_GROUP, ActivityType.GROUP_CREATED, ActivityType.GROUP_DELETED, ActivityType.GROUP_RESTORED]:
-        group_details = instance.group_id.get_group_ws_data()
-        group_members = instance.group_id.get_group_members()
-        participants = instance.user_id.get_users_details(group_members)
-        activity_ws_data = instance.get_activity_data()
-        for user_id in associated_members:
-            data = {
-                'type': 'transaction_message',
-                'data': {
-                    "type": instance.activity_type,
-                    "group_details": group_details,
-                    "activity": activity_ws_data,
-                    "participant_details": participants
-                }
-            }
-            async_to_sync(channel_layer.group_send)(
-                f"user_{user_id}",
-                data
-            )
+    fanout_mode = get_fanout_mode()
+    if fanout_mode == FanoutMode.OUTBOX:
+        record_activity_outbox(instance, exclude_user)
+    elif fanout_mode == FanoutMode.CELERY:
+        schedule_activity_fanout(instance, exclude_user)
+    elif get_coalesce_window() and instance.activity_type in TRANSACTION_ACTIVITY_TYPES:
+        schedule_coalesced_push(instance, exclude_user)
+    else:
+        deliver_activity(instance, exclude_user)
@@ -0,0 +1,58 @@
+import time
+import logging
+from celery import shared_task
+from activity.models import Activity
+from activity.coalescer import get_push_coalescer
+from activity.fanout import (
+    TRANSACTION_ACTIVITY_TYPES, deliver_activity, deliver_coalesced_activities, get_coalesce_window, get_fanout_batch_size
+)
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True)
+def deliver_activity_fanout(self, activity_id, exclude_user=None, enqueued_at=None):
+    started_at = time.time()
+    activity = Activity.objects.select_related('user_id', 'group_id', 'transaction_id').filter(id=activity_id).first()
+    if not activity:
+        return None
+    if get_coalesce_window() and activity.activity_type in TRANSACTION_ACTIVITY_TYPES:
+        # Merged with the other transaction pushes this worker gets within the window
+        get_push_coalescer().add(activity_id, exclude_user)
+        return {"activity_id": activity_id, "coalesced": True}
+
+    sent = deliver_activity(activity, exclude_user, batch_size=get_fanout_batch_size())
+
+    delivered_at = time.time()
+    queue_lag_ms = (started_at - enqueued_at) * 1000 if enqueued_at else None
+    delivery_lag_ms = (delivered_at - enqueued_at) * 1000 if enqueued_at else None
+    logger.info(
+        "Activity %s fan-out: %d pushes, queue lag %s ms, enqueue-to-delivery %s ms",
+        activity_id, sent,
+        f"{queue_lag_ms:.1f}" if queue_lag_ms is not None else "n/a",
+        f"{delivery_lag_ms:.1f}" if delivery_lag_ms is not None else "n/a",
+    )
+    return {
+        "activity_id": activity_id,
+        "sent": sent,
+        "queue_lag_ms": queue_lag_ms,
+        "delivery_lag_ms": delivery_lag_ms,
+    }
+
+
+@shared_task(bind=True)
+def deliver_coalesced_activity_fanout(self, activity_ids, exclude_user=None, enqueued_at=None):
+    started_at = time.time()
+    sent = deliver_coalesced_activities(activity_ids, exclude_user)
+
+    queue_lag_ms = (started_at - enqueued_at) * 1000 if enqueued_at else None
+    logger.info(
+        "Coalesced fan-out of %d activities: %d pushes, queue lag %s ms",
+        len(activity_ids), sent,
+        f"{queue_lag_ms:.1f}" if queue_lag_ms is not None else "n/a",
+    )
+    return {
+        "activity_ids": activity_ids,
+        "sent": sent,
+        "queue_lag_ms": queue_lag_ms,
+    }
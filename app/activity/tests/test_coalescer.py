@@ -0,0 +1,132 @@
+"""
+Test for per-user coalescing of transaction pushes.
+"""
+import json
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from activity.coalescer import PushCoalescer
+from core.batching import flush_all_batchers
+from group.models import Group, GroupParticipant
+from transaction.serializers import AddTransactionSerializer, ModifyTransactionSerializer
+from core.tests.utils import create_user, IN_MEMORY_CHANNEL_LAYERS
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, ACTIVITY_PUSH_COALESCE_WINDOW=60)
+class PushCoalescerTests(TestCase):
+    """Test transaction pushes held within the window are merged per user."""
+
+    def setUp(self):
+        self.payer = create_user('payer@example.com')
+        self.members = [create_user(f'member{i}@example.com') for i in range(2)]
+        self.payer.friends.add(*self.members)
+        self.members[0].friends.add(self.members[1])
+        self.group = Group.objects.create(group_name='Trip', created_by=self.payer, group_type='trip')
+        GroupParticipant.objects.bulk_create([
+            GroupParticipant(group=self.group, user=user, role='user') for user in [self.payer, *self.members]
+        ])
+        self.channel_layer = get_channel_layer()
+        self.channels = {}
+        for user in [self.payer, *self.members]:
+            self.channels[user.id] = async_to_sync(self.channel_layer.new_channel)()
+            async_to_sync(self.channel_layer.group_add)(f"user_{user.id}", self.channels[user.id])
+
+        self.coalescer = PushCoalescer(60)
+        patcher = patch('activity.coalescer._push_coalescer.instance', self.coalescer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.coalescer.flush)
+
+    def payload(self, amount=10):
+        return {
+            'payer_id': self.payer.id,
+            'group': self.group.id,
+            'total_amount': amount * 3,
+            'transaction_type': 'debt',
+            'transaction_date': timezone.now().isoformat(),
+            'is_group': True,
+            'split_details': [{'user': user.id, 'amount': amount} for user in [self.payer, *self.members]],
+        }
+
+    def add_transaction(self):
+        serializer = AddTransactionSerializer(data=self.payload(), context={'user': self.payer})
+        serializer.is_valid(raise_exception=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            return serializer.save()
+
+    def modify_transaction(self, transaction, amount):
+        serializer = ModifyTransactionSerializer(transaction, data=self.payload(amount), context={'user': self.payer})
+        serializer.is_valid(raise_exception=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            serializer.save()
+
+    def receive(self, user):
+        return json.loads(async_to_sync(self.channel_layer.receive)(self.channels[user.id])['text'])['message']
+
+    def test_pushes_held_until_flush(self):
+        """Test nothing is sent before the window ends."""
+        self.add_transaction()
+
+        self.assertEqual(self.coalescer.get_stats()['pending'], 1)
+        self.assertNotIn(self.channels[self.members[0].id], self.channel_layer.channels)
+
+    def test_held_pushes_sent_on_shutdown(self):
+        """Test pushes still held when the process stops are sent rather than dropped."""
+        self.add_transaction()
+
+        flush_all_batchers()
+
+        self.assertEqual(self.coalescer.get_stats()['pending'], 0)
+        self.assertEqual(self.receive(self.members[0])['type'], 'bulk_transaction_message')
+
+    def test_burst_of_edits_sent_once_with_latest_state(self):
+        """Test several edits of a transaction reach each user as one push with its latest state."""
+        transaction = self.add_transaction()
+        self.modify_transaction(transaction, 20)
+        self.modify_transaction(transaction, 30)
+
+        sent = self.coalescer.flush()
+
+        self.assertEqual(sent, 3)
+        message = self.receive(self.members[0])
+        self.assertEqual(message['type'], 'bulk_transaction_message')
+        self.assertEqual(len(message['data']['transactions']), 1)
+        data = message['data']['transactions'][0]
+        self.assertEqual(data['total_amount'], 90.0)
+        self.assertEqual(data['activity']['activity_type'], 'modified_transaction')
+        self.assertNotIn(self.channels[self.members[0].id], self.channel_layer.channels)
+
+    def test_transactions_merged_per_user(self):
+        """Test different transactions of the window are sent in one push per user."""
+        first, second = self.add_transaction(), self.add_transaction()
+
+        self.coalescer.flush()
+
+        message = self.receive(self.members[1])
+        self.assertEqual(
+            [data['id'] for data in message['data']['transactions']], [str(first.id), str(second.id)]
+        )
+        self.assertEqual(self.coalescer.get_stats(), {'held': 2, 'sent': 3, 'pending': 0})
+
+    @override_settings(TRANSACTION_PUSH_FORMAT='delta')
+    def test_delta_burst_sends_balances_once(self):
+        """Test a delta push of merged edits carries the balances once, after the latest edit."""
+        transaction = self.add_transaction()
+        self.modify_transaction(transaction, 20)
+
+        self.coalescer.flush()
+
+        data = self.receive(self.members[1])['data']
+        self.assertEqual(len(data['transactions']), 1)
+        changes = {change['id']: change['balance'] for change in data['ledger_changes']}
+        self.assertEqual(changes[str(self.payer.id)], -20.0)
+
+    def test_other_activities_not_held(self):
+        """Test activities other than transactions are still sent right away."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.members[0].friends.remove(self.members[1])
+
+        self.assertEqual(self.coalescer.get_stats()['held'], 0)
+        self.assertEqual(self.receive(self.members[1])['data']['activity']['activity_type'], 'removed_you_as_friend')
@@ -0,0 +1,134 @@
+"""
+Test for delta-encoded transaction pushes.
+"""
+import json
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from core.consumers import CoreConsumer
+from core.replay import InMemoryReplayBuffer
+from group.models import Group, GroupParticipant
+from transaction.serializers import AddTransactionSerializer, BulkAddTransactionSerializer, ModifyTransactionSerializer
+from core.tests.utils import create_user, IN_MEMORY_CHANNEL_LAYERS
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, TRANSACTION_PUSH_FORMAT='delta')
+class DeltaPushTests(TestCase):
+    """Test the delta push format of transaction activities."""
+
+    def setUp(self):
+        self.payer = create_user('payer@example.com')
+        self.members = [create_user(f'member{i}@example.com') for i in range(3)]
+        self.payer.friends.add(*self.members)
+        self.members[0].friends.add(*self.members[1:])
+        self.group = Group.objects.create(group_name='Trip', created_by=self.payer, group_type='trip')
+        GroupParticipant.objects.bulk_create([
+            GroupParticipant(group=self.group, user=user, role='user') for user in [self.payer, *self.members]
+        ])
+        self.channel_layer = get_channel_layer()
+        self.channels = {}
+        for user in [self.payer, *self.members]:
+            self.channels[user.id] = async_to_sync(self.channel_layer.new_channel)()
+            async_to_sync(self.channel_layer.group_add)(f"user_{user.id}", self.channels[user.id])
+
+    def payload(self, payer, amount=10):
+        return {
+            'payer_id': payer.id,
+            'group': self.group.id,
+            'total_amount': amount * 4,
+            'transaction_type': 'debt',
+            'transaction_date': timezone.now().isoformat(),
+            'is_group': True,
+            'split_details': [{'user': user.id, 'amount': amount} for user in [self.payer, *self.members]],
+        }
+
+    def add_transaction(self):
+        serializer = AddTransactionSerializer(data=self.payload(self.payer), context={'user': self.payer})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def receive(self, user):
+        return json.loads(async_to_sync(self.channel_layer.receive)(self.channels[user.id])['text'])['message']
+
+    def test_member_gets_only_balance_with_payer(self):
+        """Test a member who is not the payer gets its changed balance with the payer only."""
+        transaction = self.add_transaction()
+
+        data = self.receive(self.members[1])['data']
+
+        self.assertEqual((data['format'], data['version']), ('delta', 1))
+        self.assertEqual(data['id'], str(transaction.id))
+        self.assertEqual(data['ledger_changes'], [{'id': str(self.payer.id), 'balance': -10.0}])
+        self.assertEqual(data['split_details'][1], {'id': str(self.members[0].id), 'amount': 10.0})
+        self.assertEqual(data['user_total_balance']['total_due'], 10.0)
+        self.assertNotIn('ledger_balance', data)
+        self.assertEqual(data['activity']['transaction_id'], str(transaction.id))
+
+    def test_payer_gets_balance_with_every_member(self):
+        """Test the payer gets its changed balance with every member."""
+        self.add_transaction()
+
+        data = self.receive(self.payer)['data']
+
+        self.assertEqual(
+            sorted((change['id'], change['balance']) for change in data['ledger_changes']),
+            sorted((str(member.id), 10.0) for member in self.members)
+        )
+
+    def test_modification_sends_balances_between_all_members(self):
+        """Test a modification, which may move balances between any members, sends all of them."""
+        transaction = self.add_transaction()
+        for user in [self.payer, *self.members]:
+            self.receive(user)
+
+        serializer = ModifyTransactionSerializer(transaction, data=self.payload(self.members[0], amount=20), context={'user': self.payer})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        changes = {change['id']: change['balance'] for change in self.receive(self.members[1])['data']['ledger_changes']}
+        self.assertEqual(changes, {str(self.payer.id): 0.0, str(self.members[0].id): -20.0})
+
+    def test_delta_push_smaller_than_snapshot(self):
+        """Benchmark: the delta push of a member is smaller than the snapshot push."""
+        self.add_transaction()
+        delta_bytes = len(json.dumps(self.receive(self.members[1])))
+
+        with self.settings(TRANSACTION_PUSH_FORMAT='snapshot'):
+            self.add_transaction()
+        snapshot_bytes = len(json.dumps(self.receive(self.members[1])))
+
+        self.assertLess(delta_bytes, snapshot_bytes)
+
+    def test_coalesced_delta_push(self):
+        """Test a batch is pushed as one delta with the balances of the whole batch."""
+        serializer = BulkAddTransactionSerializer(
+            data={'transactions': [self.payload(self.payer) for _ in range(3)]}, context={'user': self.payer}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        message = self.receive(self.members[1])
+
+        self.assertEqual(message['type'], 'bulk_transaction_message')
+        self.assertEqual(message['data']['format'], 'delta')
+        self.assertEqual(len(message['data']['transactions']), 3)
+        self.assertEqual(message['data']['ledger_changes'], [{'id': str(self.payer.id), 'balance': -30.0}])
+
+    def test_get_snapshot_action(self):
+        """Test the snapshot has the full ledger and the sequence number of the last push."""
+        buffer = InMemoryReplayBuffer()
+        with patch('core.replay._replay_buffer.instance', buffer):
+            self.add_transaction()
+            consumer = CoreConsumer()
+            consumer.scope = {'user': self.members[1]}
+
+            message = consumer.handle_get_snapshot({})['message']
+
+        self.assertEqual(message['type'], 'snapshot')
+        self.assertEqual(message['seq'], buffer.get_last_seq(self.members[1].id))
+        ledger = {entry['id']: entry for entry in message['data']['ledger_balance']}
+        self.assertEqual(ledger[str(self.payer.id)]['balance'], -10.0)
+        self.assertEqual(ledger[str(self.payer.id)]['email'], 'payer@example.com')
+        self.assertEqual(message['data']['user_total_balance']['net_balance'], -10.0)
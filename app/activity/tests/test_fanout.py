@@ -0,0 +1,120 @@
+"""
+Test for the activity WebSocket fan-out.
+"""
+import json
+import time
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from activity.models import Activity, ActivityType
+from activity.tasks import deliver_activity_fanout
+from group.models import Group, GroupParticipant
+from transaction.serializers import AddTransactionSerializer
+from transaction.utils import TransactionHelper
+from core.tests.utils import create_user, IN_MEMORY_CHANNEL_LAYERS
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class TransactionFanoutTests(TestCase):
+    """Test the payloads pushed for transaction activities."""
+
+    def create_group_transaction(self, member_count):
+        """Create a group expense split between `member_count` friends."""
+        payer = create_user(f'payer{member_count}@example.com')
+        members = [create_user(f'member{member_count}_{i}@example.com') for i in range(member_count - 1)]
+        payer.friends.add(*members)
+
+        group = Group.objects.create(group_name='Trip', created_by=payer, group_type='trip')
+        GroupParticipant.objects.bulk_create([
+            GroupParticipant(group=group, user=user, role='user') for user in [payer, *members]
+        ])
+
+        serializer = AddTransactionSerializer(data={
+            'payer_id': payer.id,
+            'group': group.id,
+            'total_amount': 10 * member_count,
+            'transaction_type': 'debt',
+            'transaction_date': timezone.now().isoformat(),
+            'is_group': True,
+            'split_details': [{'user': user.id, 'amount': 10} for user in [payer, *members]],
+        }, context={'user': payer})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save(), [payer, *members]
+
+    def count_fanout_queries(self, transaction, users):
+        activity = Activity.objects.create(
+            user_id=users[0],
+            activity_type=ActivityType.MODIFIED_TRANSACTION,
+            transaction_id=transaction,
+        )
+        with CaptureQueriesContext(connection) as context:
+            activity.related_users_ids.add(*[user.id for user in users])
+        return len(context.captured_queries)
+
+    def test_fanout_queries_do_not_grow_with_recipients(self):
+        """Benchmark: fanning out a 50-member group expense costs as many queries as a 5-member one."""
+        small_transaction, small_users = self.create_group_transaction(5)
+        large_transaction, large_users = self.create_group_transaction(50)
+
+        self.assertEqual(
+            self.count_fanout_queries(small_transaction, small_users),
+            self.count_fanout_queries(large_transaction, large_users),
+        )
+
+    def test_batched_payload_matches_single_user_payload(self):
+        """Test every recipient gets the same payload as a single-user build."""
+        transaction, users = self.create_group_transaction(5)
+        user_ids = [user.id for user in users]
+
+        payloads = TransactionHelper.get_transaction_ws_data_for_users(transaction, user_ids)
+
+        for user_id in user_ids:
+            self.assertEqual(payloads[user_id], TransactionHelper.get_transaction_ws_data(transaction, user_id))
+        self.assertEqual(len(payloads[users[0].id]['ledger_balance']), 4)
+        self.assertEqual(len(payloads[users[1].id]['ledger_balance']), 1)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, ACTIVITY_FANOUT_MODE='celery')
+class CeleryFanoutTests(TestCase):
+    """Test the asynchronous fan-out mode."""
+
+    def setUp(self):
+        self.user = create_user('user@example.com')
+        self.friend = create_user('friend@example.com')
+
+    def test_fanout_enqueued_after_commit(self):
+        """Test the write path only enqueues the task, and only on commit."""
+        with patch('activity.tasks.deliver_activity_fanout.delay') as delay:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.user.friends.add(self.friend)
+            delay.assert_not_called()
+
+            for callback in callbacks:
+                callback()
+
+        delay.assert_called_once()
+        activity_id, exclude_user, enqueued_at = delay.call_args.args
+        self.assertEqual(Activity.objects.get(id=activity_id).activity_type, ActivityType.ADDED_YOU_AS_FRIEND)
+        self.assertIsNone(exclude_user)
+        self.assertLessEqual(enqueued_at, time.time())
+
+    def test_task_delivers_pushes_and_measures_lag(self):
+        """Test the worker task pushes to recipients and reports its lag."""
+        channel_layer = get_channel_layer()
+        channel_name = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f"user_{self.friend.id}", channel_name)
+
+        with patch('activity.tasks.deliver_activity_fanout.delay'):
+            self.user.friends.add(self.friend)
+        activity = Activity.objects.get(activity_type=ActivityType.ADDED_YOU_AS_FRIEND)
+
+        result = deliver_activity_fanout(activity.id, None, time.time())
+
+        self.assertEqual(result['sent'], 1)
+        self.assertGreaterEqual(result['delivery_lag_ms'], result['queue_lag_ms'])
+        message = json.loads(async_to_sync(channel_layer.receive)(channel_name)['text'])['message']
+        self.assertEqual(message['data']['activity']['id'], str(activity.id))
@@ -0,0 +1,63 @@
+"""
+Test for the per-user activity inbox.
+"""
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from activity.models import Activity, ActivityInbox, ActivityType
+from core.tests.utils import create_user, IN_MEMORY_CHANNEL_LAYERS
+
+
+def inbox_rows():
+    return set(ActivityInbox.objects.values_list('user_id', 'activity_id'))
+
+
+def related_rows():
+    return set(Activity.related_users_ids.through.objects.values_list('user_id', 'activity_id'))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ActivityInboxTests(TestCase):
+    """Test the activity inbox stays in step with related users."""
+
+    def setUp(self):
+        self.user = create_user('user@example.com')
+        self.friends = [create_user(f'friend{i}@example.com') for i in range(3)]
+
+    def test_inbox_follows_related_users(self):
+        """Test adding, removing and clearing related users updates the inbox."""
+        activity = Activity.objects.create(user_id=self.user, activity_type=ActivityType.ADDED_YOU_AS_FRIEND, comments={'message': 'Hi'})
+        activity.related_users_ids.add(self.user, *self.friends)
+        self.assertEqual(inbox_rows(), related_rows())
+        self.assertEqual(len(inbox_rows()), 4)
+
+        activity.related_users_ids.remove(self.friends[0])
+        self.assertEqual(inbox_rows(), related_rows())
+
+        self.friends[1].related_activities.remove(activity)
+        self.assertEqual(inbox_rows(), related_rows())
+
+        activity.related_users_ids.clear()
+        self.assertEqual(inbox_rows(), set())
+
+    def test_friend_activity_recorded_in_inbox(self):
+        """Test activities recorded by the app land in the inbox."""
+        self.user.friends.add(self.friends[0])
+
+        activity = Activity.objects.get(activity_type=ActivityType.ADDED_YOU_AS_FRIEND)
+        self.assertEqual(ActivityInbox.get_activity_ids(self.friends[0].id, 0, 10), [activity.id])
+        self.assertEqual(inbox_rows(), related_rows())
+
+    def test_backfill_command(self):
+        """Test the backfill builds the inbox from existing related users, and can be rerun."""
+        self.user.friends.add(*self.friends)
+        self.user.friends.remove(self.friends[0])
+        expected = related_rows()
+        ActivityInbox.objects.filter(user_id__in=[self.user.id, self.friends[1].id]).delete()
+
+        out = StringIO()
+        call_command('backfill_activity_inbox', '--batch-size', '1', stdout=out)
+        call_command('backfill_activity_inbox', stdout=out)
+
+        self.assertEqual(inbox_rows(), expected)
+        self.assertIn('Activity inbox backfilled', out.getvalue())
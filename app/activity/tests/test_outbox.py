@@ -0,0 +1,142 @@
+"""
+Test for the activity outbox and its relay.
+"""
+import json
+from io import StringIO
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from activity.models import Activity, ActivityOutbox, ActivityType
+from activity.outbox import relay_outbox_batch
+from core.replay import InMemoryReplayBuffer
+from core.tests.utils import create_user, IN_MEMORY_CHANNEL_LAYERS
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, ACTIVITY_FANOUT_MODE='outbox')
+class ActivityOutboxTests(TestCase):
+    """Test the outbox fan-out mode."""
+
+    def setUp(self):
+        self.user = create_user('user@example.com')
+        self.friends = [create_user(f'friend{i}@example.com') for i in range(3)]
+        self.channel_layer = get_channel_layer()
+
+    def listen(self, user):
+        """Subscribe a new channel to the pushes of a user."""
+        channel_name = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)(f"user_{user.id}", channel_name)
+        return channel_name
+
+    def test_activity_written_to_outbox_without_push(self):
+        """Test the write path records one entry per recipient and pushes nothing."""
+        with patch('activity.outbox.send_user_frame') as send, patch('activity.fanout.send_user_frame') as fanout_send:
+            self.user.friends.add(*self.friends)
+
+        send.assert_not_called()
+        fanout_send.assert_not_called()
+        entries = ActivityOutbox.objects.all()
+        self.assertEqual(len(entries), 3)
+        self.assertEqual({entry.user_id for entry in entries}, {friend.id for friend in self.friends})
+
+    def test_rolled_back_write_leaves_no_entries(self):
+        """Test a rolled back write never reaches the outbox."""
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.user.friends.add(self.friends[0])
+                raise RuntimeError
+
+        self.assertFalse(ActivityOutbox.objects.exists())
+        self.assertFalse(Activity.objects.exists())
+
+    def test_relay_publishes_and_deletes_entries(self):
+        """Test the relay pushes every entry in order and empties the outbox."""
+        channel_name = self.listen(self.friends[0])
+        self.user.friends.add(self.friends[0])
+        self.user.friends.remove(self.friends[0])
+
+        result = relay_outbox_batch(channel_layer=self.channel_layer)
+
+        self.assertEqual((result.claimed, result.sent, result.failed), (2, 2, 0))
+        self.assertFalse(ActivityOutbox.objects.exists())
+        first = json.loads(async_to_sync(self.channel_layer.receive)(channel_name)['text'])['message']
+        second = json.loads(async_to_sync(self.channel_layer.receive)(channel_name)['text'])['message']
+        self.assertEqual(first['data']['activity']['activity_type'], ActivityType.ADDED_YOU_AS_FRIEND)
+        self.assertEqual(second['data']['activity']['activity_type'], ActivityType.REMOVED_YOU_AS_FRIEND)
+
+    def test_failed_entry_holds_back_later_entries_of_user(self):
+        """Test a failed push is retried with backoff and blocks the user's later pushes."""
+        self.user.friends.add(self.friends[0])
+        self.user.friends.remove(self.friends[0])
+        first_id, second_id = ActivityOutbox.objects.values_list('id', flat=True)
+
+        with patch('activity.outbox.send_user_frame', side_effect=ConnectionError('redis down')):
+            result = relay_outbox_batch(channel_layer=self.channel_layer)
+
+        self.assertEqual((result.sent, result.failed), (0, 1))
+        failed = ActivityOutbox.objects.get(id=first_id)
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('redis down', failed.last_error)
+        self.assertGreater(failed.available_at, timezone.now())
+        self.assertEqual(ActivityOutbox.objects.get(id=second_id).attempts, 0)
+
+        result = relay_outbox_batch(channel_layer=self.channel_layer)
+        self.assertEqual(result.claimed, 0)
+
+        ActivityOutbox.objects.filter(id=first_id).update(available_at=timezone.now())
+        result = relay_outbox_batch(channel_layer=self.channel_layer)
+        self.assertEqual(result.sent, 2)
+
+    def test_retried_entry_replayed_once(self):
+        """Test an entry retried after its push reached the replay buffer is not replayed twice."""
+        self.user.friends.add(self.friends[0])
+        entry = ActivityOutbox.objects.get()
+        buffer = InMemoryReplayBuffer()
+
+        with patch('core.replay._replay_buffer.instance', buffer):
+            with patch.object(self.channel_layer, 'group_send', side_effect=ConnectionError('redis down')):
+                result = relay_outbox_batch(channel_layer=self.channel_layer)
+            self.assertEqual(result.failed, 1)
+            ActivityOutbox.objects.filter(id=entry.id).update(available_at=timezone.now())
+            result = relay_outbox_batch(channel_layer=self.channel_layer)
+
+        self.assertEqual(result.sent, 1)
+        replayed = buffer.read_since(self.friends[0].id, 0)
+        self.assertEqual(len(replayed.frames), 1)
+        self.assertEqual(replayed.last_seq, 1)
+
+    @override_settings(ACTIVITY_OUTBOX_MAX_ATTEMPTS=1)
+    def test_entry_dropped_after_max_attempts(self):
+        """Test an entry that keeps failing is eventually dropped."""
+        self.user.friends.add(self.friends[0])
+
+        with patch('activity.outbox.send_user_frame', side_effect=ConnectionError):
+            result = relay_outbox_batch(channel_layer=self.channel_layer)
+
+        self.assertEqual(result.dropped, 1)
+        self.assertFalse(ActivityOutbox.objects.exists())
+
+    def test_relay_partition(self):
+        """Test a partitioned relay only publishes its own users."""
+        self.user.friends.add(*self.friends)
+        index = self.friends[0].id % 2
+
+        result = relay_outbox_batch(partition=(index, 2), channel_layer=self.channel_layer)
+
+        remaining = ActivityOutbox.objects.values_list('user_id', flat=True)
+        self.assertEqual(result.sent, sum(1 for friend in self.friends if friend.id % 2 == index))
+        self.assertTrue(all(user_id % 2 != index for user_id in remaining))
+
+    def test_relay_command_once(self):
+        """Test the relay command drains the outbox and reports throughput."""
+        self.user.friends.add(*self.friends)
+        out = StringIO()
+
+        with patch('activity.outbox.get_channel_layer', return_value=self.channel_layer):
+            call_command('relay_outbox', '--once', stdout=out)
+
+        self.assertFalse(ActivityOutbox.objects.exists())
+        self.assertIn('Relayed 3 pushes', out.getvalue())
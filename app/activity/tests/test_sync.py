@@ -0,0 +1,167 @@
+"""
+Test for the activity sync API.
+"""
+import random
+import threading
+from unittest.mock import patch
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from activity.models import Activity, ActivityType
+from core.tests.utils import create_user, IN_MEMORY_CHANNEL_LAYERS
+
+SYNC_URL = reverse('activity:sync_activity')
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ActivitySyncApiTests(TestCase):
+    """Test the activity sync API."""
+
+    def setUp(self):
+        cache.clear()
+        # The test process stands for every process, so its cache counts as shared
+        patcher = patch('activity.models.cache_is_shared', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = create_user('user@example.com')
+        self.friends = [create_user(f'friend{i}@example.com') for i in range(5)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_activities(self, count):
+        """Create activities related to the user, committing them so the latest id is recorded."""
+        activities = []
+        for index in range(count):
+            with self.captureOnCommitCallbacks(execute=True):
+                activity = Activity.objects.create(user_id=self.friends[index % 5], activity_type=ActivityType.ADDED_YOU_AS_FRIEND, comments={'message': 'Hi'})
+                activity.related_users_ids.add(self.user, self.friends[index % 5])
+            activities.append(activity)
+        return activities
+
+    def test_sync_pages_with_keyset(self):
+        """Test pages follow since_id and report has_more without counting."""
+        activities = self.add_activities(5)
+
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(SYNC_URL, {'since_id': 0, 'limit': 3})
+        body = res.json()
+        self.assertEqual([int(item['id']) for item in body['activities']], [a.id for a in activities[:3]])
+        self.assertTrue(body['has_more'])
+        self.assertFalse(any('COUNT(' in query['sql'] for query in context.captured_queries))
+
+        body = self.client.get(SYNC_URL, {'since_id': body['next_since_id'], 'limit': 3}).json()
+        self.assertEqual([int(item['id']) for item in body['activities']], [a.id for a in activities[3:]])
+        self.assertFalse(body['has_more'])
+        self.assertEqual(body['next_since_id'], activities[-1].id)
+
+    def test_sync_payload(self):
+        """Test the synced activity data matches get_activity_data."""
+        activity = self.add_activities(1)[0]
+
+        res = self.client.get(SYNC_URL)
+
+        self.assertEqual(res.json()['activities'], [Activity.objects.get(id=activity.id).get_activity_data()])
+        self.assertEqual(set(res.json()['activities'][0]['related_users_ids']), {str(self.user.id), str(self.friends[0].id)})
+
+    def test_sync_queries_do_not_grow_with_page_size(self):
+        """Benchmark: a page of 20 activities runs as many queries as a page of 2."""
+        self.add_activities(20)
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(SYNC_URL, {'limit': 2})
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(SYNC_URL, {'limit': 20})
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_up_to_date_poll_skips_database(self):
+        """Test a poll with nothing new is answered from the cache."""
+        activities = self.add_activities(2)
+        self.client.get(SYNC_URL)
+
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.get(SYNC_URL, {'since_id': activities[-1].id})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json(), {'activities': [], 'has_more': False, 'next_since_id': activities[-1].id})
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_etag_not_modified(self):
+        """Test If-None-Match returns 304 until a new activity arrives."""
+        self.add_activities(1)
+        res = self.client.get(SYNC_URL)
+        etag = res['ETag']
+        since_id = res.json()['next_since_id']
+
+        res = self.client.get(SYNC_URL, {'since_id': since_id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        new_activity = self.add_activities(1)[0]
+        res = self.client.get(SYNC_URL, {'since_id': since_id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn(str(new_activity.id), [item['id'] for item in res.json()['activities']])
+
+    def test_etag_not_modified_while_paging(self):
+        """Test pages with more to come carry no ETag, and a known ETag does not end paging early."""
+        activities = self.add_activities(3)
+
+        res = self.client.get(SYNC_URL, {'since_id': 0, 'limit': 2})
+        self.assertTrue(res.json()['has_more'])
+        self.assertNotIn('ETag', res)
+
+        etag = f'W/"{activities[-1].id}"'
+        res = self.client.get(SYNC_URL, {'since_id': res.json()['next_since_id'], 'limit': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([int(item['id']) for item in res.json()['activities']], [activities[-1].id])
+        self.assertEqual(res['ETag'], etag)
+
+        res = self.client.get(SYNC_URL, {'since_id': activities[-1].id, 'limit': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_process_cache_not_trusted(self):
+        """Test a latest id kept by this process alone is not used to answer that nothing changed."""
+        activities = self.add_activities(3)
+        cache.set(Activity.latest_activity_cache_key(self.user.id), activities[0].id)
+
+        with patch('activity.models.cache_is_shared', return_value=False):
+            res = self.client.get(SYNC_URL, {'since_id': activities[0].id}, HTTP_IF_NONE_MATCH=f'W/"{activities[0].id}"')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([int(item['id']) for item in res.json()['activities']], [a.id for a in activities[1:]])
+
+    def test_latest_id_computed_on_cache_miss(self):
+        """Test the latest id is read from the database when the cache is empty."""
+        activities = self.add_activities(3)
+        cache.clear()
+
+        self.assertEqual(Activity.get_latest_activity_id(self.user.id), activities[-1].id)
+        self.assertEqual(Activity.get_latest_activity_id(create_user('new@example.com').id), 0)
+
+    def test_latest_id_never_moves_back(self):
+        """Test an older activity committing late does not hide a newer one."""
+        Activity.set_latest_activity_id([self.user.id], 10)
+        Activity.set_latest_activity_id([self.user.id], 7)
+
+        self.assertEqual(Activity.get_latest_activity_id(self.user.id), 10)
+
+    def test_latest_id_concurrent_commits(self):
+        """Test activities committing concurrently leave the largest id, whatever order they finish in."""
+        threads = [
+            threading.Thread(target=Activity.set_latest_activity_id, args=([self.user.id], activity_id))
+            for activity_id in random.sample(range(1, 51), 50)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(Activity.get_latest_activity_id(self.user.id), 50)
+
+    def test_invalid_limit(self):
+        """Test a non-positive limit is rejected."""
+        res = self.client.get(SYNC_URL, {'limit': 0})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
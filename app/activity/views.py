@@ -2,16 +2,19 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
-from django.core.paginator import Paginator
-from django.db.models import Q
+from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
+from django.http import HttpResponseNotModified
+from user.authentication import StatelessJWTAuthentication
 from user.renderers import UserRenderer
-from activity.models import Activity
+from activity.models import Activity, ActivityInbox
 
 
 class ActivitySynciew(APIView):
     """Sync Activity for splitemate"""
 
     renderer_classes = [UserRenderer]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, requests):
@@ -22,6 +25,8 @@ class ActivitySynciew(APIView):
         try:
             since_id = int(since_id_str)
             limit = int(limit_str)
+            if limit < 1:
+                raise ValueError
         except Exception:
             return Response(
                 {"message": "Please provide since_id and limit as valid parameter"},
@@ -29,23 +34,33 @@ class ActivitySynciew(APIView):
             )
 
         user = requests.user
-        queryset = Activity.objects.filter(
-            Q(related_users_ids=user),
-            id__gt=since_id,
-        ).order_by('id')
+        latest_id = Activity.get_latest_activity_id(user.id)
+        etag = f'W/"{latest_id}"'
+
+        # Nothing new since the client's last poll, answer without touching the activity tables
+        if latest_id <= since_id:
+            if etag in [tag.strip() for tag in requests.headers.get('If-None-Match', '').split(',')]:
+                return HttpResponseNotModified(headers={'ETag': etag})
+            return Response({
+                "activities": [],
+                "has_more": False,
+                "next_since_id": since_id
+            }, status=status.HTTP_200_OK, headers={'ETag': etag})
 
-        paginator = Paginator(queryset, limit)
-        page_object = paginator.get_page(1)
+        activity_ids = ActivityInbox.get_activity_ids(user.id, since_id, limit + 1)
 
-        entries = list(page_object.object_list)
+        has_more = len(activity_ids) > limit
+        activity_ids = activity_ids[:limit]
+
+        entries = Activity.objects.filter(id__in=activity_ids).prefetch_related(
+            Prefetch('related_users_ids', queryset=get_user_model().objects.only('id'))
+        ).order_by('id')
 
         activities_data = []
         for act in entries:
             activities_data.append(act.get_activity_data())
 
-        has_more = page_object.has_next()
-
-        max_id_in_result = entries[-1].id if entries else since_id
+        max_id_in_result = activity_ids[-1] if activity_ids else since_id
 
         response_data = {
             "activities": activities_data,
@@ -53,4 +68,6 @@ class ActivitySynciew(APIView):
             "next_since_id": max_id_in_result
         }
 
-        return Response(response_data, status=status.HTTP_200_OK)
+        # A page with more to come is not the state of the latest activity, so it gets no ETag to revalidate with
+        headers = {} if has_more else {'ETag': etag}
+        return Response(response_data, status=status.HTTP_200_OK, headers=headers)
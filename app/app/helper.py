@@ -1,6 +1,7 @@
 from rest_framework_simplejwt.tokens import RefreshToken
 from app.response_codes import RESPONSE_CODES
 from rest_framework.exceptions import ValidationError
+from user.authentication import get_user_claims
 
 
 class Helper:
@@ -10,10 +11,14 @@ class Helper:
         """Generate Tokens manually"""
 
         refresh = RefreshToken.for_user(user)
+        access = refresh.access_token
+        # Only on the access token, so read-only views trust claims at most ACCESS_TOKEN_LIFETIME old
+        for claim, value in get_user_claims(user).items():
+            access[claim] = value
 
         return {
             "refresh": str(refresh),
-            "access": str(refresh.access_token),
+            "access": str(access),
         }
 
     @staticmethod
@@ -4,6 +4,18 @@ RESPONSE_CODES = {
         "code": "E0000",
         "message": "Something went wrong."
     },
+    "ERR_SERVER_BUSY": {
+        "code": "E0001",
+        "message": "Server is busy, please retry."
+    },
+    "ERR_INVALID_SEQUENCE": {
+        "code": "E0002",
+        "message": "Sequence number must be a non-negative integer."
+    },
+    "ERR_RESUME_IN_PROGRESS": {
+        "code": "E0003",
+        "message": "A resume is already in progress on this connection."
+    },
 
     "ERR_NOT_OWNER": {
         "code": "E1001",
@@ -49,10 +61,30 @@ RESPONSE_CODES = {
         "code": "E1011",
         "message": "Payer must be in the split"
     },
-    "ERR_NOT_ALL_GROUP_MEMBERS_INCLUDED ": {
+    "ERR_NOT_ALL_GROUP_MEMBERS_INCLUDED": {
         "code": "E1012",
         "message": "All group participant must be in the split"
     },
+    "ERR_INVALID_CURSOR": {
+        "code": "E1013",
+        "message": "Invalid pagination cursor"
+    },
+    "ERR_INVALID_DATE_RANGE": {
+        "code": "E1014",
+        "message": "Start date must be before end date"
+    },
+    "ERR_GROUP_NOT_FOUND": {
+        "code": "E1015",
+        "message": "Group not found."
+    },
+    "ERR_INVALID_IDEMPOTENCY_KEY": {
+        "code": "E1016",
+        "message": "Idempotency key must be between 1 and 255 characters."
+    },
+    "ERR_IDEMPOTENCY_KEY_REUSED": {
+        "code": "E1017",
+        "message": "Idempotency key was already used for a different request."
+    },
 
     "SUCCESS_TRANSACTION_CREATED": {
         "code": "S2000",
@@ -62,5 +94,10 @@ RESPONSE_CODES = {
     "SUCCESS_TRANSACTION_MODIFIED": {
         "code": "S2001",
         "message": "Transaction modified successfully."
+    },
+
+    "SUCCESS_TRANSACTIONS_CREATED": {
+        "code": "S2002",
+        "message": "Transactions created successfully."
     }
 }
@@ -83,6 +83,56 @@ DATABASES = {
     }
 }
 
+# Cache
+# Local memory per process unless REDIS_CACHE_URL points at a Redis shared by all processes
+REDIS_CACHE_URL = os.environ.get('REDIS_CACHE_URL')
+if REDIS_CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_CACHE_URL,
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    }
+
+# Pushes to a user are numbered and kept in a capped per-user buffer for sockets that resume, see core.replay
+REDIS_REPLAY_URL = os.environ.get('REDIS_REPLAY_URL')
+WEBSOCKET_REPLAY_BUFFER = {
+    "BACKEND": "core.replay.RedisReplayBuffer" if REDIS_REPLAY_URL else "core.replay.InMemoryReplayBuffer",
+    "CONFIG": {
+        "url": REDIS_REPLAY_URL,
+        "max_len": 500,  # Pushes kept per user
+        "ttl": 24 * 60 * 60,  # Seconds a user's buffer is kept after its last push
+    },
+}
+
+# Open sockets per user, kept alive by a heartbeat so the sockets of a dead process expire, see core.presence
+REDIS_PRESENCE_URL = os.environ.get('REDIS_PRESENCE_URL')
+WEBSOCKET_PRESENCE = {
+    "BACKEND": "core.presence.RedisPresenceRegistry" if REDIS_PRESENCE_URL else "core.presence.InMemoryPresenceRegistry",
+    "CONFIG": {
+        "url": REDIS_PRESENCE_URL,
+        "ttl": 90,  # Seconds a socket counts as open after its last heartbeat
+    },
+}
+WEBSOCKET_PRESENCE_HEARTBEAT = 30  # Seconds between heartbeats of a socket
+
+# Users resolved by socket handshakes are cached per process, see middleware.jwt_auth_middleware
+WEBSOCKET_USER_CACHE_SIZE = 10000
+WEBSOCKET_USER_CACHE_TTL = 60  # Seconds, a user saved in another process may be served stale for this long
+
+# WebSocket consumers run their database work on a bounded pool, see core.workers
+CONSUMER_WORKER_THREADS = int(os.environ.get('CONSUMER_WORKER_THREADS', 8))
+CONSUMER_WORKER_QUEUE_SIZE = int(os.environ.get('CONSUMER_WORKER_QUEUE_SIZE', 200))  # Calls waiting for a thread
+CONSUMER_MAX_IN_FLIGHT = 4  # Calls queued or running per connection
+
+# core.layers.LocalShortCircuitChannelLayer can wrap this layer to deliver
+# pushes to sockets of the same process without Redis
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -139,6 +189,8 @@ REST_FRAMEWORK = {
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
 }
+# Bytes from which API responses are gzipped for clients that accept it, 0 never compresses, see user.renderers
+API_GZIP_MIN_SIZE = int(os.environ.get('API_GZIP_MIN_SIZE', 0))
 
 # CORS_ALLOWED_ORIGINS = [
 #     "http://localhost:8000",
@@ -161,6 +213,15 @@ EMAIL_USE_SSL = False
 OTP_LIFESPAN = 100  # OTP lifespan in minutes
 OTP_HOURLY_LIMIT = 10  # Max OTP requests allowed per hour
 
+# OTP request limits and codes, shared by all processes when REDIS_OTP_URL is set, see otp.store
+REDIS_OTP_URL = os.environ.get('REDIS_OTP_URL')
+OTP_STORE = {
+    "BACKEND": "otp.store.RedisOTPStore" if REDIS_OTP_URL else "otp.store.InMemoryOTPStore",
+    "CONFIG": {
+        "url": REDIS_OTP_URL,
+    },
+}
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=10),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
@@ -207,4 +268,27 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
-CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
\ No newline at end of file
+CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
+
+# Activity fan-out
+# "sync" pushes activities from the request, "celery" hands them to a worker once the write commits,
+# "outbox" writes them to ActivityOutbox in the same transaction for `manage.py relay_outbox` to publish
+ACTIVITY_FANOUT_MODE = os.environ.get('ACTIVITY_FANOUT_MODE', 'sync')
+ACTIVITY_FANOUT_BATCH_SIZE = 50  # Recipients whose payloads are built together by the worker
+ACTIVITY_LATEST_ID_CACHE_TIMEOUT = 300  # Seconds a user's latest activity id is trusted by the sync endpoint
+ACTIVITY_OUTBOX_BATCH_SIZE = 100  # Entries published per relay transaction
+ACTIVITY_OUTBOX_MAX_ATTEMPTS = 10
+ACTIVITY_OUTBOX_RETRY_DELAY = 1  # Seconds, doubled on every failed attempt
+ACTIVITY_OUTBOX_MAX_RETRY_DELAY = 300
+# Skip building pushes for users without an open socket, they catch up through the activity sync.
+# The in-memory presence registry only knows the sockets of its own process, so this is off unless it is in Redis
+ACTIVITY_PUSH_SKIP_OFFLINE = os.environ.get('ACTIVITY_PUSH_SKIP_OFFLINE', 'true' if REDIS_PRESENCE_URL else 'false') == 'true'
+# Seconds the transaction pushes of a process are held and merged per user, 0 sends each right away
+ACTIVITY_PUSH_COALESCE_WINDOW = float(os.environ.get('ACTIVITY_PUSH_COALESCE_WINDOW', 0))
+
+# Transactions
+TRANSACTION_BULK_MAX_SIZE = 100  # Transactions accepted by one add_transactions call
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60  # Seconds a write's response is replayed to retries with the same key
+# "snapshot" transaction pushes carry the ledger and split details with profiles, "delta" only the
+# balances the transaction changed, applied to the ledger clients get with the get_snapshot action
+TRANSACTION_PUSH_FORMAT = os.environ.get('TRANSACTION_PUSH_FORMAT', 'snapshot')
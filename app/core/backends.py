@@ -0,0 +1,41 @@
+"""
+Objects shared by all threads of a process, and the backends settings choose for them
+"""
+import threading
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def load_backend(setting_name):
+    """
+    Build the backend a setting chooses.
+
+    Args:
+        setting_name (str): Name of a setting holding the dotted path of the
+            backend class in `BACKEND` and its keyword arguments in `CONFIG`.
+
+    Returns:
+        object: A new instance of the backend.
+    """
+    config = getattr(settings, setting_name)
+    return import_string(config['BACKEND'])(**config.get('CONFIG', {}))
+
+
+class ProcessInstance:
+    """
+    An object built on first use, then shared by every thread of the process.
+
+    Tests replace the shared object by patching `instance`, and patch it with
+    None to have it built again from their settings.
+    """
+
+    def __init__(self, build):
+        self.build = build
+        self.lock = threading.Lock()
+        self.instance = None
+
+    def get(self):
+        with self.lock:
+            if self.instance is None:
+                self.instance = self.build()
+            return self.instance
@@ -0,0 +1,97 @@
+"""
+Items held for a short window and handled together
+"""
+import atexit
+import logging
+import threading
+import weakref
+from celery.signals import worker_process_shutdown
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Batchers of this process, flushed when it stops
+_batchers = weakref.WeakSet()
+
+
+class WindowBatcher:
+    """
+    Holds items for `window` seconds from the first one, then handles them together.
+
+    The window is not extended by later items, so a steady stream still flushes
+    every `window` seconds. Subclasses implement `handle`. Items still held when
+    the process stops are flushed by `flush_all_batchers`.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.lock = threading.Lock()
+        self.pending = []
+        self.timer = None
+        self.held = 0
+        self.sent = 0
+        _batchers.add(self)
+
+    def handle(self, items) -> int:
+        """Handle the items of one window, returning how many results were sent."""
+        raise NotImplementedError
+
+    def add(self, item) -> None:
+        """Hold an item until the window ends."""
+        with self.lock:
+            self.pending.append(item)
+            self.held += 1
+            if self.timer is None:
+                self.timer = threading.Timer(self.window, self.flush_in_background)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self) -> int:
+        """
+        Handle the held items now.
+
+        Returns:
+            int: What `handle` returned, 0 when nothing was held.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if not pending:
+            return 0
+
+        sent = self.handle(pending)
+        with self.lock:
+            self.sent += sent
+        return sent
+
+    def flush_in_background(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Failed to flush %s", type(self).__name__)
+        finally:
+            # The timer thread opened its own database connections
+            connections.close_all()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "held": self.held,
+                "sent": self.sent,
+                "pending": len(self.pending),
+            }
+
+
+@worker_process_shutdown.connect
+def flush_all_batchers(**kwargs) -> None:
+    """Flush the items every batcher of this process still holds, when the process stops."""
+    for batcher in list(_batchers):
+        try:
+            batcher.flush()
+        except Exception:
+            logger.exception("Failed to flush %s on shutdown", type(batcher).__name__)
+
+
+atexit.register(flush_all_batchers)
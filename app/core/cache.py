@@ -0,0 +1,60 @@
+"""
+Atomic updates of counters kept in the default cache
+"""
+import threading
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+# Raises each key to ARGV[1] unless it already holds a larger integer
+SET_MAX_SCRIPT = """
+    local value = tonumber(ARGV[1])
+    for _, key in ipairs(KEYS) do
+        local current = tonumber(redis.call('GET', key))
+        if current == nil or current < value then
+            if ARGV[2] == '' then
+                redis.call('SET', key, ARGV[1])
+            else
+                redis.call('SET', key, ARGV[1], 'EX', ARGV[2])
+            end
+        end
+    end
+"""
+
+_set_max_lock = threading.Lock()
+
+
+def cache_is_shared() -> bool:
+    """Whether the default cache is seen by every process, rather than kept by this one."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def cache_set_max(keys, value, timeout) -> None:
+    """
+    Raise integers kept in the cache to `value`, leaving those already larger.
+
+    Comparing and writing is one script on a Redis cache, so concurrent callers
+    cannot write a smaller value over a larger one. Any other cache is local to
+    the process, where a lock serializes the read and the write.
+
+    Args:
+        keys (list[str]): Cache keys of the integers.
+        value (int): The value to raise them to.
+        timeout (int): Seconds the raised keys are kept.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    cache = caches['default']
+    if isinstance(cache, RedisCache):
+        backend_timeout = cache.get_backend_timeout(timeout)
+        client = cache._cache.get_client(write=True)
+        client.eval(
+            SET_MAX_SCRIPT, len(keys), *[cache.make_and_validate_key(key) for key in keys],
+            int(value), '' if backend_timeout is None else max(int(backend_timeout), 1)
+        )
+        return
+    with _set_max_lock:
+        current = cache.get_many(keys)
+        cache.set_many({key: value for key in keys if current.get(key, 0) < value}, timeout)
@@ -1,13 +1,25 @@
 """
 Consumer for transaction
 """
+import asyncio
 import json
+import logging
+from contextlib import asynccontextmanager
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from rest_framework.exceptions import ValidationError
 from channels.generic.websocket import AsyncWebsocketConsumer
-from asgiref.sync import sync_to_async
 from transaction.models import Transaction
-from transaction.serializers import AddTransactionSerializer, ModifyTransactionSerializer
+from transaction.serializers import AddTransactionSerializer, BulkAddTransactionSerializer, ModifyTransactionSerializer
 from app.helper import Helper
+from core.presence import get_presence_registry
+from core.replay import get_replay_buffer
+from core.workers import ConsumerPoolBusy, get_consumer_pool
+from middleware.jwt_auth_middleware import TOKEN_SUBPROTOCOL
+from transaction.idempotency import is_valid_key, run_idempotent
+from transaction.utils import TransactionHelper
+
+logger = logging.getLogger(__name__)
 
 
 class NotFoundConsumer(AsyncWebsocketConsumer):
@@ -18,41 +30,200 @@ class NotFoundConsumer(AsyncWebsocketConsumer):
 
 class CoreConsumer(AsyncWebsocketConsumer):
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Commands run concurrently, only commands on the same transaction wait for each other
+        self.pending_commands = set()
+        self.transaction_locks = {}
+        # Pushes received while a resume replays missed ones, and the last sequence number replayed
+        self.held_events = None
+        self.replayed_through = 0
+        self.heartbeat_task = None
+
     async def connect(self):
         if self.scope["user"].is_authenticated:
             self.user_group_name = f"user_{self.scope["user"].id}"
             await self.channel_layer.group_add(self.user_group_name, self.channel_name)
-            await self.accept()
+            # Marked online before accepting, so pushes built from now on are not skipped
+            await self.touch_presence()
+            self.heartbeat_task = asyncio.ensure_future(self.heartbeat())
+            # A client sending its token as a subprotocol only completes the handshake if it is echoed
+            await self.accept(subprotocol=TOKEN_SUBPROTOCOL if TOKEN_SUBPROTOCOL in self.scope.get("subprotocols", []) else None)
         else:
             await self.close(code=1008)
 
     async def disconnect(self, close_code):
+        for task in self.pending_commands:
+            task.cancel()
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
         if self.scope["user"].is_authenticated:
             await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+            await sync_to_async(get_presence_registry().remove, thread_sensitive=False)(
+                self.scope["user"].id, self.channel_name
+            )
+
+    async def touch_presence(self):
+        await sync_to_async(get_presence_registry().touch, thread_sensitive=False)(
+            self.scope["user"].id, self.channel_name
+        )
+
+    async def heartbeat(self):
+        """Keep the socket marked online while it is open, see core.presence."""
+        while True:
+            await asyncio.sleep(settings.WEBSOCKET_PRESENCE_HEARTBEAT)
+            await self.touch_presence()
 
     async def transaction_message(self, event):
-        await self.send(text_data=json.dumps({"message": event}))
+        if self.held_events is not None:
+            self.held_events.append(event)
+            return
+        if event.get("seq", self.replayed_through + 1) <= self.replayed_through:
+            # Already sent by the replay of a resume
+            return
+
+        # Pushes arrive as frames encoded once by the producer, see core.push
+        if "text" in event:
+            await self.send(text_data=event["text"])
+        else:
+            await self.send(text_data=json.dumps({"message": event}))
 
     async def receive(self, text_data):
         data = json.loads(text_data)
 
-        if data['action'] == 'add_transaction':
-            response = await self.handle_add_transaction(data)
-            await self.send_response(response)
-        elif data['action'] == 'modify_transaction':
-            response = await self.handle_modify_transaction(data)
-            await self.send_response(response)
-        elif data['action'] == 'test':
-            await self.send_response({
-                "message": {
-                    "type": "test",
-                    "model": "transaction",
-                    "method": "update",
-                }
-            })
+        if len(self.pending_commands) >= settings.CONSUMER_MAX_IN_FLIGHT:
+            await self.send_response(Helper.format_error_response("ERR_SERVER_BUSY"), data.get('request_id'))
+            return
+
+        task = asyncio.ensure_future(self.handle_command(data))
+        self.pending_commands.add(task)
+        task.add_done_callback(self.pending_commands.discard)
+
+    async def handle_command(self, data):
+        """Run one command and reply with the request id it was sent with, an error reply when it fails."""
+        request_id = data.get('request_id')
+        action = data.get('action')
+
+        try:
+            if action == 'add_transaction':
+                response = await self.run_command(self.handle_add_transaction, data)
+                await self.send_response(response, request_id)
+            elif action == 'add_transactions':
+                response = await self.run_command(self.handle_add_transactions, data)
+                await self.send_response(response, request_id)
+            elif action == 'modify_transaction':
+                async with self.transaction_lock(data.get('transaction_data', {}).get('id')):
+                    response = await self.run_command(self.handle_modify_transaction, data)
+                await self.send_response(response, request_id)
+            elif action == 'get_snapshot':
+                response = await self.run_command(self.handle_get_snapshot, data)
+                await self.send_response(response, request_id)
+            elif action == 'resume':
+                await self.resume(data.get('last_seq'), request_id)
+            elif action == 'test':
+                await self.send_response({
+                    "message": {
+                        "type": "test",
+                        "model": "transaction",
+                        "method": "update",
+                    }
+                }, request_id)
+            else:
+                await self.send_response(
+                    Helper.format_error_response("ERR_SOMETHING_WENT_WRONG", {"error": f"Unknown action {action!r}"}),
+                    request_id
+                )
+        except Exception:
+            # Commands run as tasks nobody awaits, the client only learns of a failure from this reply
+            logger.exception("WebSocket command %r failed", action)
+            await self.send_response(Helper.format_error_response("ERR_SOMETHING_WENT_WRONG"), request_id)
+
+    async def resume(self, last_seq, request_id=None):
+        """
+        Send the pushes missed since `last_seq`, from the user's replay buffer.
+
+        Live pushes are held until the replay is sent, then the ones it
+        already covered are dropped. When missed pushes are no longer all in
+        the buffer, nothing is replayed and the client is told to resync.
+        A resume sent while another one is replaying is rejected.
+        """
+        if not isinstance(last_seq, int) or isinstance(last_seq, bool) or last_seq < 0:
+            await self.send_response(Helper.format_error_response("ERR_INVALID_SEQUENCE"), request_id)
+            return
+        if self.held_events is not None:
+            # A second resume would replace the pushes held for the first one
+            await self.send_response(Helper.format_error_response("ERR_RESUME_IN_PROGRESS"), request_id)
+            return
+
+        self.held_events = []
+        try:
+            try:
+                result = await get_consumer_pool().run(
+                    get_replay_buffer().read_since, self.scope["user"].id, last_seq, owner=self.channel_name
+                )
+            except ConsumerPoolBusy:
+                await self.send_response(Helper.format_error_response("ERR_SERVER_BUSY"), request_id)
+                return
+
+            if result.truncated:
+                await self.send_response({"message": {"type": "resync_required", "seq": result.last_seq}}, request_id)
+            else:
+                for frame in result.frames:
+                    await self.send(text_data=frame)
+                await self.send_response({
+                    "message": {"type": "resumed", "replayed": len(result.frames), "seq": result.last_seq}
+                }, request_id)
+            self.replayed_through = result.last_seq
+        finally:
+            held_events, self.held_events = self.held_events, None
+            for event in held_events:
+                await self.transaction_message(event)
+
+    @asynccontextmanager
+    async def transaction_lock(self, transaction_id):
+        """Keep commands on the same transaction in the order they were received."""
+        if transaction_id is None:
+            yield
+            return
+
+        key = str(transaction_id)
+        lock, holders = self.transaction_locks.get(key, (None, 0))
+        lock = lock or asyncio.Lock()
+        self.transaction_locks[key] = (lock, holders + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, holders = self.transaction_locks[key]
+            if holders == 1:
+                del self.transaction_locks[key]
+            else:
+                self.transaction_locks[key] = (lock, holders - 1)
+
+    async def run_command(self, handler, data):
+        """Run a command handler on the consumer worker pool, answering busy when it is full."""
+        try:
+            return await get_consumer_pool().run(handler, data, owner=self.channel_name)
+        except ConsumerPoolBusy:
+            return Helper.format_error_response("ERR_SERVER_BUSY")
+
+    def run_idempotent_command(self, command, data, payload):
+        """Run a write command once per `idempotency_key` of the user, replaying its first response to retries."""
+        key = data.get('idempotency_key')
+        if key is None:
+            return command(data)
+        if not is_valid_key(key):
+            return Helper.format_error_response("ERR_INVALID_IDEMPOTENCY_KEY")
+
+        def handler():
+            response = command(data)
+            return response, 200 if response.get('is_success') else 400
+        return run_idempotent(self.scope['user'].id, key, payload, handler).response
 
-    @sync_to_async
     def handle_add_transaction(self, data):
+        return self.run_idempotent_command(self.add_transaction, data, data.get('transaction_data', {}))
+
+    def add_transaction(self, data):
         try:
             serializer = AddTransactionSerializer(data=data.get('transaction_data', {}), context={'user': self.scope['user']})
             if serializer.is_valid():
@@ -70,7 +241,26 @@ class CoreConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             return Helper.format_error_response("ERR_SOMETHING_WENT_WRONG", {"error": str(e)})
 
-    @sync_to_async
+    def handle_add_transactions(self, data):
+        return self.run_idempotent_command(self.add_transactions, data, data.get('transactions', []))
+
+    def add_transactions(self, data):
+        try:
+            serializer = BulkAddTransactionSerializer(data={'transactions': data.get('transactions', [])}, context={'user': self.scope['user']})
+            if serializer.is_valid():
+                transactions = serializer.save()
+                return {
+                    **Helper.format_error_response("SUCCESS_TRANSACTIONS_CREATED"),
+                    "transaction_ids": [transaction.id for transaction in transactions]
+                }
+            errors = serializer.errors
+            response_key = errors.get('response_key')
+            if response_key:
+                return Helper.format_error_response(response_key[0], {"index": errors['index'][0]} if 'index' in errors else None)
+            return Helper.format_error_response("ERR_SOMETHING_WENT_WRONG", {"error": errors})
+        except Exception as e:
+            return Helper.format_error_response("ERR_SOMETHING_WENT_WRONG", {"error": str(e)})
+
     def handle_modify_transaction(self, data):
         try:
             transaction = Transaction.objects.get(pk=data.get('transaction_data', {}).get('id'))
@@ -91,5 +281,20 @@ class CoreConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             return Helper.format_error_response("ERR_SOMETHING_WENT_WRONG", {"error": str(e)})
 
-    async def send_response(self, response):
+    def handle_get_snapshot(self, data):
+        """Full ledger of the user, for clients that apply delta pushes, and the last push it covers."""
+        user_id = self.scope['user'].id
+        # Read before the ledger, so pushes numbered after it are never already in the snapshot's past
+        seq = get_replay_buffer().get_last_seq(user_id)
+        return {
+            "message": {
+                "type": "snapshot",
+                "seq": seq,
+                "data": TransactionHelper.get_ledger_snapshot(user_id)
+            }
+        }
+
+    async def send_response(self, response, request_id=None):
+        if request_id is not None:
+            response = {**response, "request_id": request_id}
         await self.send(text_data=json.dumps(response))
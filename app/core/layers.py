@@ -0,0 +1,173 @@
+"""
+Channel layer that delivers to sockets of the same process without a round trip
+"""
+import asyncio
+import time
+from copy import deepcopy
+from channels.layers import InMemoryChannelLayer
+from django.utils.module_loading import import_string
+
+
+class LocalShortCircuitChannelLayer:
+    """
+    Wraps another channel layer and short-circuits delivery to local channels.
+
+    Channels created through this layer belong to consumers of this process.
+    Their group memberships are kept in an in-process registry, so a group send
+    puts messages for those channels on a local queue and only the remaining,
+    remote members go through the inner layer. Groups without a local member
+    are handed to the inner layer's `group_send` unchanged.
+
+    A receive on a local channel waits on its local queue and on the inner
+    layer at once. The inner receive is kept running between calls rather than
+    cancelled, because a receiver blocked in the inner layer, such as the Redis
+    layer's BRPOP, never looks at anything else, and cancelling it can drop a
+    message it already popped.
+
+    Configure it with the inner layer as `CONFIG["inner"]`, in the same shape as
+    a `CHANNEL_LAYERS` entry.
+    """
+
+    extensions = ["groups", "flush"]
+
+    def __init__(self, inner=None):
+        if inner is None:
+            inner = InMemoryChannelLayer()
+        elif isinstance(inner, dict):
+            inner = import_string(inner["BACKEND"])(**inner.get("CONFIG", {}))
+        self.inner = inner
+        # Local channel -> its groups, and group -> its local channels
+        self.local_channels = {}
+        self.local_groups = {}
+        # Local channel -> its queue of local messages, its pending inner receive, and the loop receiving it
+        self.local_queues = {}
+        self.inner_receives = {}
+        self.receive_loops = {}
+        self.local_deliveries = 0
+        self.remote_deliveries = 0
+        self.remote_group_sends = 0
+
+    def __getattr__(self, name):
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    def get_stats(self) -> dict:
+        """Counters of messages delivered in-process and through the inner layer."""
+        return {
+            "local_channels": len(self.local_channels),
+            "local_deliveries": self.local_deliveries,
+            "remote_deliveries": self.remote_deliveries,
+            "remote_group_sends": self.remote_group_sends,
+        }
+
+    async def new_channel(self, prefix="specific."):
+        channel = await self.inner.new_channel(prefix)
+        self.local_channels[channel] = set()
+        return channel
+
+    async def send(self, channel, message):
+        if channel in self.local_channels:
+            await self.deliver_local(channel, message)
+        else:
+            self.remote_deliveries += 1
+            await self.inner.send(channel, message)
+
+    async def receive(self, channel):
+        if channel not in self.local_channels:
+            return await self.inner.receive(channel)
+
+        self.receive_loops[channel] = asyncio.get_running_loop()
+        queue = self.local_queues.setdefault(channel, asyncio.Queue())
+        if not queue.empty():
+            return queue.get_nowait()
+
+        inner_receive = self.inner_receives.get(channel)
+        if inner_receive is None:
+            inner_receive = self.inner_receives[channel] = asyncio.ensure_future(self.inner.receive(channel))
+        local_receive = asyncio.ensure_future(queue.get())
+        try:
+            await asyncio.wait([inner_receive, local_receive], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not local_receive.done():
+                local_receive.cancel()
+                try:
+                    await local_receive
+                except asyncio.CancelledError:
+                    pass
+
+        if local_receive.done() and not local_receive.cancelled():
+            # The inner receive carries on for the next call
+            return local_receive.result()
+        self.inner_receives.pop(channel, None)
+        return inner_receive.result()
+
+    async def group_add(self, group, channel):
+        if channel in self.local_channels:
+            self.local_channels[channel].add(group)
+            self.local_groups.setdefault(group, set()).add(channel)
+        await self.inner.group_add(group, channel)
+
+    async def group_discard(self, group, channel):
+        groups = self.local_channels.get(channel)
+        if groups is not None:
+            groups.discard(group)
+            if not groups:
+                # Consumers leave their groups on disconnect, forget the channel with its last group
+                self.forget_local_channel(channel)
+            local_group = self.local_groups.get(group, set())
+            local_group.discard(channel)
+            if not local_group:
+                self.local_groups.pop(group, None)
+        await self.inner.group_discard(group, channel)
+
+    async def group_send(self, group, message):
+        local_channels = self.local_groups.get(group)
+        if not local_channels:
+            self.remote_group_sends += 1
+            await self.inner.group_send(group, message)
+            return
+
+        local_channels = set(local_channels)
+        for channel in local_channels:
+            await self.deliver_local(channel, message)
+        for channel in await self.get_group_channels(group) - local_channels:
+            self.remote_deliveries += 1
+            await self.inner.send(channel, message)
+
+    async def flush(self):
+        for channel in list(self.local_channels):
+            self.forget_local_channel(channel)
+        self.local_groups.clear()
+        await self.inner.flush()
+
+    def forget_local_channel(self, channel) -> None:
+        """Drop a local channel and stop the inner receive still waiting for it."""
+        del self.local_channels[channel]
+        self.local_queues.pop(channel, None)
+        self.receive_loops.pop(channel, None)
+        inner_receive = self.inner_receives.pop(channel, None)
+        if inner_receive is not None:
+            inner_receive.cancel()
+
+    async def deliver_local(self, channel, message):
+        """Put a message on the local queue of a channel of this process, waking its receiver."""
+        self.local_deliveries += 1
+        queue = self.local_queues.setdefault(channel, asyncio.Queue())
+        receive_loop = self.receive_loops.get(channel)
+        if receive_loop is None or receive_loop is asyncio.get_running_loop():
+            queue.put_nowait(deepcopy(message))
+        else:
+            receive_loop.call_soon_threadsafe(queue.put_nowait, deepcopy(message))
+
+    async def get_group_channels(self, group) -> set:
+        """Get every channel of a group from the inner layer."""
+        groups = getattr(self.inner, "groups", None)
+        if groups is not None:
+            return set(groups.get(group, {}))
+
+        connection = self.inner.connection(self.inner.consistent_hash(group))
+        channels = await connection.zrangebyscore(
+            self.inner._group_key(group), min=int(time.time()) - self.inner.group_expiry, max="+inf"
+        )
+        return {channel.decode("utf8") for channel in channels}
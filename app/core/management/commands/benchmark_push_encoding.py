@@ -0,0 +1,92 @@
+"""
+Django command to compare the CPU cost of encoding WebSocket pushes
+"""
+import json
+import time
+from typing import Any
+import msgpack
+from django.core.management.base import BaseCommand
+from core.push import PUSH_MESSAGE_TYPE, encode_frame
+
+
+def build_group_push(members) -> dict:
+    """Build a push shaped like a group transaction with `members` participants."""
+    people = [
+        {'id': str(index), 'name': f'Member {index}', 'email': f'member{index}@example.com', 'image_url': ''}
+        for index in range(members)
+    ]
+    return {
+        'type': PUSH_MESSAGE_TYPE,
+        'data': {
+            'id': '1', 'payer': '0', 'group': '1', 'total_amount': 10.0 * members, 'split_count': members,
+            'description': 'Dinner', 'transaction_type': 'debt', 'transaction_date': '2025-01-01T00:00:00+00:00',
+            'split_details': [{**person, 'amount': 10.0} for person in people],
+            'ledger_balance': [{**person, 'balance': -10.0} for person in people],
+            'group_details': {'id': '1', 'group_name': 'Trip', 'created_by': '0', 'group_type': 'trip'},
+            'user_total_balance': {'total_owed': 0.0, 'total_due': 10.0, 'net_balance': -10.0},
+        }
+    }
+
+
+def build_group_delta_push(members) -> dict:
+    """Build the delta push of the same group transaction, as seen by a member who is not the payer."""
+    push = build_group_push(members)
+    data = {key: value for key, value in push['data'].items() if key not in ('ledger_balance', 'group_details')}
+    return {
+        'type': PUSH_MESSAGE_TYPE,
+        'data': {
+            **data,
+            'split_details': [{'id': str(index), 'amount': 10.0} for index in range(members)],
+            'ledger_changes': [{'id': '0', 'balance': -10.0}],
+            'format': 'delta',
+            'version': 1,
+        }
+    }
+
+
+class Command(BaseCommand):
+    """Django command to benchmark per-consumer JSON encoding against pre-serialized frames"""
+
+    help = "Measure CPU time per delivered push for a group push sent to every member."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=50, help="Recipients of the push.")
+        parser.add_argument('--iterations', type=int, default=200, help="Pushes delivered per measurement.")
+
+    def measure(self, deliver, iterations) -> float:
+        """Return CPU seconds spent by `iterations` calls of `deliver`."""
+        started_at = time.process_time()
+        for _ in range(iterations):
+            deliver()
+        return time.process_time() - started_at
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        """Entrypoint for command"""
+        members, iterations = options['members'], options['iterations']
+        push = build_group_push(members)
+
+        def deliver_dict():
+            # The channel layer packs the dict for every recipient, every consumer re-encodes it as JSON
+            for _ in range(members):
+                event = msgpack.unpackb(msgpack.packb(push))
+                json.dumps({"message": event})
+
+        def deliver_frame():
+            # The producer encodes the frame once, the layer only packs a string and consumers forward it
+            frame = encode_frame(push)
+            for _ in range(members):
+                msgpack.unpackb(msgpack.packb({'type': PUSH_MESSAGE_TYPE, 'text': frame}))['text']
+
+        delivered = members * iterations
+        dict_cpu = self.measure(deliver_dict, iterations)
+        frame_cpu = self.measure(deliver_frame, iterations)
+
+        self.stdout.write(f"{members} recipients, {delivered} pushes delivered, frame of {len(encode_frame(push))} bytes")
+        self.stdout.write(f"Per-consumer json.dumps: {dict_cpu / delivered * 1e6:.1f} us CPU per push")
+        self.stdout.write(f"Pre-serialized frame:    {frame_cpu / delivered * 1e6:.1f} us CPU per push")
+        self.stdout.write(self.style.SUCCESS(f"Pre-serialized frames use {dict_cpu / max(frame_cpu, 1e-9):.1f}x less CPU."))
+
+        snapshot_bytes = len(encode_frame(push))
+        delta_bytes = len(encode_frame(build_group_delta_push(members)))
+        self.stdout.write(f"Snapshot push: {snapshot_bytes} bytes, {snapshot_bytes * members} bytes per event")
+        self.stdout.write(f"Delta push:    {delta_bytes} bytes, {delta_bytes * members} bytes per event")
@@ -0,0 +1,59 @@
+"""
+Django command to compare the cost of rendering a get-bulk response
+"""
+import gzip
+import json
+import time
+from typing import Any
+from django.core.management.base import BaseCommand
+from rest_framework.utils.serializer_helpers import ReturnDict
+from core.management.commands.benchmark_push_encoding import build_group_push
+from user.renderers import encode_response
+
+
+def build_bulk_response(transactions, members) -> dict:
+    """Build a `get-bulk` page of `transactions` group transactions with `members` participants each."""
+    return ReturnDict({
+        'transactions': [{**build_group_push(members)['data'], 'id': str(index)} for index in range(transactions)],
+        'has_more': False,
+    }, serializer=None)
+
+
+def render_with_repr_scan(data) -> bytes:
+    """What UserRenderer did before: scan the repr of the data for errors, then encode it with json."""
+    if 'ErrorDetail' in str(data):
+        return json.dumps({'errors': data}).encode()
+    return json.dumps(data).encode()
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the JSON renderer of the API"""
+
+    help = "Measure the time to render a get-bulk response with the repr scan and with the orjson renderer."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=50, help="Transactions in the page.")
+        parser.add_argument('--members', type=int, default=10, help="Participants of each transaction.")
+        parser.add_argument('--iterations', type=int, default=100, help="Responses rendered per measurement.")
+
+    def measure(self, render, data, iterations) -> float:
+        """Return milliseconds per call of `render`."""
+        started_at = time.perf_counter()
+        for _ in range(iterations):
+            render(data)
+        return (time.perf_counter() - started_at) * 1000 / iterations
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        """Entrypoint for command"""
+        data = build_bulk_response(options['transactions'], options['members'])
+        iterations = options['iterations']
+
+        legacy_ms = self.measure(render_with_repr_scan, data, iterations)
+        orjson_ms = self.measure(encode_response, data, iterations)
+        content = encode_response(data)
+
+        self.stdout.write(f"{options['transactions']} transactions of {options['members']} members, {len(content)} bytes")
+        self.stdout.write(f"Repr scan and json: {legacy_ms:.2f} ms per response")
+        self.stdout.write(f"orjson renderer:    {orjson_ms:.2f} ms per response")
+        self.stdout.write(f"Gzipped:            {len(gzip.compress(content, compresslevel=5))} bytes")
+        self.stdout.write(self.style.SUCCESS(f"The orjson renderer is {legacy_ms / max(orjson_ms, 1e-9):.1f}x faster."))
@@ -0,0 +1,67 @@
+"""
+Django command to measure WebSocket handshake latency under a reconnect storm
+"""
+import asyncio
+import time
+from typing import Any
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+from middleware.jwt_auth_middleware import JwtAuthMiddleware, UserCache
+
+
+async def accept(scope, receive, send):
+    """Inner application standing in for the router, the handshake is done once the user is resolved."""
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the socket authentication of many clients reconnecting at once"""
+
+    help = "Measure handshake latency of concurrent reconnects, without the user cache, cold and warm."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help="Existing users the clients log in as.")
+        parser.add_argument('--connections', type=int, default=1000, help="Clients reconnecting at once.")
+
+    async def storm(self, user_cache, tokens, connections) -> list:
+        """Run `connections` handshakes at once, returning the milliseconds each took to authenticate."""
+        middleware = JwtAuthMiddleware(accept, user_cache)
+        started_at = time.perf_counter()
+
+        async def handshake(index):
+            scope = {
+                'type': 'websocket',
+                'headers': [(b'authorization', f'Bearer {tokens[index % len(tokens)]}'.encode())],
+                'query_string': b'',
+            }
+            await middleware(scope, None, None)
+            return (time.perf_counter() - started_at) * 1000
+
+        return sorted(await asyncio.gather(*(handshake(index) for index in range(connections))))
+
+    def report(self, label, latencies, user_cache) -> None:
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        self.stdout.write(
+            f"{label:<14} p50 {p50:8.1f} ms  p95 {p95:8.1f} ms  max {latencies[-1]:8.1f} ms  "
+            f"database reads {user_cache.get_stats()['loads']}"
+        )
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        """Entrypoint for command"""
+        users = list(get_user_model().objects.order_by('id')[:options['users']])
+        if not users:
+            raise CommandError("No users to log in as.")
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+        connections = options['connections']
+        self.stdout.write(f"{connections} handshakes at once as {len(users)} users")
+
+        uncached = UserCache(max_size=0)
+        self.report("No cache", asyncio.run(self.storm(uncached, tokens, connections)), uncached)
+
+        user_cache = UserCache(max_size=len(users))
+        self.report("Cold cache", asyncio.run(self.storm(user_cache, tokens, connections)), user_cache)
+        user_cache.hits = user_cache.misses = user_cache.loads = 0
+        self.report("Warm cache", asyncio.run(self.storm(user_cache, tokens, connections)), user_cache)
+
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,113 @@
+"""
+Registry of the users with an open WebSocket
+"""
+import threading
+import time
+import redis
+from core.backends import ProcessInstance, load_backend
+
+
+class InMemoryPresenceRegistry:
+    """
+    Presence registry kept in process memory.
+
+    A user whose sockets are all on other processes counts as offline here,
+    which is why ACTIVITY_PUSH_SKIP_OFFLINE stays off unless presence is kept
+    in Redis.
+    """
+
+    def __init__(self, ttl=90, **kwargs):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # Sockets and the time they expire, keyed by user ID as a string, as user IDs are passed both ways
+        self.connections = {}
+
+    def touch(self, user_id, channel_name) -> None:
+        """
+        Mark a socket of a user as open for the next `ttl` seconds, on connect and on every heartbeat.
+
+        Args:
+            user_id (int): The user of the socket.
+            channel_name (str): The channel of the socket.
+        """
+        with self.lock:
+            self.connections.setdefault(str(user_id), {})[channel_name] = time.time() + self.ttl
+
+    def remove(self, user_id, channel_name) -> None:
+        """Mark a socket of a user as closed."""
+        with self.lock:
+            sockets = self.connections.get(str(user_id), {})
+            sockets.pop(channel_name, None)
+            if not sockets:
+                self.connections.pop(str(user_id), None)
+
+    def get_connection_count(self, user_id) -> int:
+        """Get the number of open sockets of a user."""
+        now = time.time()
+        with self.lock:
+            return sum(1 for expires_at in self.connections.get(str(user_id), {}).values() if expires_at > now)
+
+    def get_online_users(self, user_ids) -> set:
+        """
+        Get the users with at least one open socket.
+
+        Args:
+            user_ids (list): The users to look up.
+
+        Returns:
+            set: The online user IDs among `user_ids`.
+        """
+        return {user_id for user_id in user_ids if self.get_connection_count(user_id)}
+
+
+class RedisPresenceRegistry:
+    """
+    Presence registry kept in one Redis sorted set per user.
+
+    Members are the channels of the user's sockets, scored by the time they
+    expire, so the sockets of a process that died without disconnecting stop
+    counting once their heartbeat is missed.
+    """
+
+    def __init__(self, url, ttl=90, **kwargs):
+        self.ttl = ttl
+        self.client = redis.Redis.from_url(url)
+
+    @staticmethod
+    def get_key(user_id) -> str:
+        return f"presence:{user_id}"
+
+    def touch(self, user_id, channel_name) -> None:
+        """Mark a socket of a user as open, see InMemoryPresenceRegistry.touch."""
+        now = time.time()
+        key = self.get_key(user_id)
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.zadd(key, {channel_name: now + self.ttl})
+        pipeline.zremrangebyscore(key, '-inf', now)
+        pipeline.expire(key, self.ttl)
+        pipeline.execute()
+
+    def remove(self, user_id, channel_name) -> None:
+        """Mark a socket of a user as closed."""
+        self.client.zrem(self.get_key(user_id), channel_name)
+
+    def get_connection_count(self, user_id) -> int:
+        """Get the number of open sockets of a user."""
+        return self.client.zcount(self.get_key(user_id), time.time(), '+inf')
+
+    def get_online_users(self, user_ids) -> set:
+        """Get the users with at least one open socket, see InMemoryPresenceRegistry.get_online_users."""
+        user_ids = list(user_ids)
+        now = time.time()
+        pipeline = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipeline.zcount(self.get_key(user_id), now, '+inf')
+        return {user_id for user_id, count in zip(user_ids, pipeline.execute()) if count}
+
+
+_presence_registry = ProcessInstance(lambda: load_backend('WEBSOCKET_PRESENCE'))
+
+
+def get_presence_registry():
+    """Get the presence registry of this process, built from the WEBSOCKET_PRESENCE setting."""
+    return _presence_registry.get()
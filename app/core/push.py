@@ -0,0 +1,76 @@
+"""
+Pre-serialized WebSocket pushes through the channel layer
+"""
+import orjson
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from core.presence import get_presence_registry
+from core.replay import get_replay_buffer
+
+PUSH_MESSAGE_TYPE = 'transaction_message'
+
+
+def encode_frame(message) -> str:
+    """
+    Encode the WebSocket text frame of a push once, on the producer side.
+
+    The frame is what `CoreConsumer` used to build with `json.dumps({"message": event})`,
+    so consumers forward it unchanged instead of re-encoding it for every socket.
+
+    Args:
+        message (dict): The push, with its `type` and `data`.
+
+    Returns:
+        str: The JSON text frame.
+    """
+    return orjson.dumps({"message": message}, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+def send_user_frame(user_id, frame, channel_layer=None, key=None) -> None:
+    """
+    Send an encoded frame to every socket of a user.
+
+    The frame is numbered with the user's next sequence number and kept in
+    the replay buffer first, so a socket that missed it can get it back on resume.
+    A frame sent again with the same `key` keeps its first sequence number, so
+    retried deliveries are not replayed twice.
+    """
+    channel_layer = channel_layer or get_channel_layer()
+    seq, frame = get_replay_buffer().append(user_id, frame, key)
+    async_to_sync(channel_layer.group_send)(
+        f"user_{user_id}",
+        {
+            'type': PUSH_MESSAGE_TYPE,
+            'text': frame,
+            'seq': seq
+        }
+    )
+
+
+def send_user_message(user_id, message, channel_layer=None) -> None:
+    """Encode a push and send it to every socket of a user."""
+    send_user_frame(user_id, encode_frame(message), channel_layer)
+
+
+def filter_online_users(user_ids) -> list:
+    """
+    Keep the users a push should be built for, the ones with an open socket.
+
+    With ACTIVITY_PUSH_SKIP_OFFLINE, the push is skipped for the other users
+    and numbered as a gap in their replay buffer, so they catch up through
+    the activity sync, or a resync when a socket resumes from before the gap.
+
+    Args:
+        user_ids (list): The recipients of the push.
+
+    Returns:
+        list: The recipients to send the push to, in the order of `user_ids`.
+    """
+    if not getattr(settings, 'ACTIVITY_PUSH_SKIP_OFFLINE', False) or not user_ids:
+        return list(user_ids)
+    online = get_presence_registry().get_online_users(user_ids)
+    offline = [user_id for user_id in user_ids if user_id not in online]
+    if offline:
+        get_replay_buffer().skip(offline)
+    return [user_id for user_id in user_ids if user_id in online]
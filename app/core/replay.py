@@ -0,0 +1,217 @@
+"""
+Per-user numbered replay buffer of WebSocket pushes
+"""
+import threading
+from collections import OrderedDict, deque, namedtuple
+import redis
+from core.backends import ProcessInstance, load_backend
+
+ReplayResult = namedtuple('ReplayResult', ['frames', 'last_seq', 'truncated'])
+
+
+def add_sequence(frame, seq) -> str:
+    """Put the sequence number in an encoded `{"message": ...}` frame without decoding it."""
+    return f'{{"seq":{seq},{frame[1:]}'
+
+
+def is_truncated(last_seq, current, oldest, gap=0) -> bool:
+    """
+    Whether pushes after `last_seq` were evicted or skipped, or numbering restarted after the buffer expired.
+
+    `gap` is the sequence number of the latest push that was skipped instead of kept, see skip.
+    """
+    if last_seq > current or gap > last_seq:
+        return True
+    return last_seq < current and (not oldest or oldest > last_seq + 1)
+
+
+class InMemoryReplayBuffer:
+    """
+    Replay buffer kept in process memory.
+
+    Pushes are numbered by the process that sends them, so a socket resuming
+    on another process compares against another numbering and is told to
+    resync. Suits tests and a single Daphne process.
+    """
+
+    def __init__(self, max_len=500, **kwargs):
+        self.max_len = max_len
+        self.lock = threading.Lock()
+        self.sequences = {}
+        self.streams = {}
+        self.gaps = {}
+        # User -> the keys of the pushes in the user's buffer, with their (seq, frame)
+        self.keyed = {}
+
+    def append(self, user_id, frame, key=None) -> tuple:
+        """
+        Number a push to a user and keep it in the user's buffer.
+
+        A push appended again with the same `key`, such as a retried delivery
+        of one activity, is not numbered twice while the first one is kept.
+
+        Args:
+            user_id (int): The user the push is for.
+            frame (str): The encoded push.
+            key (str): Identifies the push among the user's pushes.
+
+        Returns:
+            tuple: (seq, frame) with the sequence number put in the frame.
+        """
+        with self.lock:
+            keyed = self.keyed.setdefault(user_id, OrderedDict())
+            if key is not None and key in keyed:
+                return keyed[key]
+            seq = self.sequences.get(user_id, 0) + 1
+            self.sequences[user_id] = seq
+            frame = add_sequence(frame, seq)
+            self.streams.setdefault(user_id, deque(maxlen=self.max_len)).append((seq, frame))
+            if key is not None:
+                keyed[key] = (seq, frame)
+                if len(keyed) > self.max_len:
+                    keyed.popitem(last=False)
+        return seq, frame
+
+    def skip(self, user_ids) -> None:
+        """
+        Number a push that was not sent to users, without keeping it.
+
+        A socket resuming from before the skipped push is told to resync
+        instead of getting the pushes around it, see read_since.
+
+        Args:
+            user_ids (list): The users the push was not sent to.
+        """
+        with self.lock:
+            for user_id in user_ids:
+                seq = self.sequences.get(user_id, 0) + 1
+                self.sequences[user_id] = seq
+                self.gaps[user_id] = seq
+
+    def get_last_seq(self, user_id) -> int:
+        """Get the sequence number of the latest push to a user, 0 when there is none."""
+        with self.lock:
+            return self.sequences.get(user_id, 0)
+
+    def read_since(self, user_id, last_seq) -> ReplayResult:
+        """
+        Get the pushes to a user after `last_seq`.
+
+        Args:
+            user_id (int): The user to replay for.
+            last_seq (int): Sequence number of the last push the client received.
+
+        Returns:
+            ReplayResult: The frames after `last_seq`, the latest sequence number of the user and
+                whether pushes after `last_seq` are no longer all in the buffer.
+        """
+        with self.lock:
+            current = self.sequences.get(user_id, 0)
+            gap = self.gaps.get(user_id, 0)
+            stream = list(self.streams.get(user_id, ()))
+        oldest = stream[0][0] if stream else 0
+        frames = [frame for seq, frame in stream if seq > last_seq]
+        return ReplayResult(frames, current, is_truncated(last_seq, current, oldest, gap))
+
+
+class RedisReplayBuffer:
+    """
+    Replay buffer kept in a capped Redis stream per user.
+
+    The sequence counter and the stream of a user are updated by one script,
+    so entries are numbered without gaps in the order they are appended, and
+    stream ids are the sequence numbers, so a replay is a single XRANGE.
+    The keys of a user expire `ttl` seconds after the user's last push.
+    Keyed pushes have their sequence number in a hash, so appending one again
+    returns the entry still in the stream.
+    """
+
+    APPEND_SCRIPT = """
+        if ARGV[4] ~= '' then
+            local kept = redis.call('HGET', KEYS[4], ARGV[4])
+            if kept then
+                local entry = redis.call('XRANGE', KEYS[2], kept .. '-0', kept .. '-0')
+                if #entry > 0 then
+                    return {tonumber(kept), entry[1][2][2]}
+                end
+            end
+        end
+        local seq = redis.call('INCR', KEYS[1])
+        local frame = '{"seq":' .. seq .. ',' .. string.sub(ARGV[1], 2)
+        redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[2], seq .. '-0', 'frame', frame)
+        if ARGV[4] ~= '' then
+            redis.call('HSET', KEYS[4], ARGV[4], seq)
+        end
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+        redis.call('EXPIRE', KEYS[2], ARGV[3])
+        redis.call('EXPIRE', KEYS[3], ARGV[3])
+        redis.call('EXPIRE', KEYS[4], ARGV[3])
+        return {seq, frame}
+    """
+
+    SKIP_SCRIPT = """
+        local seq = redis.call('INCR', KEYS[1])
+        redis.call('SET', KEYS[3], seq, 'EX', ARGV[1])
+        redis.call('EXPIRE', KEYS[1], ARGV[1])
+        return seq
+    """
+
+    READ_SCRIPT = """
+        local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+        local oldest = 0
+        local first = redis.call('XRANGE', KEYS[2], '-', '+', 'COUNT', 1)
+        if #first > 0 then
+            oldest = tonumber(string.match(first[1][1], '^(%d+)'))
+        end
+        local gap = tonumber(redis.call('GET', KEYS[3]) or '0')
+        local result = {current, oldest, gap}
+        for _, entry in ipairs(redis.call('XRANGE', KEYS[2], (tonumber(ARGV[1]) + 1) .. '-0', '+')) do
+            table.insert(result, entry[2][2])
+        end
+        return result
+    """
+
+    def __init__(self, url, max_len=500, ttl=24 * 60 * 60, **kwargs):
+        self.max_len = max_len
+        self.ttl = ttl
+        self.client = redis.Redis.from_url(url)
+        self.append_script = self.client.register_script(self.APPEND_SCRIPT)
+        self.read_script = self.client.register_script(self.READ_SCRIPT)
+        self.skip_script = self.client.register_script(self.SKIP_SCRIPT)
+
+    @staticmethod
+    def get_keys(user_id) -> list:
+        return [f"replay:{user_id}:seq", f"replay:{user_id}:stream", f"replay:{user_id}:gap", f"replay:{user_id}:keys"]
+
+    def append(self, user_id, frame, key=None) -> tuple:
+        """Number a push to a user and keep it in the user's buffer, see InMemoryReplayBuffer.append."""
+        seq, frame = self.append_script(
+            keys=self.get_keys(user_id), args=[frame, self.max_len, self.ttl, '' if key is None else key]
+        )
+        return int(seq), frame.decode()
+
+    def skip(self, user_ids) -> None:
+        """Number a push that was not sent to users, see InMemoryReplayBuffer.skip."""
+        pipeline = self.client.pipeline(transaction=False)
+        for user_id in user_ids:
+            self.skip_script(keys=self.get_keys(user_id), args=[self.ttl], client=pipeline)
+        pipeline.execute()
+
+    def get_last_seq(self, user_id) -> int:
+        """Get the sequence number of the latest push to a user, see InMemoryReplayBuffer.get_last_seq."""
+        return int(self.client.get(self.get_keys(user_id)[0]) or 0)
+
+    def read_since(self, user_id, last_seq) -> ReplayResult:
+        """Get the pushes to a user after `last_seq`, see InMemoryReplayBuffer.read_since."""
+        current, oldest, gap, *frames = self.read_script(keys=self.get_keys(user_id), args=[last_seq])
+        return ReplayResult(
+            [frame.decode() for frame in frames], int(current), is_truncated(last_seq, int(current), int(oldest), int(gap))
+        )
+
+
+_replay_buffer = ProcessInstance(lambda: load_backend('WEBSOCKET_REPLAY_BUFFER'))
+
+
+def get_replay_buffer():
+    """Get the replay buffer of this process, built from the WEBSOCKET_REPLAY_BUFFER setting."""
+    return _replay_buffer.get()
@@ -1,7 +1,9 @@
-from django.db.models.signals import m2m_changed
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from activity.models import Activity, ActivityType
+from middleware.jwt_auth_middleware import get_user_cache
+from user.authentication import cache_user_claims
 
 User = get_user_model()
 
@@ -32,3 +34,25 @@ def track_friend_changes(sender, instance, action, reverse, model, pk_set, **kwa
                 comments={"message": f"{instance.email} and {friend.email} are no longer friends"},
             )
             activity.related_users_ids.add(*related_users)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Drop a changed user from the socket handshake cache of this process.
+
+    Other processes keep their copy until WEBSOCKET_USER_CACHE_TTL.
+    """
+    get_user_cache().invalidate(instance.id)
+
+
+@receiver(post_save, sender=User)
+def refresh_user_claims(sender, instance, **kwargs):
+    """Replace the claims of the tokens a user was issued before it changed, see user.authentication."""
+    cache_user_claims(instance)
+
+
+@receiver(post_delete, sender=User)
+def revoke_user_claims(sender, instance, **kwargs):
+    cache_user_claims(instance, is_active=False)
@@ -0,0 +1,32 @@
+"""
+Test for the backends and shared objects of a process.
+"""
+import threading
+from django.test import SimpleTestCase, override_settings
+from core.backends import ProcessInstance, load_backend
+from core.replay import InMemoryReplayBuffer
+
+
+class BackendTests(SimpleTestCase):
+
+    @override_settings(TEST_BACKEND={'BACKEND': 'core.replay.InMemoryReplayBuffer', 'CONFIG': {'max_len': 7}})
+    def test_load_backend_from_setting(self):
+        """Test the backend class of a setting is built with its config."""
+        backend = load_backend('TEST_BACKEND')
+
+        self.assertIsInstance(backend, InMemoryReplayBuffer)
+        self.assertEqual(backend.max_len, 7)
+
+    def test_process_instance_built_once(self):
+        """Test concurrent first uses share one instance."""
+        built = []
+        shared = ProcessInstance(lambda: built.append(object()) or built[-1])
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(shared.get())) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(built), 1)
+        self.assertTrue(all(result is built[0] for result in results))
@@ -0,0 +1,126 @@
+"""
+Test for the WebSocket command protocol of CoreConsumer.
+"""
+import json
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, override_settings
+from core.consumers import CoreConsumer
+from core.tests.utils import IN_MEMORY_CHANNEL_LAYERS
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, CONSUMER_MAX_IN_FLIGHT=4)
+class CoreConsumerCommandTests(SimpleTestCase):
+    """Test request ids and pipelined commands."""
+
+    def setUp(self):
+        # Size a fresh worker pool from this test's settings
+        pool_patch = patch('core.workers._consumer_pool.instance', None)
+        pool_patch.start()
+        self.addCleanup(pool_patch.stop)
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(CoreConsumer.as_asgi(), '/ws/socket')
+        communicator.scope['user'] = SimpleNamespace(is_authenticated=True, id=1)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive_all(self, communicator, count):
+        return [json.loads(await communicator.receive_from(timeout=5)) for _ in range(count)]
+
+    async def test_request_id_echoed(self):
+        """Test replies carry the request id they were sent with, and none without one."""
+        communicator = await self.connect()
+
+        await communicator.send_to(text_data=json.dumps({'action': 'test', 'request_id': 'abc'}))
+        self.assertEqual((await self.receive_all(communicator, 1))[0]['request_id'], 'abc')
+
+        await communicator.send_to(text_data=json.dumps({'action': 'test'}))
+        self.assertNotIn('request_id', (await self.receive_all(communicator, 1))[0])
+        await communicator.disconnect()
+
+    async def test_independent_commands_run_concurrently(self):
+        """Test pipelined adds overlap instead of waiting for each other."""
+        def slow_add(consumer, data):
+            time.sleep(0.3)
+            return {'status': 'success', 'n': data['transaction_data']['n']}
+
+        communicator = await self.connect()
+        with patch.object(CoreConsumer, 'handle_add_transaction', slow_add):
+            started_at = time.monotonic()
+            for n in range(3):
+                await communicator.send_to(text_data=json.dumps({
+                    'action': 'add_transaction', 'request_id': n, 'transaction_data': {'n': n}
+                }))
+            replies = await self.receive_all(communicator, 3)
+            elapsed = time.monotonic() - started_at
+
+        self.assertEqual({reply['request_id']: reply['n'] for reply in replies}, {0: 0, 1: 1, 2: 2})
+        self.assertLess(elapsed, 0.8)
+        await communicator.disconnect()
+
+    async def test_same_transaction_kept_in_order(self):
+        """Test modifications of one transaction run one at a time in the order sent."""
+        events = []
+
+        def modify(consumer, data):
+            events.append(('start', data['request_id']))
+            time.sleep(0.1 if data['request_id'] == 'first' else 0)
+            events.append(('end', data['request_id']))
+            return {'status': 'success'}
+
+        communicator = await self.connect()
+        with patch.object(CoreConsumer, 'handle_modify_transaction', modify):
+            for request_id in ['first', 'second']:
+                await communicator.send_to(text_data=json.dumps({
+                    'action': 'modify_transaction', 'request_id': request_id, 'transaction_data': {'id': 7}
+                }))
+            replies = await self.receive_all(communicator, 2)
+
+        self.assertEqual([reply['request_id'] for reply in replies], ['first', 'second'])
+        self.assertEqual(events, [('start', 'first'), ('end', 'first'), ('start', 'second'), ('end', 'second')])
+        await communicator.disconnect()
+
+    @override_settings(CONSUMER_MAX_IN_FLIGHT=1)
+    async def test_in_flight_limit(self):
+        """Test commands beyond the connection's in-flight limit get a busy reply."""
+        def blocked_add(consumer, data):
+            time.sleep(0.2)
+            return {'status': 'success'}
+
+        communicator = await self.connect()
+        with patch.object(CoreConsumer, 'handle_add_transaction', blocked_add):
+            for request_id in [1, 2]:
+                await communicator.send_to(text_data=json.dumps({'action': 'add_transaction', 'request_id': request_id}))
+            replies = await self.receive_all(communicator, 2)
+
+        self.assertEqual(replies[0]['request_id'], 2)
+        self.assertEqual(replies[0]['response_key'], 'ERR_SERVER_BUSY')
+        self.assertEqual(replies[1], {'status': 'success', 'request_id': 1})
+        await communicator.disconnect()
+
+    async def test_frame_without_action_answered(self):
+        """Test a command without an action gets an error reply instead of no reply."""
+        communicator = await self.connect()
+
+        await communicator.send_to(text_data=json.dumps({'request_id': 'x'}))
+        reply = (await self.receive_all(communicator, 1))[0]
+
+        self.assertEqual((reply['response_key'], reply['request_id']), ('ERR_SOMETHING_WENT_WRONG', 'x'))
+        await communicator.disconnect()
+
+    async def test_failing_command_answered(self):
+        """Test a handler that raises is logged and the client gets an error reply with its request id."""
+        def failing_snapshot(consumer, data):
+            raise RuntimeError("ledger query failed")
+
+        communicator = await self.connect()
+        with patch.object(CoreConsumer, 'handle_get_snapshot', failing_snapshot), self.assertLogs('core.consumers', 'ERROR'):
+            await communicator.send_to(text_data=json.dumps({'action': 'get_snapshot', 'request_id': 's'}))
+            reply = (await self.receive_all(communicator, 1))[0]
+
+        self.assertEqual((reply['response_key'], reply['request_id']), ('ERR_SOMETHING_WENT_WRONG', 's'))
+        await communicator.disconnect()
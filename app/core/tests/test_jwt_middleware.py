@@ -0,0 +1,120 @@
+"""
+Test for user resolution of the WebSocket JWT middleware.
+"""
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from core.consumers import CoreConsumer
+from middleware.jwt_auth_middleware import UserCache, get_token, get_user
+from core.tests.utils import create_user, IN_MEMORY_CHANNEL_LAYERS
+
+
+def websocket_scope(headers=(), subprotocols=(), query_string=b''):
+    return {'type': 'websocket', 'headers': list(headers), 'subprotocols': list(subprotocols), 'query_string': query_string}
+
+
+class UserCacheTests(SimpleTestCase):
+    """Test the bounded user cache."""
+
+    def test_least_recently_used_evicted(self):
+        """Test the user read longest ago is evicted past the maximum size."""
+        user_cache = UserCache(max_size=2)
+        user_cache.set(1, 'one')
+        user_cache.set(2, 'two')
+        user_cache.get(1)
+
+        user_cache.set(3, 'three')
+
+        self.assertIsNone(user_cache.get(2))
+        self.assertEqual((user_cache.get(1), user_cache.get(3)), ('one', 'three'))
+
+    def test_expired_user_not_served(self):
+        """Test a user cached longer than the TTL is read again."""
+        user_cache = UserCache(ttl=0)
+        user_cache.set(1, 'one')
+
+        self.assertIsNone(user_cache.get(1))
+        self.assertEqual(user_cache.get_stats(), {'size': 0, 'hits': 0, 'misses': 1, 'loads': 0})
+
+
+class GetTokenTests(SimpleTestCase):
+    """Test the token is read from every place a client can send it."""
+
+    def test_authorization_header(self):
+        scope = websocket_scope(headers=[(b'Authorization', b'Bearer abc')], query_string=b'token=other')
+        self.assertEqual(get_token(scope), 'abc')
+
+    def test_subprotocol(self):
+        self.assertEqual(get_token(websocket_scope(subprotocols=['access_token', 'abc'])), 'abc')
+
+    def test_query_string(self):
+        self.assertEqual(get_token(websocket_scope(query_string=b'token=abc&x=1')), 'abc')
+
+    def test_no_token(self):
+        self.assertIsNone(get_token(websocket_scope(subprotocols=['chat'])))
+
+
+class GetUserTests(TransactionTestCase):
+    """
+    Test users are read from the database once per TTL.
+
+    Not a TestCase, as database_sync_to_async closes connections left in a transaction.
+    """
+
+    def setUp(self):
+        self.user = create_user('user@example.com')
+        self.token = str(AccessToken.for_user(self.user))
+        self.user_cache = UserCache()
+        patcher = patch('middleware.jwt_auth_middleware._user_cache.instance', self.user_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached_user_not_read_again(self):
+        """Test a second handshake of the same user does not query the database."""
+        first = async_to_sync(get_user)(self.token)
+
+        with self.assertNumQueries(0):
+            second = async_to_sync(get_user)(self.token)
+
+        self.assertEqual(second, self.user)
+        self.assertIsNot(second, first)
+
+    def test_saved_user_invalidated(self):
+        """Test saving a user drops it from the cache."""
+        async_to_sync(get_user)(self.token)
+        self.user.name = 'Renamed'
+        self.user.save()
+
+        self.assertEqual(async_to_sync(get_user)(self.token).name, 'Renamed')
+
+    def test_invalid_token_anonymous(self):
+        self.assertFalse(async_to_sync(get_user)('invalid').is_authenticated)
+
+    def test_concurrent_handshakes_share_read(self):
+        """Test handshakes of the same user at once read it from the database once."""
+        async def storm():
+            return await asyncio.gather(*(get_user(self.token) for _ in range(5)))
+
+        with self.assertNumQueries(1):
+            users = async_to_sync(storm)()
+
+        self.assertEqual(set(users), {self.user})
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class TokenSubprotocolTests(SimpleTestCase):
+    """Test the token subprotocol is echoed so browsers complete the handshake."""
+
+    async def test_subprotocol_accepted(self):
+        communicator = WebsocketCommunicator(CoreConsumer.as_asgi(), '/ws/socket', subprotocols=['access_token', 'abc'])
+        communicator.scope['user'] = SimpleNamespace(is_authenticated=True, id=1)
+
+        connected, subprotocol = await communicator.connect()
+
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, 'access_token')
+        await communicator.disconnect()
@@ -0,0 +1,215 @@
+"""
+Test for the local short-circuit channel layer.
+"""
+import asyncio
+import socket
+from collections import defaultdict
+from channels.layers import InMemoryChannelLayer
+from channels_redis.core import RedisChannelLayer
+from unittest import skipUnless
+from django.test import SimpleTestCase
+from core.layers import LocalShortCircuitChannelLayer
+
+REDIS_HOST = ("redis", 6379)
+
+
+def redis_available() -> bool:
+    try:
+        socket.create_connection(REDIS_HOST, timeout=0.5).close()
+    except OSError:
+        return False
+    return True
+
+
+class SharedInMemoryLayer(InMemoryChannelLayer):
+    """In-memory layer shared by two layers as if it were Redis, recording the channels sent through it."""
+
+    def __init__(self):
+        super().__init__()
+        self.sent_channels = []
+
+    async def send(self, channel, message):
+        self.sent_channels.append(channel)
+        await super().send(channel, message)
+
+
+class QueueBackedRedisLayer(RedisChannelLayer):
+    """
+    The Redis channel layer with its channel lists held in memory.
+
+    Only sending, groups, the BRPOP and backup cleanup are replaced, so
+    `receive` keeps the Redis layer's own semantics: one receiver of the
+    process holds the receive lock and polls the process channel until a
+    message arrives on it.
+    """
+
+    brpop_timeout = 0.05
+
+    def __init__(self):
+        super().__init__(hosts=[("localhost", 6379)])
+        self.lists = defaultdict(asyncio.Queue)
+        self.groups = defaultdict(dict)
+
+    async def group_add(self, group, channel):
+        self.groups[group][channel] = None
+
+    async def group_discard(self, group, channel):
+        self.groups[group].pop(channel, None)
+
+    async def send(self, channel, message):
+        if "!" in channel:
+            message = dict(message, __asgi_channel__=channel)
+            channel = self.non_local_name(channel)
+        self.lists[self.prefix + channel].put_nowait(self.serialize(message))
+
+    async def _brpop_with_clean(self, index, channel, timeout):
+        try:
+            return await asyncio.wait_for(self.lists[channel].get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _clean_receive_backup(self, index, channel):
+        pass
+
+
+class LocalShortCircuitLayerTests(SimpleTestCase):
+    """Test delivery between two processes sharing a Redis stand-in."""
+
+    def setUp(self):
+        self.redis = SharedInMemoryLayer()
+        self.process_a = LocalShortCircuitChannelLayer(inner=self.redis)
+        self.process_b = LocalShortCircuitChannelLayer(inner=self.redis)
+
+    async def connect(self, layer, group):
+        channel = await layer.new_channel()
+        await layer.group_add(group, channel)
+        return channel
+
+    async def test_local_members_skip_inner_layer(self):
+        """Test a group send reaches local sockets directly and remote ones through the inner layer."""
+        local_channel = await self.connect(self.process_a, 'user_1')
+        remote_channel = await self.connect(self.process_b, 'user_1')
+
+        await self.process_a.group_send('user_1', {'type': 'transaction_message', 'text': 'frame'})
+
+        self.assertEqual(await self.process_a.receive(local_channel), {'type': 'transaction_message', 'text': 'frame'})
+        self.assertEqual(await self.process_b.receive(remote_channel), {'type': 'transaction_message', 'text': 'frame'})
+        self.assertEqual(self.redis.sent_channels, [remote_channel])
+        self.assertEqual(self.process_a.get_stats(), {
+            'local_channels': 1, 'local_deliveries': 1, 'remote_deliveries': 1, 'remote_group_sends': 0
+        })
+
+    async def test_group_without_local_members_uses_inner_group_send(self):
+        """Test groups only connected elsewhere are handed to the inner layer whole."""
+        remote_channel = await self.connect(self.process_b, 'user_2')
+
+        await self.process_a.group_send('user_2', {'type': 'transaction_message', 'text': 'frame'})
+
+        self.assertEqual((await self.process_b.receive(remote_channel))['text'], 'frame')
+        self.assertEqual(self.process_a.get_stats()['remote_group_sends'], 1)
+        self.assertEqual(self.process_a.get_stats()['local_deliveries'], 0)
+
+    async def test_discard_forgets_local_channel(self):
+        """Test a disconnected socket leaves the local registry."""
+        channel = await self.connect(self.process_a, 'user_3')
+
+        await self.process_a.group_discard('user_3', channel)
+        await self.process_a.group_send('user_3', {'type': 'transaction_message', 'text': 'frame'})
+
+        self.assertEqual(self.process_a.local_groups, {})
+        self.assertEqual(self.process_a.local_channels, {})
+        self.assertEqual(self.process_a.get_stats()['remote_group_sends'], 1)
+
+    async def test_direct_send_to_local_channel(self):
+        """Test sending to a single local channel stays in-process."""
+        channel = await self.process_a.new_channel()
+
+        await self.process_a.send(channel, {'type': 'transaction_message', 'text': 'frame'})
+
+        self.assertEqual((await self.process_a.receive(channel))['text'], 'frame')
+        self.assertEqual(self.redis.sent_channels, [])
+
+    async def test_default_in_memory_inner_layer(self):
+        """Test the wrapper works on its own over the in-memory layer."""
+        layer = LocalShortCircuitChannelLayer()
+        channel = await self.connect(layer, 'user_4')
+
+        await layer.group_send('user_4', {'type': 'transaction_message', 'text': 'frame'})
+
+        self.assertEqual((await layer.receive(channel))['text'], 'frame')
+        self.assertEqual(layer.get_stats()['local_deliveries'], 1)
+
+    def test_inner_layer_from_config(self):
+        """Test the inner layer can be given in CHANNEL_LAYERS form."""
+        layer = LocalShortCircuitChannelLayer(inner={
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+            'CONFIG': {'capacity': 7},
+        })
+
+        self.assertIsInstance(layer.inner, InMemoryChannelLayer)
+        self.assertEqual(layer.capacity, 7)
+
+
+class RedisReceiveTests(SimpleTestCase):
+    """Test local delivery against the receive loop of the Redis channel layer."""
+
+    def setUp(self):
+        self.redis = QueueBackedRedisLayer()
+        self.layer = LocalShortCircuitChannelLayer(inner=self.redis)
+
+    async def test_local_delivery_wakes_receiver_blocked_in_brpop(self):
+        """Test a local message reaches a receiver polling Redis with no remote message to come."""
+        channel = await self.layer.new_channel()
+        await self.layer.group_add('user_1', channel)
+        receive = asyncio.ensure_future(self.layer.receive(channel))
+        await asyncio.sleep(0.1)
+        self.assertFalse(receive.done())
+
+        await self.layer.group_send('user_1', {'type': 'transaction_message', 'text': 'frame'})
+
+        self.assertEqual(await asyncio.wait_for(receive, 1), {'type': 'transaction_message', 'text': 'frame'})
+        await self.layer.group_discard('user_1', channel)
+
+    async def test_remote_message_after_local_one(self):
+        """Test the Redis receive left waiting by a local message still delivers the next remote one."""
+        channel = await self.layer.new_channel()
+        await self.layer.group_add('user_2', channel)
+        receive = asyncio.ensure_future(self.layer.receive(channel))
+        await asyncio.sleep(0.1)
+        await self.layer.send(channel, {'type': 'transaction_message', 'text': 'local'})
+        self.assertEqual((await asyncio.wait_for(receive, 1))['text'], 'local')
+
+        await self.redis.send(channel, {'type': 'transaction_message', 'text': 'remote'})
+
+        self.assertEqual((await asyncio.wait_for(self.layer.receive(channel), 1))['text'], 'remote')
+        await self.layer.group_discard('user_2', channel)
+        self.assertEqual(self.layer.inner_receives, {})
+
+
+@skipUnless(redis_available(), "needs a Redis server at redis:6379")
+class RedisServerTests(SimpleTestCase):
+    """Test delivery between two layers over a Redis server."""
+
+    async def test_group_send_reaches_local_and_remote_sockets(self):
+        process_a = LocalShortCircuitChannelLayer(inner={
+            'BACKEND': 'channels_redis.core.RedisChannelLayer', 'CONFIG': {'hosts': [REDIS_HOST]},
+        })
+        process_b = LocalShortCircuitChannelLayer(inner={
+            'BACKEND': 'channels_redis.core.RedisChannelLayer', 'CONFIG': {'hosts': [REDIS_HOST]},
+        })
+        local_channel = await process_a.new_channel()
+        remote_channel = await process_b.new_channel()
+        await process_a.group_add('user_5', local_channel)
+        await process_b.group_add('user_5', remote_channel)
+        local_receive = asyncio.ensure_future(process_a.receive(local_channel))
+        await asyncio.sleep(0.1)
+
+        await process_a.group_send('user_5', {'type': 'transaction_message', 'text': 'frame'})
+
+        self.assertEqual((await asyncio.wait_for(local_receive, 2))['text'], 'frame')
+        self.assertEqual((await asyncio.wait_for(process_b.receive(remote_channel), 2))['text'], 'frame')
+        await process_a.group_discard('user_5', local_channel)
+        await process_b.group_discard('user_5', remote_channel)
+        await process_a.flush()
+        await process_a.close_pools()
+        await process_b.close_pools()
@@ -0,0 +1,161 @@
+"""
+Test for the presence registry and pushes skipped for offline users.
+"""
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from activity.models import ActivityInbox
+from core.consumers import CoreConsumer
+from core.presence import InMemoryPresenceRegistry
+from core.push import encode_frame, filter_online_users, send_user_frame
+from core.replay import InMemoryReplayBuffer
+from transaction.serializers import AddTransactionSerializer
+from core.tests.utils import create_user, IN_MEMORY_CHANNEL_LAYERS
+
+
+def patch_singletons(test, registry, buffer):
+    for target, value in [
+        ('core.presence._presence_registry.instance', registry),
+        ('core.replay._replay_buffer.instance', buffer),
+        ('core.workers._consumer_pool.instance', None),
+    ]:
+        patcher = patch(target, value)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+
+
+class InMemoryPresenceRegistryTests(SimpleTestCase):
+    """Test the in-memory presence registry."""
+
+    def test_connections_counted_per_user(self):
+        """Test a user is online while at least one of its sockets is open."""
+        registry = InMemoryPresenceRegistry()
+        registry.touch(1, 'a')
+        registry.touch(1, 'b')
+        registry.touch(2, 'c')
+
+        registry.remove(1, 'a')
+
+        self.assertEqual(registry.get_connection_count(1), 1)
+        self.assertEqual(registry.get_online_users([1, 2, 3]), {1, 2})
+        registry.remove(1, 'b')
+        self.assertEqual(registry.get_online_users([1, 2]), {2})
+
+    def test_missed_heartbeat_expires_socket(self):
+        """Test a socket that was not refreshed within the TTL no longer counts."""
+        registry = InMemoryPresenceRegistry(ttl=0)
+        registry.touch(1, 'a')
+
+        self.assertEqual(registry.get_online_users([1]), set())
+
+    def test_user_ids_matched_as_strings(self):
+        """Test a user marked online by its integer ID is found by its string ID."""
+        registry = InMemoryPresenceRegistry()
+        registry.touch(1, 'a')
+
+        self.assertEqual(registry.get_online_users(['1']), {'1'})
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, ACTIVITY_PUSH_SKIP_OFFLINE=True)
+class PresenceConsumerTests(SimpleTestCase):
+    """Test sockets are registered while open and skipped pushes call for a resync."""
+
+    def setUp(self):
+        self.registry = InMemoryPresenceRegistry()
+        self.buffer = InMemoryReplayBuffer()
+        patch_singletons(self, self.registry, self.buffer)
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(CoreConsumer.as_asgi(), '/ws/socket')
+        communicator.scope['user'] = SimpleNamespace(is_authenticated=True, id=1)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_socket_online_until_disconnect(self):
+        """Test a socket is in the registry from connect to disconnect."""
+        communicator = await self.connect()
+        self.assertEqual(self.registry.get_connection_count(1), 1)
+
+        await communicator.disconnect()
+
+        self.assertEqual(self.registry.get_connection_count(1), 0)
+
+    def test_offline_users_skipped(self):
+        """Test only online users are kept and the others get a gap in their replay buffer."""
+        self.registry.touch(1, 'a')
+
+        self.assertEqual(filter_online_users([1, 2]), [1])
+        self.assertEqual(self.buffer.get_last_seq(2), 1)
+        self.assertEqual(self.buffer.get_last_seq(1), 0)
+
+    @override_settings(ACTIVITY_PUSH_SKIP_OFFLINE=False)
+    def test_skipping_disabled(self):
+        """Test every user is kept when skipping is off."""
+        self.assertEqual(filter_online_users([1, 2]), [1, 2])
+        self.assertEqual(self.buffer.get_last_seq(2), 0)
+
+    async def test_resume_from_before_skipped_push_requires_resync(self):
+        """Test a socket resuming from before a skipped push is resynced, not replayed around the gap."""
+        self.buffer.append(1, encode_frame({'type': 'transaction_message', 'data': {}}))
+        filter_online_users([1])
+        self.buffer.append(1, encode_frame({'type': 'transaction_message', 'data': {}}))
+        communicator = await self.connect()
+
+        await communicator.send_to(text_data=json.dumps({'action': 'resume', 'last_seq': 1}))
+
+        reply = json.loads(await communicator.receive_from(timeout=5))
+        self.assertEqual(reply['message'], {'type': 'resync_required', 'seq': 3})
+        await communicator.send_to(text_data=json.dumps({'action': 'resume', 'last_seq': 2}))
+        self.assertEqual(json.loads(await communicator.receive_from(timeout=5))['seq'], 3)
+        await communicator.disconnect()
+
+    def test_send_user_frame_not_filtered(self):
+        """Test frames sent to a user directly still reach the buffer while it is offline."""
+        send_user_frame(2, encode_frame({'type': 'transaction_message', 'data': {}}))
+
+        self.assertEqual(len(self.buffer.read_since(2, 0).frames), 1)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, ACTIVITY_PUSH_SKIP_OFFLINE=True)
+class PresenceFanoutTests(TestCase):
+    """Test the fan-out only builds pushes for online users."""
+
+    def setUp(self):
+        self.user = create_user('user@example.com')
+        self.online = create_user('online@example.com')
+        self.offline = create_user('offline@example.com')
+        self.user.friends.add(self.online, self.offline)
+        self.registry = InMemoryPresenceRegistry()
+        self.buffer = InMemoryReplayBuffer()
+        patch_singletons(self, self.registry, self.buffer)
+        self.channel_layer = get_channel_layer()
+        self.channels = {}
+        for user in [self.online, self.offline]:
+            self.channels[user.id] = async_to_sync(self.channel_layer.new_channel)()
+            async_to_sync(self.channel_layer.group_add)(f"user_{user.id}", self.channels[user.id])
+        self.registry.touch(self.online.id, self.channels[self.online.id])
+
+    def test_offline_user_gets_only_inbox_record(self):
+        """Test an offline user gets the activity in its inbox but no push."""
+        serializer = AddTransactionSerializer(data={
+            'payer_id': self.user.id,
+            'total_amount': 30,
+            'transaction_type': 'debt',
+            'transaction_date': timezone.now().isoformat(),
+            'is_group': False,
+            'split_details': [{'user': user.id, 'amount': 10} for user in [self.user, self.online, self.offline]],
+        }, context={'user': self.user})
+        serializer.is_valid(raise_exception=True)
+        transaction = serializer.save()
+
+        message = json.loads(async_to_sync(self.channel_layer.receive)(self.channels[self.online.id])['text'])
+        self.assertEqual(message['message']['data']['id'], str(transaction.id))
+        self.assertNotIn(self.channels[self.offline.id], self.channel_layer.channels)
+        self.assertTrue(ActivityInbox.objects.filter(user_id=self.offline, activity__transaction_id=transaction).exists())
+        self.assertTrue(self.buffer.read_since(self.offline.id, 0).truncated)
@@ -0,0 +1,80 @@
+"""
+Test for pre-serialized WebSocket pushes.
+"""
+import json
+from io import StringIO
+from unittest.mock import AsyncMock, patch
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from activity.fanout import deliver_activity
+from activity.models import Activity, ActivityType
+from core.consumers import CoreConsumer
+from core.push import encode_frame, send_user_message
+from group.models import Group, GroupParticipant
+from core.tests.utils import create_user, IN_MEMORY_CHANNEL_LAYERS
+
+
+class PushFrameTests(SimpleTestCase):
+    """Test the encoded push frames."""
+
+    def test_frame_matches_consumer_encoding(self):
+        """Test the frame carries the same JSON the consumer used to build."""
+        push = {'type': 'transaction_message', 'data': {'id': '1', 'amount': 10.5, 'ledger': [{'id': '2'}], 'none': None}}
+
+        self.assertEqual(json.loads(encode_frame(push)), json.loads(json.dumps({"message": push})))
+
+    def test_consumer_forwards_frame_unchanged(self):
+        """Test the consumer sends the producer's frame as is."""
+        consumer = CoreConsumer()
+        consumer.send = AsyncMock()
+        frame = encode_frame({'type': 'transaction_message', 'data': {}})
+
+        async_to_sync(consumer.transaction_message)({'type': 'transaction_message', 'text': frame})
+
+        consumer.send.assert_awaited_once_with(text_data=frame)
+
+    @override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+    def test_send_user_message(self):
+        """Test a push reaches the user's group as an encoded frame."""
+        channel_layer = get_channel_layer()
+        channel_name = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)('user_7', channel_name)
+
+        send_user_message(7, {'type': 'transaction_message', 'data': {'id': '1'}}, channel_layer)
+
+        event = async_to_sync(channel_layer.receive)(channel_name)
+        self.assertEqual(event['type'], 'transaction_message')
+        self.assertEqual(json.loads(event['text']), {'seq': event['seq'], 'message': {'type': 'transaction_message', 'data': {'id': '1'}}})
+
+    def test_benchmark_command(self):
+        """Test the encoding benchmark reports CPU per push."""
+        out = StringIO()
+
+        call_command('benchmark_push_encoding', '--members', '3', '--iterations', '2', stdout=out)
+
+        self.assertIn('6 pushes delivered', out.getvalue())
+        self.assertIn('us CPU per push', out.getvalue())
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class GroupPushEncodingTests(TestCase):
+    """Test group pushes are encoded once for all members."""
+
+    def test_group_activity_encoded_once(self):
+        owner = create_user('owner@example.com')
+        members = [create_user(f'member{i}@example.com') for i in range(4)]
+        group = Group.objects.create(group_name='Trip', created_by=owner, group_type='trip')
+        GroupParticipant.objects.bulk_create([
+            GroupParticipant(group=group, user=user, role='user') for user in [owner, *members]
+        ])
+        activity = Activity.objects.create(user_id=owner, group_id=group, activity_type=ActivityType.GROUP_CREATED)
+        with patch('activity.signals.deliver_activity'):
+            activity.related_users_ids.add(owner, *members)
+
+        with patch('activity.fanout.encode_frame', wraps=encode_frame) as encode:
+            sent = deliver_activity(activity)
+
+        self.assertEqual(sent, 5)
+        self.assertEqual(encode.call_count, 1)
@@ -0,0 +1,184 @@
+"""
+Test for numbered pushes and WebSocket resume.
+"""
+import json
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, override_settings
+from core.consumers import CoreConsumer
+from core.push import encode_frame, send_user_frame, send_user_message
+from core.replay import InMemoryReplayBuffer
+from core.tests.utils import IN_MEMORY_CHANNEL_LAYERS
+
+
+def push(n):
+    return {'type': 'transaction_message', 'data': {'n': n}}
+
+
+class InMemoryReplayBufferTests(SimpleTestCase):
+    """Test the in-memory replay buffer."""
+
+    def setUp(self):
+        self.buffer = InMemoryReplayBuffer(max_len=3)
+        for n in range(1, 6):
+            self.buffer.append(7, encode_frame(push(n)))
+
+    def test_pushes_numbered_per_user(self):
+        """Test sequence numbers are per user and put in the frame."""
+        seq, frame = self.buffer.append(8, encode_frame(push(1)))
+
+        self.assertEqual(seq, 1)
+        self.assertEqual(json.loads(frame), {'seq': 1, 'message': push(1)})
+        self.assertEqual(self.buffer.append(7, encode_frame(push(6)))[0], 6)
+
+    def test_keyed_push_numbered_once(self):
+        """Test appending a push again with its key returns its first number and keeps it once."""
+        first = self.buffer.append(8, encode_frame(push(1)), key='activity:1')
+        again = self.buffer.append(8, encode_frame(push(1)), key='activity:1')
+
+        self.assertEqual(again, first)
+        self.assertEqual(self.buffer.read_since(8, 0).frames, [first[1]])
+        self.assertEqual(self.buffer.append(9, encode_frame(push(1)), key='activity:1')[0], 1)
+
+    def test_read_since(self):
+        """Test only pushes after the given sequence number are replayed."""
+        result = self.buffer.read_since(7, 3)
+
+        self.assertFalse(result.truncated)
+        self.assertEqual(result.last_seq, 5)
+        self.assertEqual([json.loads(frame)['seq'] for frame in result.frames], [4, 5])
+
+    def test_read_since_oldest_kept(self):
+        """Test resuming right before the oldest kept push is not a resync."""
+        result = self.buffer.read_since(7, 2)
+
+        self.assertFalse(result.truncated)
+        self.assertEqual(len(result.frames), 3)
+
+    def test_up_to_date_client(self):
+        """Test a client that saw every push gets nothing."""
+        result = self.buffer.read_since(7, 5)
+
+        self.assertEqual(result, ([], 5, False))
+
+    def test_evicted_pushes_truncated(self):
+        """Test missing pushes that were evicted call for a resync."""
+        self.assertTrue(self.buffer.read_since(7, 1).truncated)
+
+    def test_numbering_restarted_truncated(self):
+        """Test a client ahead of the buffer, whose numbering restarted, is resynced."""
+        self.assertTrue(self.buffer.read_since(7, 9).truncated)
+        self.assertFalse(self.buffer.read_since(9, 0).truncated)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ResumeTests(SimpleTestCase):
+    """Test resuming a WebSocket from the replay buffer."""
+
+    def setUp(self):
+        self.buffer = InMemoryReplayBuffer(max_len=3)
+        for target, value in [('core.replay._replay_buffer.instance', self.buffer), ('core.workers._consumer_pool.instance', None)]:
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(CoreConsumer.as_asgi(), '/ws/socket')
+        communicator.scope['user'] = SimpleNamespace(is_authenticated=True, id=1)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive(self, communicator):
+        return json.loads(await communicator.receive_from(timeout=5))
+
+    async def send_pushes(self, count):
+        for n in range(count):
+            await sync_to_async(send_user_message)(1, push(n))
+
+    async def test_send_user_frame_numbers_push(self):
+        """Test pushes reach the socket with their sequence number."""
+        communicator = await self.connect()
+
+        await sync_to_async(send_user_frame)(1, encode_frame(push(1)))
+
+        self.assertEqual(await self.receive(communicator), {'seq': 1, 'message': push(1)})
+        await communicator.disconnect()
+
+    async def test_resume_replays_missed_pushes(self):
+        """Test a resumed socket gets the pushes after its last sequence number, then live ones."""
+        await self.send_pushes(3)
+        communicator = await self.connect()
+
+        await communicator.send_to(text_data=json.dumps({'action': 'resume', 'last_seq': 1, 'request_id': 'r'}))
+
+        self.assertEqual([(await self.receive(communicator))['seq'] for _ in range(2)], [2, 3])
+        reply = await self.receive(communicator)
+        self.assertEqual(reply['message'], {'type': 'resumed', 'replayed': 2, 'seq': 3})
+        self.assertEqual(reply['request_id'], 'r')
+
+        await self.send_pushes(1)
+        self.assertEqual((await self.receive(communicator))['seq'], 4)
+        await communicator.disconnect()
+
+    async def test_replayed_pushes_not_sent_twice(self):
+        """Test a live push already covered by the replay is dropped."""
+        await self.send_pushes(2)
+        communicator = await self.connect()
+        await communicator.send_to(text_data=json.dumps({'action': 'resume', 'last_seq': 0}))
+        for _ in range(3):
+            await self.receive(communicator)
+
+        late_frame = self.buffer.read_since(1, 1).frames[0]
+        await get_channel_layer().group_send('user_1', {'type': 'transaction_message', 'text': late_frame, 'seq': 2})
+        await self.send_pushes(1)
+
+        self.assertEqual((await self.receive(communicator))['seq'], 3)
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_resume_after_truncation_requires_resync(self):
+        """Test resuming from an evicted push asks for a full resync instead of replaying."""
+        await self.send_pushes(5)
+        communicator = await self.connect()
+
+        await communicator.send_to(text_data=json.dumps({'action': 'resume', 'last_seq': 1}))
+
+        self.assertEqual((await self.receive(communicator))['message'], {'type': 'resync_required', 'seq': 5})
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_invalid_sequence_rejected(self):
+        """Test a resume without a valid sequence number is rejected."""
+        communicator = await self.connect()
+
+        await communicator.send_to(text_data=json.dumps({'action': 'resume', 'last_seq': 'x'}))
+
+        self.assertEqual((await self.receive(communicator))['response_key'], 'ERR_INVALID_SEQUENCE')
+        await communicator.disconnect()
+
+    async def test_concurrent_resume_rejected(self):
+        """Test a resume sent while another replays is rejected, and the first one still gets its pushes."""
+        await self.send_pushes(2)
+        communicator = await self.connect()
+        read_since = self.buffer.read_since
+
+        def slow_read_since(*args, **kwargs):
+            time.sleep(0.2)
+            return read_since(*args, **kwargs)
+
+        with patch.object(self.buffer, 'read_since', slow_read_since):
+            await communicator.send_to(text_data=json.dumps({'action': 'resume', 'last_seq': 0, 'request_id': 1}))
+            await communicator.send_to(text_data=json.dumps({'action': 'resume', 'last_seq': 0, 'request_id': 2}))
+            rejected = await self.receive(communicator)
+            replies = [await self.receive(communicator) for _ in range(3)]
+
+        self.assertEqual((rejected['response_key'], rejected['request_id']), ('ERR_RESUME_IN_PROGRESS', 2))
+        self.assertEqual([reply.get('seq') for reply in replies[:2]], [1, 2])
+        self.assertEqual((replies[2]['message']['type'], replies[2]['request_id']), ('resumed', 1))
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
@@ -0,0 +1,77 @@
+"""
+Test for the consumer worker pool.
+"""
+import asyncio
+import threading
+from unittest.mock import patch
+from django.test import SimpleTestCase
+from core.consumers import CoreConsumer
+from core.workers import ConsumerPoolBusy, ConsumerWorkerPool
+
+
+async def wait_until(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Condition not reached")
+
+
+class ConsumerWorkerPoolTests(SimpleTestCase):
+    """Test the bounded consumer worker pool."""
+
+    async def test_runs_on_pool_thread(self):
+        """Test calls run on the pool's own threads and return their result."""
+        pool = ConsumerWorkerPool(max_workers=2, max_queue=10, max_in_flight=4)
+
+        name = await pool.run(lambda: threading.current_thread().name, owner='a')
+
+        self.assertTrue(name.startswith('consumer-worker'))
+        self.assertEqual(pool.get_stats()['completed'], 1)
+
+    async def test_full_queue_rejects(self):
+        """Test calls beyond the queue size are rejected and queue depth and waits are reported."""
+        pool = ConsumerWorkerPool(max_workers=1, max_queue=1, max_in_flight=4)
+        gate = threading.Event()
+
+        running = asyncio.ensure_future(pool.run(gate.wait, owner='a'))
+        await wait_until(lambda: pool.get_stats()['running'] == 1)
+        queued = asyncio.ensure_future(pool.run(lambda: 'queued', owner='b'))
+        await wait_until(lambda: pool.get_stats()['queued'] == 1)
+
+        with self.assertRaises(ConsumerPoolBusy):
+            await pool.run(lambda: 'rejected', owner='c')
+
+        gate.set()
+        self.assertEqual(await queued, 'queued')
+        await running
+        stats = pool.get_stats()
+        self.assertEqual((stats['queued'], stats['running'], stats['completed'], stats['rejected']), (0, 0, 2, 1))
+        self.assertGreater(stats['max_wait_ms'], 0)
+
+    async def test_in_flight_limit_per_connection(self):
+        """Test one connection cannot take more than its in-flight allowance."""
+        pool = ConsumerWorkerPool(max_workers=4, max_queue=10, max_in_flight=1)
+        gate = threading.Event()
+
+        first = asyncio.ensure_future(pool.run(gate.wait, owner='a'))
+        await wait_until(lambda: pool.get_stats()['running'] == 1)
+
+        with self.assertRaises(ConsumerPoolBusy):
+            await pool.run(lambda: None, owner='a')
+        self.assertEqual(await pool.run(lambda: 'other', owner='b'), 'other')
+
+        gate.set()
+        await first
+        self.assertEqual(await pool.run(lambda: 'again', owner='a'), 'again')
+        self.assertEqual(pool.in_flight, {})
+
+    async def test_consumer_answers_busy(self):
+        """Test the consumer replies with a busy error when the pool is full."""
+        consumer = CoreConsumer()
+        consumer.channel_name = 'specific.test!1'
+
+        with patch('core.consumers.get_consumer_pool', return_value=ConsumerWorkerPool(max_workers=1, max_queue=0, max_in_flight=1)):
+            response = await consumer.run_command(consumer.handle_add_transaction, {})
+
+        self.assertEqual(response['response_key'], 'ERR_SERVER_BUSY')
@@ -0,0 +1,11 @@
+"""
+Helpers shared by the tests of all apps.
+"""
+from django.contrib.auth import get_user_model
+
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+def create_user(email, password=None):
+    """Create and return new user."""
+    return get_user_model().objects.create_user(email=email, password=password, name=email)
@@ -0,0 +1,137 @@
+"""
+Bounded thread pool for the database work of WebSocket consumers
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+from core.backends import ProcessInstance
+
+logger = logging.getLogger(__name__)
+
+
+class ConsumerPoolBusy(Exception):
+    """Raised when the pool queue, or the caller's in-flight allowance, is full."""
+
+
+class ConsumerWorkerPool:
+    """
+    Runs blocking consumer work on a dedicated, fixed-size thread pool.
+
+    Bare `sync_to_async` funnels every call from every socket of the process
+    through one thread. Here work runs on `max_workers` threads, at most
+    `max_queue` calls wait for a thread and each connection may have at most
+    `max_in_flight` calls queued or running. Calls over those limits are
+    rejected with `ConsumerPoolBusy` instead of queueing without bound.
+    """
+
+    def __init__(self, max_workers, max_queue, max_in_flight):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_in_flight = max_in_flight
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="consumer-worker")
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def get_stats(self) -> dict:
+        """Queue depth, load and wait times of the pool."""
+        with self.lock:
+            return {
+                "workers": self.max_workers,
+                "running": self.running,
+                "queued": self.queued,
+                "max_queue": self.max_queue,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": self.total_wait_ms / self.completed if self.completed else 0.0,
+                "max_wait_ms": self.max_wait_ms,
+            }
+
+    def reserve(self, owner) -> None:
+        """Take a queue slot for a call of `owner`, or raise ConsumerPoolBusy."""
+        with self.lock:
+            if self.queued >= self.max_queue or self.in_flight.get(owner, 0) >= self.max_in_flight:
+                self.rejected += 1
+                queued, owner_in_flight = self.queued, self.in_flight.get(owner, 0)
+                busy = True
+            else:
+                self.queued += 1
+                self.in_flight[owner] = self.in_flight.get(owner, 0) + 1
+                busy = False
+        if busy:
+            logger.warning("Consumer pool busy: %d queued, %d in flight for %s", queued, owner_in_flight, owner)
+            raise ConsumerPoolBusy()
+
+    def release(self, owner) -> None:
+        with self.lock:
+            remaining = self.in_flight.get(owner, 1) - 1
+            if remaining:
+                self.in_flight[owner] = remaining
+            else:
+                self.in_flight.pop(owner, None)
+
+    async def run(self, func, *args, owner=None, **kwargs):
+        """
+        Run `func` on the pool and return its result.
+
+        Args:
+            func (callable): Blocking function, free to use the database.
+            owner (str): Connection the call is made for, its channel name for consumers.
+
+        Raises:
+            ConsumerPoolBusy: If the queue or the owner's in-flight allowance is full.
+        """
+        self.reserve(owner)
+        enqueued_at = time.monotonic()
+        dequeued = [False]
+
+        def dequeue() -> bool:
+            # Leaves the queue exactly once, when a thread picks the call up or the caller gives up on it
+            if dequeued[0]:
+                return False
+            dequeued[0] = True
+            self.queued -= 1
+            return True
+
+        def timed(*args, **kwargs):
+            wait_ms = (time.monotonic() - enqueued_at) * 1000
+            with self.lock:
+                dequeue()
+                self.running += 1
+                self.total_wait_ms += wait_ms
+                self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+                queued = self.queued
+            logger.debug("Consumer call %s waited %.1f ms, %d still queued", func.__name__, wait_ms, queued)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        try:
+            return await DatabaseSyncToAsync(timed, thread_sensitive=False, executor=self.executor)(*args, **kwargs)
+        finally:
+            with self.lock:
+                dequeue()
+            self.release(owner)
+
+
+_consumer_pool = ProcessInstance(lambda: ConsumerWorkerPool(
+    max_workers=settings.CONSUMER_WORKER_THREADS,
+    max_queue=settings.CONSUMER_WORKER_QUEUE_SIZE,
+    max_in_flight=settings.CONSUMER_MAX_IN_FLIGHT,
+))
+
+
+def get_consumer_pool() -> ConsumerWorkerPool:
+    """Get the consumer pool of this process, sized by the CONSUMER_WORKER_* settings."""
+    return _consumer_pool.get()
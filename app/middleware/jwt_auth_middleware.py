@@ -1,42 +1,171 @@
+import asyncio
+import copy
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
 from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from rest_framework_simplejwt.tokens import AccessToken
 from django.contrib.auth import get_user_model
+from core.backends import ProcessInstance
 
 
 User = get_user_model()
 
+# Browsers cannot set headers on a WebSocket, they send `Sec-WebSocket-Protocol: access_token, <token>` instead
+TOKEN_SUBPROTOCOL = 'access_token'
+TOKEN_QUERY_PARAM = 'token'
+
+
+class UserCache:
+    """
+    Users resolved by socket handshakes, kept for `ttl` seconds.
+
+    Holds at most `max_size` users, evicting the least recently used, so a
+    reconnect storm after a deploy reads each user from the database once.
+    Handshakes of a user that is being read wait for that read instead of
+    starting their own. Entries are dropped when the user is saved, see core.signals.
+    """
+
+    def __init__(self, max_size=10000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.users = OrderedDict()
+        # Reads in progress, only touched from the event loop
+        self.loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def get(self, user_id):
+        """Get a cached user, None when it is not cached or has expired."""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.users.get(user_id)
+            if entry is None or entry[0] <= now:
+                self.users.pop(user_id, None)
+                self.misses += 1
+                return None
+            self.users.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user_id, user) -> None:
+        with self.lock:
+            self.users[user_id] = (time.monotonic() + self.ttl, user)
+            self.users.move_to_end(user_id)
+            while len(self.users) > self.max_size:
+                self.users.popitem(last=False)
+
+    async def load(self, user_id):
+        """Read a user from the database and cache it, None when it does not exist."""
+        if not self.max_size:
+            self.loads += 1
+            return await load_user(user_id)
+        task = self.loading.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(load_user(user_id))
+            self.loads += 1
+            self.loading[user_id] = task
+            task.add_done_callback(lambda _: self.loading.pop(user_id, None))
+        # Shielded, so a handshake that is cancelled does not cancel the read the others wait for
+        user = await asyncio.shield(task)
+        if user is not None:
+            self.set(user_id, user)
+        return user
+
+    def invalidate(self, user_id) -> None:
+        with self.lock:
+            self.users.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.users.clear()
+            self.hits = self.misses = self.loads = 0
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "size": len(self.users),
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+            }
+
+
+_user_cache = ProcessInstance(lambda: UserCache(settings.WEBSOCKET_USER_CACHE_SIZE, settings.WEBSOCKET_USER_CACHE_TTL))
+
+
+def get_user_cache() -> UserCache:
+    """Get the user cache of this process, sized by the WEBSOCKET_USER_CACHE_* settings."""
+    return _user_cache.get()
+
 
 @database_sync_to_async
-def get_user(token):
+def load_user(user_id):
+    return User.objects.filter(id=user_id).first()
+
+
+async def get_user(token, user_cache=None):
     try:
         validated_token = AccessToken(token)
         user_id = validated_token['user_id']
-        return User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        return AnonymousUser()
     except Exception:
         return AnonymousUser()
 
+    if user_cache is None:
+        user_cache = get_user_cache()
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await user_cache.load(user_id)
+        if user is None:
+            return AnonymousUser()
+    # Every socket gets its own instance, the cached one is shared
+    return copy.copy(user)
+
+
+def get_token(scope):
+    """
+    Get the access token of a socket handshake.
+
+    Read from the Authorization header, else from the subprotocols
+    `access_token, <token>`, else from the `token` query parameter.
+    Query strings end up in access logs, so clients should prefer the first two.
+    """
+    headers = {key.lower(): value for key, value in dict(scope['headers']).items()}
+
+    auth_header = headers.get(b'authorization', None)
+    if auth_header:
+        try:
+            return auth_header.decode().split(' ')[1]
+        except IndexError:
+            return None
+
+    subprotocols = scope.get('subprotocols') or []
+    if len(subprotocols) > 1 and subprotocols[0] == TOKEN_SUBPROTOCOL:
+        return subprotocols[1]
+
+    query = parse_qs(scope.get('query_string', b'').decode())
+    return query.get(TOKEN_QUERY_PARAM, [None])[0]
+
 
 class JwtAuthMiddleware(BaseMiddleware):
+    def __init__(self, inner, user_cache=None):
+        super().__init__(inner)
+        # The process-wide cache unless one is given
+        self.user_cache = user_cache
+
     async def __call__(self, scope, receive, send):
         if scope['type'] != 'websocket':
             return await super().__call__(scope, receive, send)
 
-        headers = {key.lower(): value for key, value in dict(scope['headers']).items()}
-        token = None
-
-        auth_header = headers.get(b'authorization', None)
-        if auth_header:
-            try:
-                token = auth_header.decode().split(' ')[1]
-            except IndexError:
-                token = None
-
+        token = get_token(scope)
         if token:
-            scope['user'] = await get_user(token)
+            scope['user'] = await get_user(token, self.user_cache)
         else:
             scope['user'] = AnonymousUser()
 
@@ -0,0 +1,117 @@
+"""
+Rendering and sending of OTP emails in Celery workers
+"""
+import logging
+import threading
+from functools import lru_cache
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+from django.utils.html import strip_tags
+from core.backends import ProcessInstance
+
+logger = logging.getLogger(__name__)
+
+OTP_EMAIL_SUBJECT = 'Verification Code for Splitemate'
+
+
+@lru_cache(maxsize=1)
+def get_otp_template():
+    """Load the OTP email template once per process."""
+    return get_template('emails/otp_email.html')
+
+
+def build_otp_message(otp) -> EmailMultiAlternatives:
+    """
+    Render the email sending an OTP to its user.
+
+    Args:
+        otp (OTP): The OTP, with its user loaded.
+
+    Returns:
+        EmailMultiAlternatives: The message, with a plain text body and an HTML alternative.
+    """
+    html_message = get_otp_template().render({
+        'user': otp.user,
+        'otp_code': otp.code,
+        'otp_expiry': otp.get_otp_lifespan()
+    })
+    message = EmailMultiAlternatives(
+        OTP_EMAIL_SUBJECT,
+        strip_tags(html_message),
+        f"Splitemate <{settings.DEFAULT_FROM_EMAIL}>",
+        [otp.user.email]
+    )
+    message.attach_alternative(html_message, 'text/html')
+    return message
+
+
+class OTPMailer:
+    """
+    Sends the OTP emails of a worker process over one connection kept open between tasks.
+
+    Messages are handed to the email backend before `send` returns, so the
+    task sending them only succeeds once the server accepted them. When the
+    server dropped the idle connection, the send is tried once more on a new
+    one, and the error of that second try is raised for the task to retry.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def send(self, messages) -> int:
+        """
+        Send messages on the pooled connection.
+
+        Args:
+            messages (list[EmailMessage]): The messages to send.
+
+        Returns:
+            int: Number of messages sent.
+        """
+        with self.lock:
+            try:
+                sent = self.get_connection().send_messages(messages)
+            except Exception:
+                logger.warning("Sending %d OTP emails failed, reconnecting", len(messages), exc_info=True)
+                self.close()
+                try:
+                    sent = self.get_connection().send_messages(messages)
+                except Exception:
+                    self.close()
+                    raise
+        return sent or 0
+
+    def get_connection(self):
+        if self.connection is None:
+            connection = get_connection(fail_silently=False)
+            connection.open()
+            self.connection = connection
+        return self.connection
+
+    def close(self) -> None:
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                logger.debug("Closing the email connection failed", exc_info=True)
+            self.connection = None
+
+
+_otp_mailer = ProcessInstance(OTPMailer)
+
+
+def get_otp_mailer() -> OTPMailer:
+    """Get the OTP mailer of this process."""
+    return _otp_mailer.get()
+
+
+@worker_process_shutdown.connect
+def close_otp_mailer(**kwargs) -> None:
+    """Close the email connection when a worker process stops."""
+    mailer = _otp_mailer.instance
+    if mailer is not None:
+        with mailer.lock:
+            mailer.close()
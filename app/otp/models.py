@@ -1,13 +1,14 @@
 import string
 import secrets
 from otp.exceptions import OTPCreationLimitExceeded
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from otp.tasks import send_otp_email
+from otp.store import get_otp_store
+from otp.tasks import record_otp, mark_otp_used
+
+OTP_REQUEST_WINDOW = 60 * 60  # Seconds of the window OTP_HOURLY_LIMIT applies to
 
 
 class OTPRequestReason(models.TextChoices):
@@ -51,43 +52,36 @@ class OTP(models.Model):
 
     @staticmethod
     def can_request_otp(user):
-        last_hour = timezone.now() - timedelta(hours=1)
-        otp_count = OTP.objects.filter(user=user, created_at__gte=last_hour).count()
-        return otp_count < OTP.get_hourly_limit()
-
-    @staticmethod
-    def queue_send_otp_email(user, otp):
-        subject = 'Verification Code for Splitemate'
-        context = {
-            'user': user,
-            'otp_code': otp.code,
-            'otp_expiry': OTP.get_otp_lifespan()
-        }
-        html_message = render_to_string('emails/otp_email.html', context)
-        plain_message = strip_tags(html_message)
-        recipient_list = [user.email]
-        send_otp_email.delay(subject, plain_message, html_message, recipient_list)
+        return get_otp_store().can_request(user.id, OTP.get_hourly_limit(), OTP_REQUEST_WINDOW)
 
     @staticmethod
     def create_or_resend_otp(user, reason):
-        OTP.clean_old_otps(user)
-        if not OTP.can_request_otp(user):
-            raise OTPCreationLimitExceeded
+        """
+        Send the user an OTP for the reason, the one already sent while it is valid.
 
-        latest_otp = OTP.objects.filter(user=user, reason=reason, is_used=False).order_by('-created_at').first()
-        if latest_otp and not latest_otp.is_expired():
-            code = latest_otp.code
-        else:
-            code = OTP.generate_otp()
-        expires_at = timezone.now() + timedelta(minutes=OTP.get_otp_lifespan())
-        otp = OTP.objects.create(
-            user=user,
-            reason=reason,
-            code=code,
-            expires_at=expires_at
+        The limit and the code live in the OTP store, the row is only an audit
+        record written by a task once the request commits, which then renders
+        and sends the email in the worker.
+        """
+        lifespan = OTP.get_otp_lifespan()
+        code = get_otp_store().issue(
+            user.id, reason, OTP.generate_otp(), lifespan * 60, OTP.get_hourly_limit(), OTP_REQUEST_WINDOW
         )
-        OTP.queue_send_otp_email(user, otp)
+        if code is None:
+            raise OTPCreationLimitExceeded
+
+        otp = OTP(user=user, reason=reason, code=code, expires_at=timezone.now() + timedelta(minutes=lifespan))
+        expires_at = otp.expires_at.isoformat()
+        transaction.on_commit(lambda: record_otp.delay(user.id, reason, code, expires_at))
         return otp
 
+    @staticmethod
+    def verify_otp(user, code, reason):
+        """Check an OTP sent by the user, and use it up when it is valid."""
+        if not get_otp_store().consume(user.id, reason, code):
+            return False
+        transaction.on_commit(lambda: mark_otp_used.delay(user.id, reason, code))
+        return True
+
     def __str__(self):
         return self.code
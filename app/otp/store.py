@@ -0,0 +1,148 @@
+"""
+Rate limit and codes of OTP requests, kept out of the database
+"""
+import secrets
+import threading
+import time
+from collections import deque
+import redis
+from core.backends import ProcessInstance, load_backend
+
+
+class InMemoryOTPStore:
+    """
+    OTP store kept in process memory.
+
+    Each process counts requests and keeps codes on its own, so the hourly
+    limit applies per process and a code sent through one process cannot be
+    validated by another. Enough for tests and `runserver`.
+    """
+
+    def __init__(self, **kwargs):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.codes = {}
+
+    def prune(self, user_id, now, window) -> deque:
+        requests = self.requests.setdefault(user_id, deque())
+        while requests and requests[0] <= now - window:
+            requests.popleft()
+        return requests
+
+    def issue(self, user_id, reason, new_code, lifespan, limit, window):
+        """
+        Count an OTP request of a user in its sliding window, and get the code to send.
+
+        The code already sent for the reason is sent again while it is valid,
+        and is then valid for `lifespan` seconds from now.
+
+        Args:
+            user_id (int): The user requesting the OTP.
+            reason (str): The OTPRequestReason of the request.
+            new_code (str): The code to send when there is no valid one.
+            lifespan (int): Seconds the code is valid.
+            limit (int): Requests allowed per window.
+            window (int): Seconds of the sliding window.
+
+        Returns:
+            str: The code to send, None when the user is over the limit.
+        """
+        now = time.time()
+        with self.lock:
+            requests = self.prune(user_id, now, window)
+            if len(requests) >= limit:
+                return None
+            requests.append(now)
+            entry = self.codes.get((user_id, reason))
+            code = entry[0] if entry and entry[1] > now else new_code
+            self.codes[(user_id, reason)] = (code, now + lifespan)
+            return code
+
+    def can_request(self, user_id, limit, window) -> bool:
+        """Whether a user is under the limit of requests in its sliding window."""
+        with self.lock:
+            return len(self.prune(user_id, time.time(), window)) < limit
+
+    def consume(self, user_id, reason, code) -> bool:
+        """
+        Check the code a user sent for a reason, and make it unusable when it is valid.
+
+        Returns:
+            bool: Whether the code was valid.
+        """
+        with self.lock:
+            entry = self.codes.get((user_id, reason))
+            if entry is None or entry[1] <= time.time() or not secrets.compare_digest(entry[0], code):
+                return False
+            del self.codes[(user_id, reason)]
+            return True
+
+
+class RedisOTPStore:
+    """
+    OTP store kept in Redis.
+
+    Requests of a user are a sorted set of their times, codes are keys that
+    expire with them. Each call is one script, so concurrent requests of a
+    user cannot both pass the limit or send different codes.
+    """
+
+    ISSUE_SCRIPT = """
+        local now = tonumber(ARGV[1])
+        local window = tonumber(ARGV[2])
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+        if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+            return false
+        end
+        redis.call('ZADD', KEYS[1], now, ARGV[6])
+        redis.call('EXPIRE', KEYS[1], window)
+        local code = redis.call('GET', KEYS[2]) or ARGV[4]
+        redis.call('SET', KEYS[2], code, 'EX', ARGV[5])
+        return code
+    """
+
+    CONSUME_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            redis.call('DEL', KEYS[1])
+            return 1
+        end
+        return 0
+    """
+
+    def __init__(self, url, **kwargs):
+        self.client = redis.Redis.from_url(url)
+        self.issue_script = self.client.register_script(self.ISSUE_SCRIPT)
+        self.consume_script = self.client.register_script(self.CONSUME_SCRIPT)
+
+    @staticmethod
+    def get_requests_key(user_id) -> str:
+        return f"otp:{user_id}:requests"
+
+    @staticmethod
+    def get_code_key(user_id, reason) -> str:
+        return f"otp:{user_id}:code:{reason}"
+
+    def issue(self, user_id, reason, new_code, lifespan, limit, window):
+        """Count an OTP request and get the code to send, see InMemoryOTPStore.issue."""
+        now = time.time()
+        code = self.issue_script(
+            keys=[self.get_requests_key(user_id), self.get_code_key(user_id, reason)],
+            args=[now, window, limit, new_code, lifespan, f"{now}:{secrets.token_hex(4)}"]
+        )
+        return code.decode() if code is not None else None
+
+    def can_request(self, user_id, limit, window) -> bool:
+        """Whether a user is under the limit of requests in its sliding window."""
+        return self.client.zcount(self.get_requests_key(user_id), f"({time.time() - window}", '+inf') < limit
+
+    def consume(self, user_id, reason, code) -> bool:
+        """Check the code a user sent and make it unusable when it is valid, see InMemoryOTPStore.consume."""
+        return bool(self.consume_script(keys=[self.get_code_key(user_id, reason)], args=[code]))
+
+
+_otp_store = ProcessInstance(lambda: load_backend('OTP_STORE'))
+
+
+def get_otp_store():
+    """Get the OTP store of this process, built from the OTP_STORE setting."""
+    return _otp_store.get()
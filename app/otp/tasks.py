@@ -1,15 +1,50 @@
+from smtplib import SMTPException
 from celery import shared_task
-from django.core.mail import send_mail
-from django.conf import settings
-
-
-@shared_task(bind=True)
-def send_otp_email(self, subject, plain_message, html_message, recipient_list):
-    from_email = f"Splitemate <{settings.DEFAULT_FROM_EMAIL}>"
-    send_mail(
-        subject,
-        plain_message,
-        from_email,
-        recipient_list,
-        html_message=html_message
+from django.utils.dateparse import parse_datetime
+from otp.mailer import build_otp_message, get_otp_mailer
+
+
+# Acknowledged once the email is handed to the server, so a worker lost mid-task redelivers it
+@shared_task(
+    bind=True, acks_late=True, reject_on_worker_lost=True,
+    autoretry_for=(SMTPException, OSError), max_retries=5, retry_backoff=True
+)
+def send_otp_email(self, user_id, otp_id):
+    """Render the email of an OTP and send it on the worker's pooled connection."""
+    from otp.models import OTP
+
+    otp = OTP.objects.select_related('user').filter(id=otp_id, user_id=user_id).first()
+    if otp is None:
+        return
+    get_otp_mailer().send([build_otp_message(otp)])
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def record_otp(user_id, reason, code, expires_at):
+    """
+    Keep the audit row of an OTP sent from the OTP store, delete the expired ones of the user, and send it.
+
+    A redelivered task finds the row it already wrote and does not send the email again.
+    """
+    from otp.models import OTP
+
+    OTP.clean_old_otps(user_id)
+    otp, created = OTP.objects.get_or_create(
+        user_id=user_id, reason=reason, code=code, expires_at=parse_datetime(expires_at)
     )
+    if created:
+        send_otp_email.delay(user_id, otp.id)
+
+
+@shared_task(bind=True, max_retries=5)
+def mark_otp_used(self, user_id, reason, code):
+    """
+    Mark the audit rows of an OTP validated from the OTP store as used.
+
+    The row is written by `record_otp`, which may not have run yet when the
+    code is validated quickly, so the task is retried until it finds the row.
+    """
+    from otp.models import OTP
+
+    if not OTP.objects.filter(user_id=user_id, reason=reason, code=code, is_used=False).update(is_used=True):
+        raise self.retry(countdown=2 ** self.request.retries)
@@ -0,0 +1,96 @@
+"""
+Test for OTP emails rendered and sent in the worker.
+"""
+from datetime import timedelta
+from unittest.mock import Mock, patch
+from smtplib import SMTPServerDisconnected
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from otp.mailer import OTPMailer, get_otp_template
+from otp.models import OTP
+from otp.tasks import send_otp_email
+from core.tests.utils import create_user
+
+
+def create_otp(user, code='1234'):
+    return OTP.objects.create(user=user, reason='EV', code=code, expires_at=timezone.now() + timedelta(minutes=10))
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OTPMailerTests(TestCase):
+    """Test OTP emails are rendered in the task and sent before it returns, over one connection."""
+
+    def setUp(self):
+        self.user = create_user("user@example.com")
+        self.mailer = OTPMailer()
+        patcher = patch('otp.mailer._otp_mailer.instance', self.mailer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_task_sends_rendered_email(self):
+        """Test the task renders the email of the OTP from its ids and sends it."""
+        otp = create_otp(self.user)
+
+        send_otp_email(self.user.id, otp.id)
+
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox[0]
+        self.assertEqual(message.to, ["user@example.com"])
+        self.assertIn("1234", message.body)
+        self.assertNotIn("<strong>", message.body)
+        self.assertEqual(message.alternatives[0][1], 'text/html')
+        self.assertIn("<strong>1234</strong>", message.alternatives[0][0])
+
+    def test_task_ignores_other_user(self):
+        otp = create_otp(self.user)
+
+        send_otp_email(self.user.id + 1, otp.id)
+
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_connection_reused_between_tasks(self):
+        other = create_user("other@example.com")
+
+        send_otp_email(self.user.id, create_otp(self.user).id)
+        connection = self.mailer.connection
+        send_otp_email(other.id, create_otp(other, '5678').id)
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIs(self.mailer.connection, connection)
+
+    def test_reconnects_once_after_dropped_connection(self):
+        dropped = Mock(send_messages=Mock(side_effect=SMTPServerDisconnected))
+        fresh = Mock(send_messages=Mock(return_value=1))
+        self.mailer.connection = dropped
+
+        with patch('otp.mailer.get_connection', return_value=fresh), self.assertLogs('otp.mailer', 'WARNING'):
+            self.assertEqual(self.mailer.send([Mock()]), 1)
+
+        dropped.close.assert_called_once()
+        fresh.open.assert_called_once()
+        self.assertIs(self.mailer.connection, fresh)
+
+    def test_second_failure_raised(self):
+        """Test an email the server refuses twice fails the send, and the connection is dropped."""
+        broken = Mock(send_messages=Mock(side_effect=SMTPServerDisconnected))
+
+        with patch('otp.mailer.get_connection', return_value=broken), self.assertLogs('otp.mailer', 'WARNING'):
+            with self.assertRaises(SMTPServerDisconnected):
+                self.mailer.send([Mock()])
+
+        self.assertIsNone(self.mailer.connection)
+
+    def test_task_retried_on_smtp_error(self):
+        """Test the task is retried when the email could not be sent, and only succeeds once it was."""
+        otp = create_otp(self.user)
+
+        with patch.object(self.mailer, 'send', side_effect=[SMTPServerDisconnected(), 1]) as send:
+            result = send_otp_email.apply(args=(self.user.id, otp.id))
+
+        self.assertTrue(result.successful())
+        self.assertEqual(send.call_count, 2)
+        self.assertTrue(send_otp_email.acks_late)
+
+    def test_template_loaded_once(self):
+        self.assertIs(get_otp_template(), get_otp_template())
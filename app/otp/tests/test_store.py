@@ -0,0 +1,139 @@
+"""
+Test for OTP requests served from the OTP store.
+"""
+from unittest.mock import patch
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from otp.exceptions import OTPCreationLimitExceeded
+from otp.models import OTP, OTPRequestReason
+from otp.store import InMemoryOTPStore
+from otp.tasks import mark_otp_used, record_otp
+from core.tests.utils import create_user
+
+VALIDATE_OTP_URL = reverse("otp:validate_otp")
+
+
+class InMemoryOTPStoreTests(TestCase):
+    """Test the limit and codes kept by the in-memory store."""
+
+    def setUp(self):
+        self.store = InMemoryOTPStore()
+
+    def test_limit_per_window(self):
+        self.assertEqual(self.store.issue(1, 'EV', '1111', 60, 2, 3600), '1111')
+        self.assertEqual(self.store.issue(1, 'PR', '2222', 60, 2, 3600), '2222')
+
+        self.assertIsNone(self.store.issue(1, 'EV', '3333', 60, 2, 3600))
+        self.assertFalse(self.store.can_request(1, 2, 3600))
+        self.assertTrue(self.store.can_request(2, 2, 3600))
+
+    def test_requests_leave_window(self):
+        """Test requests older than the window no longer count."""
+        self.store.issue(1, 'EV', '1111', 60, 1, 3600)
+
+        with patch('otp.store.time.time', return_value=self.store.requests[1][0] + 3601):
+            self.assertEqual(self.store.issue(1, 'EV', '2222', 60, 1, 3600), '2222')
+
+    def test_valid_code_sent_again(self):
+        self.store.issue(1, 'EV', '1111', 60, 10, 3600)
+
+        self.assertEqual(self.store.issue(1, 'EV', '2222', 60, 10, 3600), '1111')
+
+    def test_code_consumed_once(self):
+        self.store.issue(1, 'EV', '1111', 60, 10, 3600)
+
+        self.assertFalse(self.store.consume(1, 'EV', '0000'))
+        self.assertFalse(self.store.consume(1, 'PR', '1111'))
+        self.assertTrue(self.store.consume(1, 'EV', '1111'))
+        self.assertFalse(self.store.consume(1, 'EV', '1111'))
+
+    def test_expired_code_rejected(self):
+        self.store.issue(1, 'EV', '1111', 60, 10, 3600)
+
+        with patch('otp.store.time.time', return_value=self.store.codes[(1, 'EV')][1]):
+            self.assertFalse(self.store.consume(1, 'EV', '1111'))
+
+
+@patch('otp.tasks.mark_otp_used.delay')
+@patch('otp.tasks.record_otp.delay')
+class OTPRequestTests(TestCase):
+    """Test OTP requests only write audit rows, from tasks."""
+
+    def setUp(self):
+        self.user = create_user("user@example.com")
+        self.store = InMemoryOTPStore()
+        patcher = patch('otp.store._otp_store.instance', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_request_without_queries(self, record_delay, mark_delay):
+        """Test requesting an OTP reads and writes nothing in the database."""
+        with self.assertNumQueries(0), self.captureOnCommitCallbacks(execute=True):
+            otp = OTP.create_or_resend_otp(self.user, OTPRequestReason.EMAIL_VERIFICATION)
+
+        record_delay.assert_called_once_with(self.user.id, 'EV', otp.code, otp.expires_at.isoformat())
+
+    @patch('otp.models.OTP.get_hourly_limit', return_value=1)
+    def test_request_over_limit(self, _, record_delay, mark_delay):
+        OTP.create_or_resend_otp(self.user, OTPRequestReason.EMAIL_VERIFICATION)
+
+        with self.assertRaises(OTPCreationLimitExceeded):
+            OTP.create_or_resend_otp(self.user, OTPRequestReason.EMAIL_VERIFICATION)
+        self.assertFalse(OTP.can_request_otp(self.user))
+
+    @patch('otp.tasks.send_otp_email.delay')
+    def test_audit_row_recorded(self, send_delay, record_delay, mark_delay):
+        """Test the task records the row, then sends its email."""
+        with self.captureOnCommitCallbacks(execute=True):
+            otp = OTP.create_or_resend_otp(self.user, OTPRequestReason.PASSWORD_RESET)
+        record_otp(*record_delay.call_args.args)
+
+        row = OTP.objects.get(user=self.user)
+        self.assertEqual((row.code, row.reason, row.expires_at), (otp.code, 'PR', otp.expires_at))
+        send_delay.assert_called_once_with(self.user.id, row.id)
+
+    @patch('otp.tasks.send_otp_email.delay')
+    def test_redelivered_record_sends_once(self, send_delay, record_delay, mark_delay):
+        """Test a redelivered task keeps one audit row and sends one email."""
+        with self.captureOnCommitCallbacks(execute=True):
+            OTP.create_or_resend_otp(self.user, OTPRequestReason.PASSWORD_RESET)
+        record_otp(*record_delay.call_args.args)
+        record_otp(*record_delay.call_args.args)
+
+        self.assertEqual(OTP.objects.filter(user=self.user).count(), 1)
+        send_delay.assert_called_once()
+
+    @patch('otp.tasks.send_otp_email.delay')
+    def test_used_before_recorded(self, send_delay, record_delay, mark_delay):
+        """Test an OTP validated before its audit row was written is marked used once the row is there."""
+        with self.captureOnCommitCallbacks(execute=True):
+            otp = OTP.create_or_resend_otp(self.user, OTPRequestReason.PASSWORD_RESET)
+
+        def record_then_retry(*args, **kwargs):
+            record_otp(*record_delay.call_args.args)
+            return retry(*args, **kwargs)
+
+        retry = mark_otp_used.retry
+        with patch.object(mark_otp_used, 'retry', side_effect=record_then_retry) as retried:
+            result = mark_otp_used.apply(args=(self.user.id, 'PR', otp.code))
+
+        self.assertTrue(result.successful())
+        retried.assert_called_once()
+        self.assertTrue(OTP.objects.get(user=self.user).is_used)
+
+    def test_validate_code(self, record_delay, mark_delay):
+        """Test a code is validated from the store and used up."""
+        otp = OTP.create_or_resend_otp(self.user, OTPRequestReason.PASSWORD_RESET)
+        client = APIClient()
+        payload = {'email': self.user.email, 'code': otp.code, 'reason': 'PR'}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            res = client.post(VALIDATE_OTP_URL, payload)
+        second = client.post(VALIDATE_OTP_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('token', res.data)
+        self.assertEqual(second.status_code, status.HTTP_404_NOT_FOUND)
+        mark_delay.assert_called_once_with(self.user.id, 'PR', otp.code)
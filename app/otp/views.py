@@ -60,28 +60,25 @@ class OTPValidateView(APIView):
                     user = User.objects.get(email=email)
                 else:
                     user = User.objects.get(id=user_id)
-                otps = OTP.objects.filter(user=user, code=code, reason=reason, is_used=False)
-                for otp in otps:
-                    if otp.is_valid():
-                        otps.update(is_used=True)
-                        responseDict = {'message': 'OTP is valid'}
-                        if reason == "PR":
-                            uid = urlsafe_base64_encode(force_bytes(user.id))
-                            token = PasswordResetTokenGenerator().make_token(user)
-                            responseDict.update({'token': token, 'uid': uid})
-                        elif reason == "EV":
-                            token = Helper.get_tokens_for_user(user=user)
-                            responseDict.update({
-                                'id': str(user.id),
-                                'name': user.name,
-                                'email': user.email,
-                                'image_url': user.image_url,
-                                'tokens': token,
-                                'balance': UserBalance.get_user_balance(user.id)
-                            })
-                            user.is_email_verified = True
-                            user.save()
-                        return Response(responseDict, status=status.HTTP_200_OK)
+                if OTP.verify_otp(user, code, reason):
+                    responseDict = {'message': 'OTP is valid'}
+                    if reason == "PR":
+                        uid = urlsafe_base64_encode(force_bytes(user.id))
+                        token = PasswordResetTokenGenerator().make_token(user)
+                        responseDict.update({'token': token, 'uid': uid})
+                    elif reason == "EV":
+                        token = Helper.get_tokens_for_user(user=user)
+                        responseDict.update({
+                            'id': str(user.id),
+                            'name': user.name,
+                            'email': user.email,
+                            'image_url': user.image_url,
+                            'tokens': token,
+                            'balance': UserBalance.get_user_balance(user.id)
+                        })
+                        user.is_email_verified = True
+                        user.save()
+                    return Response(responseDict, status=status.HTTP_200_OK)
                 return Response({'error': 'Invalid or expired OTP'}, status=status.HTTP_404_NOT_FOUND)
             except User.DoesNotExist:
                 return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from transaction.models import Transaction, TransactionParticipant, UserBalance
+from transaction.models import Transaction, TransactionParticipant, UserBalance, UserBalanceSummary, IdempotencyKey
 
 
 class TransactionParticipantInline(admin.TabularInline):
@@ -59,3 +59,27 @@ class UserBalanceAdmin(admin.ModelAdmin):
 
 
 admin.site.register(UserBalance, UserBalanceAdmin)
+
+
+class UserBalanceSummaryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'total_owed', 'total_due', 'net_balance', 'updated_at')
+    search_fields = ('user__email',)
+    readonly_fields = ('user', 'total_owed', 'total_due', 'net_balance', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.register(UserBalanceSummary, UserBalanceSummaryAdmin)
+
+
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'status_code', 'created_at')
+    search_fields = ('key', 'user__email')
+    readonly_fields = ('user', 'key', 'fingerprint', 'status_code', 'response', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.register(IdempotencyKey, IdempotencyKeyAdmin)
@@ -0,0 +1,141 @@
+"""
+Idempotency keys for transaction writes
+"""
+import hashlib
+from collections import namedtuple
+from datetime import timedelta
+import orjson
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction as db_transaction
+from django.utils import timezone
+from rest_framework.response import Response
+from app.helper import Helper
+from transaction.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+IdempotentResult = namedtuple('IdempotentResult', ['response', 'status_code', 'replayed'])
+
+
+def is_valid_key(key) -> bool:
+    return isinstance(key, str) and 0 < len(key) <= MAX_KEY_LENGTH
+
+
+def get_fingerprint(payload) -> str:
+    """Hash a request payload, so a key reused for a different request is told apart from a retry."""
+    return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS, default=str)).hexdigest()
+
+
+def get_cache_key(user_id, key) -> str:
+    # Client keys are free text, hash them into a key every cache backend accepts
+    return f"idempotency:{user_id}:{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def get_stored_response(user_id, key):
+    """
+    Get the stored response of a key, from the cache or else from the database.
+
+    Rows past IDEMPOTENCY_KEY_TTL are deleted on the way, so the key can be used again.
+
+    Returns:
+        dict: The `fingerprint`, `status_code` and `response` of the key, None when it was not used.
+    """
+    cache_key = get_cache_key(user_id, key)
+    stored = cache.get(cache_key)
+    if stored is not None:
+        return stored
+
+    entry = IdempotencyKey.objects.filter(user_id=user_id, key=key).first()
+    if entry is None:
+        return None
+    if entry.created_at < timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL):
+        entry.delete()
+        return None
+
+    stored = {'fingerprint': entry.fingerprint, 'status_code': entry.status_code, 'response': entry.response}
+    cache.set(cache_key, stored, settings.IDEMPOTENCY_KEY_TTL)
+    return stored
+
+
+def replay(stored, fingerprint) -> IdempotentResult:
+    if stored['fingerprint'] != fingerprint:
+        return IdempotentResult(Helper.format_error_response("ERR_IDEMPOTENCY_KEY_REUSED"), 422, False)
+    return IdempotentResult(stored['response'], stored['status_code'], True)
+
+
+def run_idempotent(user_id, key, payload, handler) -> IdempotentResult:
+    """
+    Run a write once per idempotency key of a user.
+
+    The key is claimed in the database transaction of the write, so a
+    concurrent retry waits on the claim and then replays the committed
+    response. Only successful responses are kept, a failed write can be
+    retried with the same key.
+
+    Args:
+        user_id (int): The user sending the write.
+        key (str): The idempotency key sent by the client.
+        payload (dict): The request payload, a retry must send the same one.
+        handler (callable): Runs the write and returns (response, status_code).
+
+    Returns:
+        IdempotentResult: The response, its status code and whether it was replayed.
+    """
+    fingerprint = get_fingerprint(payload)
+    stored = get_stored_response(user_id, key)
+    if stored is not None:
+        return replay(stored, fingerprint)
+
+    try:
+        with db_transaction.atomic():
+            entry = IdempotencyKey.objects.create(user_id=user_id, key=key, fingerprint=fingerprint)
+            response, status_code = handler()
+            if not 200 <= status_code < 300:
+                entry.delete()
+                return IdempotentResult(response, status_code, False)
+
+            entry.status_code, entry.response = status_code, response
+            entry.save(update_fields=['status_code', 'response'])
+            stored = {'fingerprint': fingerprint, 'status_code': status_code, 'response': response}
+            db_transaction.on_commit(lambda: cache.set(get_cache_key(user_id, key), stored, settings.IDEMPOTENCY_KEY_TTL))
+    except IntegrityError:
+        # A concurrent request claimed the key first and has committed by now
+        stored = get_stored_response(user_id, key)
+        if stored is None:
+            raise
+        return replay(stored, fingerprint)
+
+    return IdempotentResult(response, status_code, False)
+
+
+def idempotent_response(request, create) -> Response:
+    """
+    Answer a write request once per Idempotency-Key header, replaying the first response to retries.
+
+    Requests without the header are handed to `create` as they are.
+
+    Args:
+        request (Request): The write request.
+        create (callable): Handles the request and returns its Response.
+
+    Returns:
+        Response: The response of the write, or of the first request with the same key.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key is None:
+        return create(request)
+    if not is_valid_key(key):
+        return Response(Helper.format_error_response("ERR_INVALID_IDEMPOTENCY_KEY"), status=400)
+
+    def handler():
+        response = create(request)
+        return response.data, response.status_code
+
+    result = run_idempotent(request.user.id, key, request.data, handler)
+    response = Response(result.response, status=result.status_code)
+    if result.replayed:
+        response[REPLAYED_HEADER] = 'true'
+    return response
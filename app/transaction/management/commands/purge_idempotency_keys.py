@@ -0,0 +1,35 @@
+"""
+Django command to purge expired idempotency keys
+"""
+from datetime import timedelta
+from typing import Any
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from transaction.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    """Django command to delete idempotency keys older than IDEMPOTENCY_KEY_TTL"""
+
+    help = "Delete idempotency keys whose responses are no longer replayed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Keys deleted per query."
+        )
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        """Entrypoint for command"""
+        cutoff = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        deleted = 0
+        while True:
+            ids = list(IdempotencyKey.objects.filter(
+                created_at__lt=cutoff
+            ).order_by('created_at').values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency keys."))
@@ -0,0 +1,63 @@
+"""
+Django command to rebuild and verify the per-user balance summary
+"""
+from typing import Any
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from transaction.models import UserBalance, UserBalanceSummary
+
+
+class Command(BaseCommand):
+    """Django command to rebuild UserBalanceSummary from UserBalance rows"""
+
+    help = "Rebuild the per-user balance summary from UserBalance rows, or only verify it with --verify."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help="Only report users whose summary differs from their UserBalance rows."
+        )
+
+    def find_mismatches(self, expected) -> list:
+        """Return (user_id, expected, stored) for every summary that differs from UserBalance."""
+        stored = {
+            summary.user_id: (summary.total_owed, summary.total_due, summary.net_balance)
+            for summary in UserBalanceSummary.objects.all()
+        }
+        mismatches = []
+        for user_id in expected.keys() | stored.keys():
+            owed, due = expected.get(user_id, (0, 0))
+            expected_row = (owed, due, owed - due)
+            stored_row = stored.get(user_id, (0, 0, 0))
+            if expected_row != stored_row:
+                mismatches.append((user_id, expected_row, stored_row))
+        return sorted(mismatches)
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        """Entrypoint for command"""
+        with transaction.atomic():
+            # Keep UserBalance writers out while the totals are compared or rebuilt
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {connection.ops.quote_name(UserBalance._meta.db_table)} IN SHARE MODE")
+
+            expected = UserBalance.calculate_user_balances()
+            mismatches = self.find_mismatches(expected)
+
+            for user_id, expected_row, stored_row in mismatches:
+                self.stdout.write(f"User {user_id}: expected {expected_row}, stored {stored_row}")
+
+            if options['verify']:
+                if mismatches:
+                    raise CommandError(f"{len(mismatches)} balance summaries are out of date.")
+                self.stdout.write(self.style.SUCCESS("All balance summaries are up to date."))
+                return
+
+            UserBalanceSummary.objects.all().delete()
+            UserBalanceSummary.objects.bulk_create([
+                UserBalanceSummary(user_id=user_id, total_owed=owed, total_due=due, net_balance=owed - due)
+                for user_id, (owed, due) in expected.items()
+            ], batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {len(expected)} balance summaries, {len(mismatches)} were out of date."
+        ))
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.14 on 2026-10-18 06:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def populate_user_balance_summary(apps, schema_editor):
+    UserBalance = apps.get_model('transaction', 'UserBalance')
+    UserBalanceSummary = apps.get_model('transaction', 'UserBalanceSummary')
+
+    totals = {}
+    for row in UserBalance.objects.order_by().values('initiator_id').annotate(total=Sum('balance')):
+        totals[row['initiator_id']] = [row['total'], 0]
+    for row in UserBalance.objects.order_by().values('participant_id').annotate(total=Sum('balance')):
+        totals.setdefault(row['participant_id'], [0, 0])[1] = row['total']
+
+    UserBalanceSummary.objects.bulk_create([
+        UserBalanceSummary(user_id=user_id, total_owed=owed, total_due=due, net_balance=owed - due)
+        for user_id, (owed, due) in totals.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_user_image_url'),
+        ('transaction', '0007_userbalance_initiator_not_equal_participant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserBalanceSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_owed', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_due', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('net_balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_user_balance_summary, migrations.RunPython.noop),
+    ]
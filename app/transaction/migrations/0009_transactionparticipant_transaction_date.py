@@ -0,0 +1,39 @@
+# Generated by Django 5.0.14 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+def populate_transaction_date(apps, schema_editor):
+    TransactionParticipant = apps.get_model('transaction', 'TransactionParticipant')
+    Transaction = apps.get_model('transaction', 'Transaction')
+
+    TransactionParticipant.objects.update(
+        transaction_date=models.Subquery(
+            Transaction.objects.filter(id=models.OuterRef('transaction_id')).values('transaction_date')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transaction', '0008_userbalancesummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transactionparticipant',
+            name='transaction_date',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(populate_transaction_date, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='transactionparticipant',
+            name='transaction_date',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='transactionparticipant',
+            index=models.Index(fields=['user', '-transaction_date', '-transaction'], name='participant_history_idx'),
+        ),
+    ]
@@ -43,19 +43,23 @@ class Transaction(models.Model):
         TransactionParticipant.all_objects.filter(transaction=transaction).update(is_active=True)
 
     def save(self, *args, **kwargs):
+        original = None
         if self.pk:
             original = Transaction.all_objects.get(pk=self.pk)
             if original.created_by != self.created_by:
                 raise PermissionError("Only the user who created this transaction can modify it.")
         super(Transaction, self).save(*args, **kwargs)
+        if original and original.transaction_date != self.transaction_date:
+            # Keep the date copied on participants in step for the history index
+            TransactionParticipant.all_objects.filter(transaction=self).update(transaction_date=self.transaction_date)
 
     def get_split_details(self) -> list:
-        """Get split details of a transaction."""
-        participants = TransactionParticipant.objects.filter(transaction=self)
+        """Get split details of a transaction, reusing prefetched participants when available."""
+        participants = self.transactionparticipant_set.all()
         split_details = []
         for participant in participants:
             split_details.append({
-                'user': str(participant.user.id),
+                'user': str(participant.user_id),
                 'amount': float(participant.amount_owed)
             })
         return split_details
@@ -70,12 +74,12 @@ class Transaction(models.Model):
 
     def get_transaction_data(self) -> dict:
         """Get transaction details"""
-        is_group = bool(self.group)
-        group_id = str(self.group.id) if self.group else ""
+        is_group = bool(self.group_id)
+        group_id = str(self.group_id) if self.group_id else ""
 
         data = {
             "id": str(self.id),
-            "payer": str(self.payer.id),
+            "payer": str(self.payer_id),
             "is_group": is_group,
             "group": group_id,
             "total_amount": float(self.total_amount),
@@ -83,7 +87,7 @@ class Transaction(models.Model):
             "description": self.description,
             "transaction_type": self.transaction_type,
             "transaction_date": self.transaction_date.isoformat(),
-            "created_by": str(self.created_by.id),
+            "created_by": str(self.created_by_id),
             "created_at": self.created_at.isoformat(),
             "updated_at": self.updated_at.isoformat(),
             "split_details": self.get_split_details()
@@ -101,10 +105,22 @@ class TransactionParticipant(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=True)
     amount_owed = models.DecimalField(max_digits=10, decimal_places=2)
     is_transaction_sattled = models.BooleanField(default=False)
+    # Copy of Transaction.transaction_date, so a user's history is read from one index
+    transaction_date = models.DateTimeField()
 
     objects = ActiveManager()
     all_objects = models.Manager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-transaction_date', '-transaction'], name='participant_history_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.transaction_date is None:
+            self.transaction_date = self.transaction.transaction_date
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f'{self.user} owes {self.amount_owed} in transaction {self.transaction}'
 
@@ -139,28 +155,102 @@ class UserBalance(models.Model):
     @classmethod
     def get_user_balance(cls, user_id) -> dict:
         """
-        Calculate total balance of a user
+        Get total balance of a user from its balance summary
+
+        Args:
+            user_id (str): The user id for which balance to be fetched.
+
+        Returns:
+            dict: Total owed, total due and net balance of user.
+        """
+        summary = UserBalanceSummary.objects.filter(user_id=user_id).first()
+        return summary.to_dict() if summary else UserBalanceSummary.empty_dict()
+
+    @classmethod
+    def get_user_balances(cls, user_ids) -> dict:
+        """
+        Get total balance of several users with a single query
 
         Args:
-            user_id (str): The user id for which balance to be calculated.
+            user_ids (list): The user ids for which balance to be fetched.
+
+        Returns:
+            dict: Total balance of each user keyed by the user id as given.
+        """
+        summaries = UserBalanceSummary.objects.in_bulk({int(user_id) for user_id in user_ids})
+        return {
+            user_id: summaries[int(user_id)].to_dict() if int(user_id) in summaries else UserBalanceSummary.empty_dict()
+            for user_id in user_ids
+        }
+
+    @classmethod
+    def calculate_user_balances(cls) -> dict:
+        """
+        Calculate total owed and total due of every user from UserBalance rows.
 
         Returns:
-            float: Total balance of user.
+            dict: (total_owed, total_due) keyed by user id.
         """
-        credit = (
-            cls.objects.filter(initiator_id=user_id)
-            .aggregate(total_owed=Sum('balance'))['total_owed'] or 0
-        )
+        totals = {}
+        for row in cls.objects.order_by().values('initiator_id').annotate(total=Sum('balance')):
+            totals[row['initiator_id']] = [row['total'], 0]
+        for row in cls.objects.order_by().values('participant_id').annotate(total=Sum('balance')):
+            totals.setdefault(row['participant_id'], [0, 0])[1] = row['total']
+        return {user_id: tuple(values) for user_id, values in totals.items()}
 
-        debit = (
-            cls.objects.filter(participant_id=user_id)
-            .aggregate(total_due=Sum('balance'))['total_due'] or 0
-        )
 
-        net_balance = credit - debit
+class UserBalanceSummary(models.Model):
+    """
+    Running totals of the UserBalance rows of a user.
+
+    Maintained in the same database transaction as every UserBalance change,
+    so reading a user's total balance is a primary key lookup.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, related_name='balance_summary', on_delete=models.CASCADE, primary_key=True)
+    total_owed = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_due = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    net_balance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Balance summary of {self.user}: {self.net_balance}"
+
+    @staticmethod
+    def empty_dict() -> dict:
+        return {
+            "total_owed": 0.0,
+            "total_due": 0.0,
+            "net_balance": 0.0
+        }
 
+    def to_dict(self) -> dict:
         return {
-            "total_owed": float(credit),
-            "total_due": float(debit),
-            "net_balance": float(net_balance)
+            "total_owed": float(self.total_owed),
+            "total_due": float(self.total_due),
+            "net_balance": float(self.net_balance)
         }
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a transaction write, kept under the Idempotency-Key the client sent with it.
+
+    Written in the same database transaction as the write, so a retry of a
+    write that committed is answered with its original response instead of
+    creating the transaction again. Rows older than IDEMPOTENCY_KEY_TTL are
+    ignored and removed by `manage.py purge_idempotency_keys`.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='+', on_delete=models.CASCADE, db_index=False)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_key_user_key_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} of {self.user_id}"
@@ -1,89 +1,38 @@
 """
 Serializers for Transaction API View
 """
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
-from transaction.models import Transaction, TransactionParticipant, UserBalance
+from transaction.models import Transaction, TransactionParticipant, TransactionTypes
 from django.dispatch import Signal
-from django.shortcuts import get_object_or_404
-from django.utils import timezone
-from django.db import transaction
-from itertools import chain
+from django.db import transaction as db_transaction
 from app.helper import Helper
-from transaction.utils import TransactionHelper
+from transaction.utils import TransactionHelper, UserBalanceDeltaApplier
+from transaction.validators import SplitDetailsValidator, BulkSplitDetailsValidator
 from datetime import datetime
 from core.context import set_custom_context, clear_custom_context
 
 User = get_user_model()
 post_bulk_create_participants = Signal()
+post_bulk_create_transactions = Signal()
 
 
-class AddTransactionSerializer(serializers.ModelSerializer):
-    payer_id = serializers.PrimaryKeyRelatedField(
-        queryset=User.objects.all(), source='payer', write_only=True
-    )
-    split_details = serializers.ListField(write_only=True)
-    is_group = serializers.BooleanField(write_only=True)
-
-    class Meta:
-        model = Transaction
-        fields = [
-            'payer_id', 'group', 'total_amount', 'description',
-            'transaction_type', 'transaction_date', 'split_details', 'is_group'
-        ]
+def get_participant_map(split_details, participant_map=None) -> dict:
+    """Resolve the users of split details, loading only the ones not already known."""
+    participant_map = dict(participant_map or {})
+    missing_ids = {int(split['user']) for split in split_details} - participant_map.keys()
+    if missing_ids:
+        participant_map.update(User.objects.in_bulk(missing_ids))
+    return participant_map
 
-    def validate(self, data):
-        split_details = data.get('split_details', [])
-        total_amount = data.get('total_amount')
-        payer = data.get('payer')
-        group = data.get('group', None)
-        is_group = data.get('is_group', False)
-
-        if not split_details:
-            Helper.raise_validation_error("ERR_SPLIT_DETAILS_REQUIRED")
-
-        user_ids = []
-        total_split_amount = 0
-
-        split_users_set = set()
-        for split in split_details:
-            try:
-                participant_id = int(split['user'])
-                amount = float(split['amount'])
-                if amount < 0:
-                    raise ValueError
-            except (KeyError, ValueError):
-                Helper.raise_validation_error("ERR_SPLIT_DETAILS_REQUIRED")
 
-            split_users_set.add(participant_id)
-            user_ids.append(participant_id)
-            total_split_amount += amount
+class AddBalanceChangesMixin:
+    """Balance bookkeeping of serializers that add transactions, merging the splits of one or more of them."""
 
-        if total_split_amount != total_amount:
-            Helper.raise_validation_error("ERR_SPLIT_MISMATCH")
-
-        if payer.id not in split_users_set:
-            Helper.raise_validation_error("ERR_PAYER_NOT_IN_SPLIT")
-
-        non_friends = [uid for uid in user_ids if not payer.friends.filter(id=uid).exists() and uid != payer.id]
-        if non_friends:
-            Helper.raise_validation_error("ERR_FRIENDS_REQUIRED")
-
-        if is_group and not group:
-            Helper.raise_validation_error("ERR_GROUP_REQUIRED")
-
-        if is_group and group:
-            group_participants_ids = set(group.participants.values_list('id', flat=True))
-            if set(user_ids) != group_participants_ids:
-                Helper.raise_validation_error("ERR_NOT_ALL_GROUP_MEMBERS_INCLUDED")
-
-        return data
-
-    def accumulate_balance_changes(self, balance_changes, payer, split_details):
+    def accumulate_balance_changes(self, balance_changes, payer, split_details, participant_map=None):
         """Accumulate balance changes for each initiator-participant pair in a dictionary."""
-        participant_ids = [split['user'] for split in split_details]
-        participants = User.objects.filter(id__in=participant_ids)
-        participant_map = {user.id: user for user in participants}
+        participant_map = get_participant_map(split_details, participant_map)
 
         for split in split_details:
             participant_id = split['user']
@@ -126,64 +75,35 @@ class AddTransactionSerializer(serializers.ModelSerializer):
             balance_changes[key]['transaction_count'] += 1
 
     def bulk_update_user_balance(self, balance_changes):
-        """Update the UserBalance in bulk based on the accumulated balance changes."""
-        with transaction.atomic():
-            initiator_ids = [key[0] for key in balance_changes]
-            participant_ids = [key[1] for key in balance_changes]
-
-            existing_balances = {
-                (bal.initiator.id, bal.participant.id): bal
-                for bal in UserBalance.objects.filter(
-                    initiator_id__in=initiator_ids, participant_id__in=participant_ids
-                )
-            }
-
-            updates = []
-            inserts = []
-
-            for key, changes in balance_changes.items():
-                initiator_id, participant_id = key
-                balance_record = existing_balances.get((initiator_id, participant_id))
-
-                if balance_record:
-                    balance_record.balance += changes['balance']
-                    balance_record.total_amount_paid += changes['total_amount_paid']
-                    balance_record.total_amount_received += changes['total_amount_received']
-                    balance_record.transaction_count += changes['transaction_count']
-                    balance_record.last_transaction_date = timezone.now()
-                    updates.append(balance_record)
-                else:
-                    new_balance = UserBalance(
-                        initiator=changes['initiator'],
-                        participant=changes['participant'],
-                        balance=changes['balance'],
-                        total_amount_paid=changes['total_amount_paid'],
-                        total_amount_received=changes['total_amount_received'],
-                        transaction_count=changes['transaction_count'],
-                        last_transaction_date=timezone.now(),
-                        is_active=True
-                    )
-                    inserts.append(new_balance)
-
-            if inserts:
-                created_records = UserBalance.objects.bulk_create(inserts)
-            else:
-                created_records = []
-
-            if updates:
-                UserBalance.objects.bulk_update(
-                    updates,
-                    ['balance', 'total_amount_paid', 'total_amount_received',
-                     'transaction_count', 'last_transaction_date']
-                )
-                updated_records = updates
-            else:
-                updated_records = []
+        """Apply the accumulated balance changes to UserBalance in a single upsert."""
+        return UserBalanceDeltaApplier.apply(balance_changes)
 
-            all_records = list(chain(created_records, updated_records))
-            filtered_records = [r for r in all_records if r.initiator != r.participant]
-            return filtered_records
 
+class AddTransactionSerializer(AddBalanceChangesMixin, serializers.ModelSerializer):
+    payer_id = serializers.PrimaryKeyRelatedField(
+        queryset=User.objects.all(), source='payer', write_only=True
+    )
+    split_details = serializers.ListField(write_only=True)
+    is_group = serializers.BooleanField(write_only=True)
+
+    class Meta:
+        model = Transaction
+        fields = [
+            'payer_id', 'group', 'total_amount', 'description',
+            'transaction_type', 'transaction_date', 'split_details', 'is_group'
+        ]
+
+    def validate(self, data):
+        data['split_users'] = SplitDetailsValidator(
+            payer=data.get('payer'),
+            split_details=data.get('split_details', []),
+            total_amount=data.get('total_amount'),
+            group=data.get('group', None),
+            is_group=data.get('is_group', False),
+        ).validate()
+        return data
+
+    @db_transaction.atomic
     def create(self, validated_data):
         payer = validated_data['payer']
         group = validated_data.get('group', None)
@@ -192,6 +112,7 @@ class AddTransactionSerializer(serializers.ModelSerializer):
         transaction_type = validated_data.get('transaction_type', 'debt')
         transaction_date = validated_data['transaction_date']
         split_details = validated_data['split_details']
+        split_users = validated_data['split_users']
 
         initial_user = self.context.get('user') or getattr(self.context.get('request'), 'user', None)
         set_custom_context('exclude_user', initial_user.id)
@@ -211,14 +132,15 @@ class AddTransactionSerializer(serializers.ModelSerializer):
         participants = [
             TransactionParticipant(
                 transaction=transaction,
-                user=get_object_or_404(User, id=split['user']),
+                user=split_users[int(split['user'])],
                 amount_owed=split['amount'],
+                transaction_date=transaction.transaction_date,
             ) for split in split_details
         ]
         TransactionParticipant.objects.bulk_create(participants)
 
         balance_changes = {}
-        self.accumulate_balance_changes(balance_changes, payer, split_details)
+        self.accumulate_balance_changes(balance_changes, payer, split_details, participant_map=split_users)
         self.bulk_update_user_balance(balance_changes)
 
         post_bulk_create_participants.send(sender=Transaction, instance=transaction)
@@ -240,51 +162,13 @@ class ModifyTransactionSerializer(serializers.ModelSerializer):
         ]
 
     def validate(self, data):
-        split_details = data.get('split_details', [])
-        total_amount = data.get('total_amount')
-        payer = data.get('payer')
-        group = data.get('group', None)
-        is_group = data.get('is_group', False)
-
-        if not split_details:
-            Helper.raise_validation_error("ERR_SPLIT_DETAILS_REQUIRED")
-
-        user_ids = []
-        total_split_amount = 0
-        split_users_set = set()
-
-        for split in split_details:
-            try:
-                participant_id = int(split['user'])
-                amount = float(split['amount'])
-                # Now allow amount >= 0
-                if amount < 0:
-                    raise ValueError
-            except (KeyError, ValueError):
-                Helper.raise_validation_error("ERR_SPLIT_DETAILS_REQUIRED")
-
-            split_users_set.add(participant_id)
-            user_ids.append(participant_id)
-            total_split_amount += amount
-
-        if total_split_amount != total_amount:
-            Helper.raise_validation_error("ERR_SPLIT_MISMATCH")
-
-        if payer.id not in split_users_set:
-            Helper.raise_validation_error("ERR_PAYER_NOT_IN_SPLIT")
-
-        non_friends = [uid for uid in user_ids if uid != payer.id and not payer.friends.filter(id=uid).exists()]
-        if non_friends:
-            Helper.raise_validation_error("ERR_FRIENDS_REQUIRED")
-
-        if is_group and not group:
-            Helper.raise_validation_error("ERR_GROUP_REQUIRED")
-
-        if is_group and group:
-            group_participants_ids = set(group.participants.values_list('id', flat=True))
-            if set(user_ids) != group_participants_ids:
-                Helper.raise_validation_error("ERR_NOT_ALL_GROUP_MEMBERS_INCLUDED")
-
+        data['split_users'] = SplitDetailsValidator(
+            payer=data.get('payer'),
+            split_details=data.get('split_details', []),
+            total_amount=data.get('total_amount'),
+            group=data.get('group', None),
+            is_group=data.get('is_group', False),
+        ).validate()
         return data
 
     def remove_transaction_count(self, is_payer_changed, data, old_payer, new_payer):
@@ -295,11 +179,9 @@ class ModifyTransactionSerializer(serializers.ModelSerializer):
                 value['transaction_count'] -= 1
         return data
 
-    def accumulate_balance_changes(self, balance_changes, payer, split_details):
+    def accumulate_balance_changes(self, balance_changes, payer, split_details, participant_map=None):
         """Accumulate balance changes for each initiator-participant pair in a dictionary."""
-        participant_ids = [split['user'] for split in split_details]
-        participants = User.objects.filter(id__in=participant_ids)
-        participant_map = {user.id: user for user in participants}
+        participant_map = get_participant_map(split_details, participant_map)
 
         for split in split_details:
             participant_id = split['user']
@@ -362,64 +244,11 @@ class ModifyTransactionSerializer(serializers.ModelSerializer):
                 balance_changes[key]['transaction_count'] += split.get('increase_count', 0)
 
     def bulk_update_user_balance(self, balance_changes):
-        """Update the UserBalance in bulk based on the accumulated balance changes."""
-        with transaction.atomic():
-            initiator_ids = [key[0] for key in balance_changes]
-            participant_ids = [key[1] for key in balance_changes]
-
-            existing_balances = {
-                (bal.initiator.id, bal.participant.id): bal
-                for bal in UserBalance.objects.filter(
-                    initiator_id__in=initiator_ids, participant_id__in=participant_ids
-                )
-            }
-
-            updates = []
-            inserts = []
-
-            for key, changes in balance_changes.items():
-                initiator_id, participant_id = key
-                balance_record = existing_balances.get((initiator_id, participant_id))
-
-                if balance_record:
-                    balance_record.balance += changes['balance']
-                    balance_record.total_amount_paid += changes['total_amount_paid']
-                    balance_record.total_amount_received += changes['total_amount_received']
-                    balance_record.transaction_count += changes['transaction_count']
-                    balance_record.last_transaction_date = timezone.now()
-                    updates.append(balance_record)
-                else:
-                    new_balance = UserBalance(
-                        initiator=changes['initiator'],
-                        participant=changes['participant'],
-                        balance=changes['balance'],
-                        total_amount_paid=changes['total_amount_paid'],
-                        total_amount_received=changes['total_amount_received'],
-                        transaction_count=1,  # starting from 1 for a new record
-                        last_transaction_date=timezone.now(),
-                        is_active=True
-                    )
-                    inserts.append(new_balance)
-
-            if inserts:
-                created_records = UserBalance.objects.bulk_create(inserts)
-            else:
-                created_records = []
-
-            if updates:
-                UserBalance.objects.bulk_update(
-                    updates,
-                    ['balance', 'total_amount_paid', 'total_amount_received',
-                     'transaction_count', 'last_transaction_date']
-                )
-                updated_records = updates
-            else:
-                updated_records = []
-
-            all_records = list(chain(created_records, updated_records))
-            filtered_records = [r for r in all_records if r.initiator != r.participant]
-            return filtered_records
+        """Apply the accumulated balance changes to UserBalance in a single upsert."""
+        # New pairs start from a single transaction, whatever the accumulated count says
+        return UserBalanceDeltaApplier.apply(balance_changes, new_pair_transaction_count=1)
 
+    @db_transaction.atomic
     def update(self, instance, validated_data):
         old_payer = instance.payer
         payer = validated_data.get('payer', instance.payer)
@@ -432,6 +261,7 @@ class ModifyTransactionSerializer(serializers.ModelSerializer):
         is_payer_changed = (old_payer != payer)
         split_details = validated_data.get('split_details', [])
         split_details = TransactionHelper.transform_split_data(split_details)
+        split_users = validated_data.get('split_users', {})
 
         user = self.context.get('user') or getattr(self.context.get('request'), 'user', None)
         initial_user_id = getattr(user, 'id', None)
@@ -484,25 +314,34 @@ class ModifyTransactionSerializer(serializers.ModelSerializer):
             excluded_ids = list(set(excluded_ids) - old_participant_ids)
 
         # Create or update participants
+        updated_participants = []
+        new_participants = []
         for user_id, amount in new_user_map.items():
             if user_id in existing_participants:
                 # Update if changed
-                participant_obj = existing_participants[user_id]
+                participant_obj = existing_participants.pop(user_id)
                 if participant_obj.amount_owed != amount:
                     participant_obj.amount_owed = amount
-                    participant_obj.save()
-                del existing_participants[user_id]
+                    updated_participants.append(participant_obj)
             else:
                 # New participant
-                TransactionParticipant.objects.create(
+                new_participants.append(TransactionParticipant(
                     transaction=instance,
-                    user=get_object_or_404(User, id=user_id),
-                    amount_owed=amount
-                )
+                    user=split_users[user_id],
+                    amount_owed=amount,
+                    transaction_date=transaction_date
+                ))
+
+        if updated_participants:
+            TransactionParticipant.objects.bulk_update(updated_participants, ['amount_owed'])
+        if new_participants:
+            TransactionParticipant.objects.bulk_create(new_participants)
 
         # Delete any participants that are no longer in the new list
-        for leftover in existing_participants.values():
-            leftover.delete()
+        if existing_participants:
+            TransactionParticipant.objects.filter(
+                id__in=[leftover.id for leftover in existing_participants.values()]
+            ).delete()
 
         # Adjust amounts for updated participants
         for entry in split_details:
@@ -535,7 +374,7 @@ class ModifyTransactionSerializer(serializers.ModelSerializer):
             })
 
         # Now accumulate & update balances
-        self.accumulate_balance_changes(balance_changes, payer, split_details)
+        self.accumulate_balance_changes(balance_changes, payer, split_details, participant_map=split_users)
         balance_changes = self.remove_transaction_count(
             is_payer_changed=is_payer_changed,
             data=balance_changes,
@@ -550,8 +389,90 @@ class ModifyTransactionSerializer(serializers.ModelSerializer):
         return instance
 
 
+class BulkAddTransactionItemSerializer(serializers.ModelSerializer):
+    # Payers and groups are resolved for the whole batch by BulkSplitDetailsValidator
+    payer_id = serializers.IntegerField(min_value=1, write_only=True)
+    group = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+    split_details = serializers.ListField(write_only=True)
+    is_group = serializers.BooleanField(write_only=True)
+
+    class Meta:
+        model = Transaction
+        fields = [
+            'payer_id', 'group', 'total_amount', 'description',
+            'transaction_type', 'transaction_date', 'split_details', 'is_group'
+        ]
+
+
+class BulkAddTransactionSerializer(AddBalanceChangesMixin, serializers.Serializer):
+    transactions = BulkAddTransactionItemSerializer(
+        many=True, allow_empty=False, max_length=settings.TRANSACTION_BULK_MAX_SIZE
+    )
+
+    def validate(self, data):
+        data['transactions'] = BulkSplitDetailsValidator(data['transactions']).validate()
+        return data
+
+    @db_transaction.atomic
+    def create(self, validated_data):
+        transactions_data = validated_data['transactions']
+        initial_user = self.context.get('user') or getattr(self.context.get('request'), 'user', None)
+
+        transactions = Transaction.objects.bulk_create([
+            Transaction(
+                payer=data['payer'],
+                group=data['group'],
+                total_amount=data['total_amount'],
+                description=data.get('description', ''),
+                transaction_type=data.get('transaction_type', 'debt'),
+                transaction_date=data['transaction_date'],
+                created_by=initial_user,
+                split_count=len(data['split_details'])
+            ) for data in transactions_data
+        ])
+
+        TransactionParticipant.objects.bulk_create([
+            TransactionParticipant(
+                transaction=transaction,
+                user=data['split_users'][int(split['user'])],
+                amount_owed=split['amount'],
+                transaction_date=transaction.transaction_date,
+            )
+            for transaction, data in zip(transactions, transactions_data)
+            for split in data['split_details']
+        ])
+
+        balance_changes = {}
+        for data in transactions_data:
+            self.accumulate_balance_changes(balance_changes, data['payer'], data['split_details'], participant_map=data['split_users'])
+        self.bulk_update_user_balance(balance_changes)
+
+        post_bulk_create_transactions.send(sender=Transaction, instances=transactions, exclude_user=initial_user.id)
+        return transactions
+
+
 class BulkTransactionSerializer(serializers.Serializer):
     transaction_ids = serializers.ListField(
         child=serializers.IntegerField(min_value=1),
         allow_empty=False
     )
+
+
+class TransactionHistorySerializer(serializers.Serializer):
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=50)
+    counterparty = serializers.IntegerField(min_value=1, required=False)
+    group = serializers.IntegerField(min_value=1, required=False)
+    type = serializers.ChoiceField(choices=TransactionTypes.choices, required=False)
+    start_date = serializers.DateTimeField(required=False)
+    end_date = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if 'cursor' in data:
+            try:
+                data['cursor'] = TransactionHelper.decode_history_cursor(data['cursor'])
+            except ValueError:
+                Helper.raise_validation_error("ERR_INVALID_CURSOR")
+        if data.get('start_date') and data.get('end_date') and data['start_date'] > data['end_date']:
+            Helper.raise_validation_error("ERR_INVALID_DATE_RANGE")
+        return data
@@ -1,9 +1,10 @@
-from django.db.models.signals import pre_save, post_save, pre_delete
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
-from transaction.models import Transaction
-from transaction.utils import TransactionHelper
-from transaction.serializers import post_bulk_create_participants
+from transaction.models import Transaction, TransactionParticipant, UserBalance
+from transaction.utils import TransactionHelper, UserBalanceDeltaApplier
+from transaction.serializers import post_bulk_create_participants, post_bulk_create_transactions
 from activity.models import Activity, ActivityType
+from activity.fanout import dispatch_coalesced_activities
 
 
 @receiver(pre_save, sender=Transaction)
@@ -69,8 +70,42 @@ def handle_transaction_creation_with_partiticpants(sender, instance, **kwargs):
     activity.related_users_ids.add(*related_user_ids)
 
 
+@receiver(post_bulk_create_transactions)
+def handle_bulk_transaction_creation(sender, instances, exclude_user=None, **kwargs):
+    """Record the activities of a batch of new transactions and push them once per user, except to their creator."""
+    activities = Activity.objects.bulk_create([
+        Activity(
+            user_id=transaction.created_by,
+            activity_type=ActivityType.ADDED_TRANSACTION,
+            transaction_id=transaction,
+            comments={"message": f"{transaction.created_by.email} created the transaction '{transaction.id}'"},
+        ) for transaction in instances
+    ])
+
+    members = {transaction.id: {transaction.payer_id} for transaction in instances}
+    participants = TransactionParticipant.objects.filter(
+        transaction__in=instances
+    ).values_list('transaction_id', 'user_id')
+    for transaction_id, user_id in participants:
+        members[transaction_id].add(user_id)
+
+    Activity.add_related_users_in_bulk({
+        activity.id: members[activity.transaction_id_id] for activity in activities
+    })
+    dispatch_coalesced_activities([activity.id for activity in activities], str(exclude_user) if exclude_user else None)
+
+
 @receiver(pre_delete, sender=Transaction)
 def handle_user_balance_on_transaction_delete(sender, instance, **kwargs):
     if not instance.is_active:
         return
     TransactionHelper.update_user_balances_on_delete_or_restore(instance, reverse=False)
+
+
+@receiver(post_delete, sender=UserBalance)
+def handle_user_balance_summary_on_delete(sender, instance, **kwargs):
+    """Take a deleted UserBalance out of the balance summary of both users."""
+    UserBalanceDeltaApplier.apply_summary_deltas(
+        [(instance.initiator_id, instance.participant_id, -instance.balance)],
+        insert_missing=False
+    )
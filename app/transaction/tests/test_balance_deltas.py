@@ -0,0 +1,86 @@
+"""
+Test for applying UserBalance deltas in the database.
+"""
+from decimal import Decimal
+from django.test import TestCase
+from transaction.models import UserBalance
+from transaction.utils import UserBalanceDeltaApplier
+from core.tests.utils import create_user
+
+
+def make_delta(balance, paid=0, received=0, count=1):
+    return {
+        'balance': balance,
+        'total_amount_paid': paid,
+        'total_amount_received': received,
+        'transaction_count': count,
+    }
+
+
+class UserBalanceDeltaApplierTests(TestCase):
+    """Test the in-database balance delta applier."""
+
+    def setUp(self):
+        self.user_a = create_user('a@example.com', password='testPass@123')
+        self.user_b = create_user('b@example.com', password='testPass@123')
+        self.user_c = create_user('c@example.com', password='testPass@123')
+        self.user_d = create_user('d@example.com', password='testPass@123')
+
+    def get_balance(self, initiator, participant):
+        return UserBalance.objects.get(initiator=initiator, participant=participant)
+
+    def test_apply_inserts_new_pairs(self):
+        """Test missing pairs are created from the delta."""
+        result = UserBalanceDeltaApplier.apply({
+            (self.user_a.id, self.user_b.id): make_delta(Decimal('10.50'), paid=Decimal('10.50')),
+        })
+
+        self.assertEqual(result.rows_touched, 1)
+        balance = self.get_balance(self.user_a, self.user_b)
+        self.assertEqual(balance.balance, Decimal('10.50'))
+        self.assertEqual(balance.total_amount_paid, Decimal('10.50'))
+        self.assertEqual(balance.transaction_count, 1)
+
+    def test_apply_adds_to_existing_pairs(self):
+        """Test existing pairs are incremented instead of overwritten."""
+        key = (self.user_a.id, self.user_b.id)
+        UserBalanceDeltaApplier.apply({key: make_delta(10, paid=10)})
+        UserBalanceDeltaApplier.apply({key: make_delta(-2.25, received=2.25)})
+
+        balance = self.get_balance(self.user_a, self.user_b)
+        self.assertEqual(balance.balance, Decimal('7.75'))
+        self.assertEqual(balance.total_amount_paid, Decimal('10'))
+        self.assertEqual(balance.total_amount_received, Decimal('2.25'))
+        self.assertEqual(balance.transaction_count, 2)
+
+    def test_apply_touches_exact_pairs_only(self):
+        """Test pairs outside the delta keys are not modified."""
+        UserBalanceDeltaApplier.apply({(self.user_a.id, self.user_d.id): make_delta(5)})
+        UserBalanceDeltaApplier.apply({
+            (self.user_a.id, self.user_b.id): make_delta(1),
+            (self.user_c.id, self.user_d.id): make_delta(1),
+        })
+
+        self.assertEqual(self.get_balance(self.user_a, self.user_d).balance, Decimal('5'))
+        self.assertEqual(UserBalance.objects.count(), 3)
+
+    def test_new_pair_transaction_count(self):
+        """Test new pairs use the given count while existing pairs use the delta."""
+        existing = (self.user_a.id, self.user_b.id)
+        UserBalanceDeltaApplier.apply({existing: make_delta(1)})
+        UserBalanceDeltaApplier.apply({
+            existing: make_delta(1, count=0),
+            (self.user_a.id, self.user_c.id): make_delta(1, count=0),
+        }, new_pair_transaction_count=1)
+
+        self.assertEqual(self.get_balance(self.user_a, self.user_b).transaction_count, 1)
+        self.assertEqual(self.get_balance(self.user_a, self.user_c).transaction_count, 1)
+
+    def test_update_only_skips_missing_pairs(self):
+        """Test insert_missing=False never creates rows."""
+        result = UserBalanceDeltaApplier.apply({
+            (self.user_a.id, self.user_b.id): make_delta(1),
+        }, insert_missing=False)
+
+        self.assertEqual(result.rows_touched, 0)
+        self.assertFalse(UserBalance.objects.exists())
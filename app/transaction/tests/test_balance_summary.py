@@ -0,0 +1,64 @@
+"""
+Test for the per-user balance summary.
+"""
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from transaction.models import UserBalance, UserBalanceSummary
+from transaction.utils import UserBalanceDeltaApplier
+from core.tests.utils import create_user
+
+
+def make_delta(balance, count=1):
+    return {
+        'balance': balance,
+        'total_amount_paid': max(balance, 0),
+        'total_amount_received': max(-balance, 0),
+        'transaction_count': count,
+    }
+
+
+class UserBalanceSummaryTests(TestCase):
+    """Test the balance summary kept in step with UserBalance."""
+
+    def setUp(self):
+        self.user_a = create_user('a@example.com')
+        self.user_b = create_user('b@example.com')
+        self.user_c = create_user('c@example.com')
+        UserBalanceDeltaApplier.apply({
+            (self.user_a.id, self.user_b.id): make_delta(30),
+            (self.user_a.id, self.user_c.id): make_delta(-5),
+            (self.user_b.id, self.user_c.id): make_delta(12),
+        })
+
+    def test_summary_follows_balance_deltas(self):
+        """Test every applied delta is rolled up for both users."""
+        self.assertEqual(UserBalance.get_user_balance(self.user_a.id), {'total_owed': 25.0, 'total_due': 0.0, 'net_balance': 25.0})
+        self.assertEqual(UserBalance.get_user_balance(self.user_b.id), {'total_owed': 12.0, 'total_due': 30.0, 'net_balance': -18.0})
+        self.assertEqual(UserBalance.get_user_balance(self.user_c.id), {'total_owed': 0.0, 'total_due': 7.0, 'net_balance': -7.0})
+
+    def test_get_user_balance_is_single_lookup(self):
+        """Test reading a balance is one query, with zeros for users without a summary."""
+        user = create_user('new@example.com')
+        with self.assertNumQueries(1):
+            self.assertEqual(UserBalance.get_user_balance(user.id), {'total_owed': 0.0, 'total_due': 0.0, 'net_balance': 0.0})
+
+    def test_deleting_balance_updates_summary(self):
+        """Test a deleted UserBalance is taken out of the summary."""
+        UserBalance.objects.get(initiator=self.user_a, participant=self.user_b).delete()
+
+        self.assertEqual(UserBalance.get_user_balance(self.user_a.id)['net_balance'], -5.0)
+        self.assertEqual(UserBalance.get_user_balance(self.user_b.id)['net_balance'], 12.0)
+
+    def test_rebuild_command_verifies_and_repairs(self):
+        """Test the command detects a drifted summary and rebuilds it."""
+        call_command('rebuild_user_balance_summary', '--verify', stdout=StringIO())
+
+        UserBalanceSummary.objects.filter(user=self.user_a).update(total_owed=0, net_balance=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_user_balance_summary', '--verify', stdout=StringIO())
+
+        call_command('rebuild_user_balance_summary', stdout=StringIO())
+        self.assertEqual(UserBalance.get_user_balance(self.user_a.id)['net_balance'], 25.0)
+        call_command('rebuild_user_balance_summary', '--verify', stdout=StringIO())
@@ -0,0 +1,176 @@
+"""
+Test for adding a batch of transactions.
+"""
+import json
+from decimal import Decimal
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from activity.models import Activity, ActivityInbox, ActivityType
+from core.consumers import CoreConsumer
+from group.models import Group, GroupParticipant
+from transaction.models import Transaction, TransactionParticipant, UserBalance, UserBalanceSummary
+from core.tests.utils import create_user, IN_MEMORY_CHANNEL_LAYERS
+
+ADD_BULK_URL = reverse('transaction:add_bulk_transaction')
+
+
+def build_payload(payer, participants, amount=10, group=None):
+    return {
+        'payer_id': payer.id,
+        'group': group.id if group else None,
+        'total_amount': amount * len(participants),
+        'description': 'Dinner',
+        'transaction_type': 'debt',
+        'transaction_date': timezone.now().isoformat(),
+        'is_group': bool(group),
+        'split_details': [{'user': user.id, 'amount': amount} for user in participants],
+    }
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class BulkAddTransactionApiTests(TestCase):
+    """Test the bulk add transaction API."""
+
+    def setUp(self):
+        self.user = create_user('user@example.com')
+        self.friends = [create_user(f'friend{i}@example.com') for i in range(4)]
+        self.user.friends.add(*self.friends)
+        self.group = Group.objects.create(group_name='Trip', created_by=self.user, group_type='trip')
+        GroupParticipant.objects.bulk_create([
+            GroupParticipant(group=self.group, user=user, role='user') for user in [self.user, *self.friends[:2]]
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def build_batch(self, count):
+        """Alternate plain and group expenses with different participants."""
+        return [
+            build_payload(self.user, [self.user, *self.friends[:2]], group=self.group) if index % 2
+            else build_payload(self.user, [self.user, self.friends[index % len(self.friends)]])
+            for index in range(count)
+        ]
+
+    def test_add_bulk_writes_transactions_and_merged_balances(self):
+        """Test a batch writes every transaction and the balances of all of them."""
+        res = self.client.post(ADD_BULK_URL, {'transactions': self.build_batch(4)}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        transaction_ids = res.json()['transaction_ids']
+        self.assertEqual(len(transaction_ids), 4)
+        self.assertEqual(TransactionParticipant.objects.filter(transaction_id__in=transaction_ids).count(), 10)
+        self.assertEqual(Transaction.objects.get(id=transaction_ids[1]).group, self.group)
+
+        # friend0 is in three expenses, friend1 in two and friend2 in one
+        balance = UserBalance.objects.get(initiator=self.user, participant=self.friends[0])
+        self.assertEqual(balance.balance, Decimal('30'))
+        self.assertEqual(balance.transaction_count, 3)
+        self.assertEqual(UserBalance.objects.get(initiator=self.user, participant=self.friends[1]).balance, Decimal('20'))
+        self.assertEqual(UserBalance.objects.get(initiator=self.user, participant=self.friends[2]).balance, Decimal('10'))
+        self.assertEqual(UserBalanceSummary.objects.get(user=self.user).total_owed, Decimal('60'))
+
+    def test_add_bulk_records_one_activity_per_transaction(self):
+        """Test every transaction gets its activity, related users and inbox rows."""
+        res = self.client.post(ADD_BULK_URL, {'transactions': self.build_batch(2)}, format='json')
+
+        activities = Activity.objects.filter(activity_type=ActivityType.ADDED_TRANSACTION).order_by('id')
+        self.assertEqual([activity.transaction_id_id for activity in activities], res.json()['transaction_ids'])
+        self.assertEqual(set(activities[1].related_users_ids.values_list('id', flat=True)), {self.user.id, self.friends[0].id, self.friends[1].id})
+        self.assertEqual(ActivityInbox.objects.filter(user=self.friends[0], activity__in=activities).count(), 2)
+        self.assertEqual(Activity.get_latest_activity_id(self.friends[0].id), activities[1].id)
+
+    def test_add_bulk_pushes_once_per_user(self):
+        """Test every affected user gets one push with all of its transactions."""
+        channel_layer = get_channel_layer()
+        channel_name = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f"user_{self.friends[0].id}", channel_name)
+
+        res = self.client.post(ADD_BULK_URL, {'transactions': self.build_batch(4)}, format='json')
+
+        message = json.loads(async_to_sync(channel_layer.receive)(channel_name)['text'])['message']
+        self.assertEqual(message['type'], 'bulk_transaction_message')
+        transaction_ids = res.json()['transaction_ids']
+        self.assertEqual([data['id'] for data in message['data']['transactions']], [str(transaction_ids[index]) for index in [0, 1, 3]])
+        self.assertEqual(message['data']['transactions'][0]['activity']['transaction_id'], str(transaction_ids[0]))
+        self.assertNotIn(channel_name, channel_layer.channels)
+
+    def test_add_bulk_not_pushed_to_creator(self):
+        """Test the user adding the batch gets no push for it, like a single add."""
+        channel_layer = get_channel_layer()
+        friend_channel = async_to_sync(channel_layer.new_channel)()
+        creator_channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f"user_{self.friends[0].id}", friend_channel)
+        async_to_sync(channel_layer.group_add)(f"user_{self.user.id}", creator_channel)
+
+        self.client.post(ADD_BULK_URL, {'transactions': self.build_batch(2)}, format='json')
+
+        self.assertIn(friend_channel, channel_layer.channels)
+        self.assertNotIn(creator_channel, channel_layer.channels)
+
+    def test_add_bulk_queries_do_not_grow_with_batch_size(self):
+        """Benchmark: writing 20 transactions between the same users costs as many queries as writing 4."""
+        def count_queries(batch):
+            with CaptureQueriesContext(connection) as context:
+                res = self.client.post(ADD_BULK_URL, {'transactions': batch}, format='json')
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            return len(context.captured_queries)
+
+        count_queries(self.build_batch(4))
+        self.assertEqual(count_queries(self.build_batch(4)), count_queries(self.build_batch(20)))
+
+    def test_add_bulk_rejects_whole_batch(self):
+        """Test one invalid transaction rejects the batch and reports its index."""
+        stranger = create_user('stranger@example.com')
+        batch = [*self.build_batch(2), build_payload(self.user, [self.user, stranger])]
+
+        res = self.client.post(ADD_BULK_URL, {'transactions': batch}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.json()['errors']['response_key'], ['ERR_FRIENDS_REQUIRED'])
+        self.assertEqual(res.json()['errors']['index'], ['2'])
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(UserBalance.objects.exists())
+
+    def test_add_bulk_unknown_group_rejected(self):
+        """Test a transaction in a group that does not exist is rejected."""
+        payload = build_payload(self.user, [self.user, self.friends[0]])
+        payload.update({'group': self.group.id + 100, 'is_group': True})
+
+        res = self.client.post(ADD_BULK_URL, {'transactions': [payload]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.json()['errors']['response_key'], ['ERR_GROUP_NOT_FOUND'])
+
+    def test_empty_batch_rejected(self):
+        """Test an empty batch is rejected."""
+        res = self.client.post(ADD_BULK_URL, {'transactions': []}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_add_transactions_action(self):
+        """Test the WebSocket action answers with the created transaction ids."""
+        consumer = CoreConsumer()
+        consumer.scope = {'user': self.user}
+
+        response = consumer.handle_add_transactions({'transactions': self.build_batch(2)})
+
+        self.assertEqual(response['response_key'], 'SUCCESS_TRANSACTIONS_CREATED')
+        self.assertEqual(response['transaction_ids'], list(Transaction.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_add_transactions_action_error(self):
+        """Test the WebSocket action reports the failing transaction."""
+        consumer = CoreConsumer()
+        consumer.scope = {'user': self.user}
+        batch = self.build_batch(2)
+        batch[1]['total_amount'] = 1
+
+        response = consumer.handle_add_transactions({'transactions': batch})
+
+        self.assertEqual(response['response_key'], 'ERR_SPLIT_MISMATCH')
+        self.assertEqual(response['index'], '1')
@@ -0,0 +1,77 @@
+"""
+Test for the batched bulk transaction API.
+"""
+import json
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from group.models import Group, GroupParticipant
+from transaction.serializers import AddTransactionSerializer
+from transaction.utils import TransactionHelper
+from core.tests.utils import create_user, IN_MEMORY_CHANNEL_LAYERS
+
+BULK_URL = reverse('transaction:get_bulk_transaction')
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class BulkTransactionApiTests(TestCase):
+    """Test the bulk transaction API."""
+
+    def setUp(self):
+        self.user = create_user('user@example.com')
+        self.friends = [create_user(f'friend{i}@example.com') for i in range(4)]
+        self.user.friends.add(*self.friends)
+        self.group = Group.objects.create(group_name='Trip', created_by=self.user, group_type='trip')
+        GroupParticipant.objects.bulk_create([
+            GroupParticipant(group=self.group, user=user, role='user') for user in [self.user, *self.friends[:2]]
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_transactions(self, count):
+        """Alternate plain and group expenses with different participants."""
+        transactions = []
+        for index in range(count):
+            if index % 2:
+                group, members = self.group, [self.user, *self.friends[:2]]
+            else:
+                group, members = None, [self.user, self.friends[index % len(self.friends)]]
+            serializer = AddTransactionSerializer(data={
+                'payer_id': self.user.id,
+                'group': group.id if group else None,
+                'total_amount': 10 * len(members),
+                'transaction_type': 'debt',
+                'transaction_date': timezone.now().isoformat(),
+                'is_group': bool(group),
+                'split_details': [{'user': member.id, 'amount': 10} for member in members],
+            }, context={'user': self.user})
+            serializer.is_valid(raise_exception=True)
+            transactions.append(serializer.save())
+        return transactions
+
+    def count_page_queries(self, transactions):
+        with CaptureQueriesContext(connection) as context:
+            res = self.client.post(f'{BULK_URL}?limit=50', {'transaction_ids': [t.id for t in transactions]}, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.json()['transactions']), len(transactions))
+        return len(context.captured_queries)
+
+    def test_page_queries_do_not_grow_with_page_size(self):
+        """Benchmark: a page of 20 transactions runs as many queries as a page of 4."""
+        transactions = self.add_transactions(20)
+
+        self.assertEqual(self.count_page_queries(transactions[:4]), self.count_page_queries(transactions))
+
+    def test_batched_data_matches_single_transaction_data(self):
+        """Test the batch produces byte-identical data to per-transaction builds."""
+        transactions = self.add_transactions(6)
+
+        batched = TransactionHelper.get_transactions_ws_data_for_user(transactions, self.user.id)
+        single = [TransactionHelper.get_transaction_ws_data(transaction, self.user.id) for transaction in transactions]
+
+        self.assertEqual(json.dumps(batched), json.dumps(single))
+        self.assertTrue(any(item['group_details'] for item in batched))
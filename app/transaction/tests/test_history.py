@@ -0,0 +1,162 @@
+"""
+Test for the keyset-paginated transaction history API.
+"""
+from datetime import timedelta
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from group.models import Group, GroupParticipant
+from transaction.models import TransactionParticipant
+from transaction.serializers import AddTransactionSerializer, ModifyTransactionSerializer
+from core.tests.utils import create_user, IN_MEMORY_CHANNEL_LAYERS
+
+HISTORY_URL = reverse('transaction:transaction_history')
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class TransactionHistoryApiTests(TestCase):
+    """Test the transaction history API."""
+
+    def setUp(self):
+        self.user = create_user('user@example.com')
+        self.friend = create_user('friend@example.com')
+        self.other = create_user('other@example.com')
+        self.user.friends.add(self.friend, self.other)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.base_date = timezone.now().replace(microsecond=0) - timedelta(days=30)
+
+    def add_transaction(self, friend, days, transaction_type='debt', group=None):
+        serializer = AddTransactionSerializer(data={
+            'payer_id': self.user.id,
+            'group': group.id if group else None,
+            'total_amount': 20,
+            'transaction_type': transaction_type,
+            'transaction_date': (self.base_date + timedelta(days=days)).isoformat(),
+            'is_group': bool(group),
+            'split_details': [{'user': self.user.id, 'amount': 10}, {'user': friend.id, 'amount': 10}],
+        }, context={'user': self.user})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def read_all(self, **params):
+        """Follow the cursors through every page and return the transaction ids."""
+        ids, cursor = [], None
+        while True:
+            res = self.client.get(HISTORY_URL, {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            body = res.json()
+            ids.extend(int(transaction['id']) for transaction in body['transactions'])
+            cursor = body['next_cursor']
+            self.assertEqual(body['has_more'], cursor is not None)
+            if not cursor:
+                return ids
+
+    def test_pages_cover_history_newest_first(self):
+        """Test following cursors returns every transaction once, ordered by date then id."""
+        transactions = [self.add_transaction(self.friend, days) for days in [1, 3, 3, 3, 5, 2, 4]]
+        expected = [t.id for t in sorted(transactions, key=lambda t: (t.transaction_date, t.id), reverse=True)]
+
+        self.assertEqual(self.read_all(limit=2), expected)
+
+    def test_page_payload(self):
+        """Test a page carries the transaction data with its split details."""
+        transaction = self.add_transaction(self.friend, 1)
+
+        res = self.client.get(HISTORY_URL)
+
+        self.assertEqual(res.json()['transactions'], [transaction.get_transaction_data()])
+        self.assertEqual(len(res.json()['transactions'][0]['split_details']), 2)
+
+    def test_deep_page_costs_as_much_as_first_page(self):
+        """Benchmark: a page deep in the history runs the same queries as the first page."""
+        for days in range(12):
+            self.add_transaction(self.friend, days)
+        cursor = None
+        for _ in range(3):
+            cursor = self.client.get(HISTORY_URL, {'limit': 3, **({'cursor': cursor} if cursor else {})}).json()['next_cursor']
+
+        with CaptureQueriesContext(connection) as first_page:
+            self.client.get(HISTORY_URL, {'limit': 3})
+        with CaptureQueriesContext(connection) as deep_page:
+            self.client.get(HISTORY_URL, {'limit': 3, 'cursor': cursor})
+
+        self.assertEqual(len(first_page.captured_queries), len(deep_page.captured_queries))
+        self.assertFalse(any('COUNT(' in query['sql'] for query in deep_page.captured_queries))
+
+    def test_filters(self):
+        """Test counterparty, group, type and date range filters."""
+        group = Group.objects.create(group_name='Trip', created_by=self.user, group_type='trip')
+        GroupParticipant.objects.bulk_create([
+            GroupParticipant(group=group, user=user, role='user') for user in [self.user, self.friend]
+        ])
+        with_friend = self.add_transaction(self.friend, 1)
+        with_other = self.add_transaction(self.other, 2)
+        in_group = self.add_transaction(self.friend, 3, group=group)
+        settlement = self.add_transaction(self.other, 4, transaction_type='settlement')
+
+        self.assertEqual(self.read_all(counterparty=self.friend.id), [in_group.id, with_friend.id])
+        self.assertEqual(self.read_all(group=group.id), [in_group.id])
+        self.assertEqual(self.read_all(type='settlement'), [settlement.id])
+        self.assertEqual(self.read_all(
+            start_date=with_other.transaction_date.isoformat(), end_date=in_group.transaction_date.isoformat()
+        ), [in_group.id, with_other.id])
+
+    def test_only_own_active_transactions(self):
+        """Test other users' and deleted transactions are not listed."""
+        kept = self.add_transaction(self.friend, 1)
+        self.add_transaction(self.friend, 2).delete()
+        self.friend.friends.add(self.other)
+        serializer = AddTransactionSerializer(data={
+            'payer_id': self.friend.id,
+            'total_amount': 10,
+            'transaction_type': 'debt',
+            'transaction_date': self.base_date.isoformat(),
+            'is_group': False,
+            'split_details': [{'user': self.friend.id, 'amount': 5}, {'user': self.other.id, 'amount': 5}],
+        }, context={'user': self.friend})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertEqual(self.read_all(), [kept.id])
+
+    def test_modified_date_moves_transaction(self):
+        """Test changing the transaction date updates the copied participant dates."""
+        older = self.add_transaction(self.friend, 1)
+        newer = self.add_transaction(self.friend, 2)
+        new_date = self.base_date + timedelta(days=3)
+
+        serializer = ModifyTransactionSerializer(older, data={
+            'payer_id': self.user.id,
+            'total_amount': 20,
+            'transaction_type': 'debt',
+            'transaction_date': new_date.isoformat(),
+            'is_group': False,
+            'split_details': [{'user': self.user.id, 'amount': 10}, {'user': self.friend.id, 'amount': 10}],
+        }, context={'user': self.user})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertEqual(set(TransactionParticipant.objects.filter(transaction=older).values_list('transaction_date', flat=True)), {new_date})
+        self.assertEqual(self.read_all(), [older.id, newer.id])
+
+    def test_invalid_params(self):
+        """Test bad cursors and date ranges are rejected."""
+        res = self.client.get(HISTORY_URL, {'cursor': 'not-a-cursor'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.json()['errors']['response_key'], ['ERR_INVALID_CURSOR'])
+
+        res = self.client.get(HISTORY_URL, {'start_date': self.base_date.isoformat(), 'end_date': (self.base_date - timedelta(days=1)).isoformat()})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get(HISTORY_URL, {'limit': 1000})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_requires_authentication(self):
+        """Test the history is not public."""
+        res = APIClient().get(HISTORY_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
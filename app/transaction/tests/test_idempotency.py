@@ -0,0 +1,151 @@
+"""
+Test for idempotency keys of transaction writes.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from core.consumers import CoreConsumer
+from transaction.models import IdempotencyKey, Transaction, UserBalance
+from core.tests.utils import create_user, IN_MEMORY_CHANNEL_LAYERS
+
+ADD_URL = reverse('transaction:add_transaction')
+ADD_BULK_URL = reverse('transaction:add_bulk_transaction')
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class IdempotencyKeyTests(TestCase):
+    """Test replaying transaction writes sent with an idempotency key."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user('user@example.com')
+        self.friend = create_user('friend@example.com')
+        self.user.friends.add(self.friend)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payload = {
+            'payer_id': self.user.id,
+            'total_amount': 20,
+            'description': 'Dinner',
+            'transaction_type': 'debt',
+            'transaction_date': timezone.now().isoformat(),
+            'is_group': False,
+            'split_details': [{'user': self.user.id, 'amount': 10}, {'user': self.friend.id, 'amount': 10}],
+        }
+
+    def post(self, payload, key, url=ADD_URL):
+        return self.client.post(url, payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_original_response(self):
+        """Test a retry gets the first response and does not write again."""
+        first = self.post(self.payload, 'retry-1')
+        second = self.post(self.payload, 'retry-1')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Transaction.objects.count(), 1)
+        balance = UserBalance.objects.get(initiator=self.user, participant=self.friend)
+        self.assertEqual(balance.balance, Decimal('10'))
+        self.assertEqual(balance.transaction_count, 1)
+
+    def test_retry_replayed_from_database_on_cache_miss(self):
+        """Test a retry is still replayed once the cache has lost the key."""
+        first = self.post(self.payload, 'retry-2')
+        cache.clear()
+
+        second = self.post(self.payload, 'retry-2')
+
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_keys_are_per_user(self):
+        """Test the same key sent by another user is a different write."""
+        self.post(self.payload, 'shared')
+        self.client.force_authenticate(self.friend)
+        payload = {**self.payload, 'payer_id': self.friend.id}
+
+        res = self.post(payload, 'shared')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_key_reused_for_different_request_rejected(self):
+        """Test a key sent again with a different payload is rejected."""
+        self.post(self.payload, 'reused')
+
+        res = self.post({**self.payload, 'description': 'Lunch'}, 'reused')
+
+        self.assertEqual(res.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(res.json()['response_key'], 'ERR_IDEMPOTENCY_KEY_REUSED')
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_failed_write_not_kept(self):
+        """Test a rejected write can be retried with the same key."""
+        res = self.post({**self.payload, 'total_amount': 5}, 'fix-and-retry')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        res = self.post(self.payload, 'fix-and-retry')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_expired_key_written_again(self):
+        """Test a key older than the TTL is a new write."""
+        self.post(self.payload, 'old')
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        cache.clear()
+
+        res = self.post(self.payload, 'old')
+
+        self.assertNotIn('Idempotent-Replayed', res)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_invalid_key_rejected(self):
+        """Test a key longer than 255 characters is rejected."""
+        res = self.post(self.payload, 'k' * 256)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_bulk_retry_replayed(self):
+        """Test a retried batch is not written again."""
+        batch = {'transactions': [self.payload, self.payload]}
+        first = self.post(batch, 'batch-1', url=ADD_BULK_URL)
+        second = self.post(batch, 'batch-1', url=ADD_BULK_URL)
+
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_add_transaction_action_replayed(self):
+        """Test the WebSocket action replays retries sent with the same key."""
+        consumer = CoreConsumer()
+        consumer.scope = {'user': self.user}
+        data = {'idempotency_key': 'ws-1', 'transaction_data': self.payload}
+
+        first = consumer.handle_add_transaction(data)
+        second = consumer.handle_add_transaction(data)
+
+        self.assertEqual(first['response_key'], 'SUCCESS_TRANSACTION_CREATED')
+        self.assertEqual(second, first)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_purge_expired_keys(self):
+        """Test the purge command only deletes keys older than the TTL."""
+        self.post(self.payload, 'old')
+        self.post({**self.payload, 'description': 'New'}, 'new')
+        IdempotencyKey.objects.filter(key='old').update(created_at=timezone.now() - timedelta(days=2))
+
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+        self.assertIn('Deleted 1', out.getvalue())
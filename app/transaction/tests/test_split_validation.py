@@ -0,0 +1,85 @@
+"""
+Test for set-wise validation of transaction split details.
+"""
+from decimal import Decimal
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from transaction.models import Transaction, TransactionParticipant, UserBalance
+from transaction.serializers import AddTransactionSerializer, ModifyTransactionSerializer
+from core.tests.utils import create_user, IN_MEMORY_CHANNEL_LAYERS
+
+
+def build_payload(payer, participants, amount=10):
+    return {
+        'payer_id': payer.id,
+        'total_amount': amount * len(participants),
+        'description': 'Dinner',
+        'transaction_type': 'debt',
+        'transaction_date': timezone.now().isoformat(),
+        'is_group': False,
+        'split_details': [{'user': user.id, 'amount': amount} for user in participants],
+    }
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class SplitDetailsValidationTests(TestCase):
+    """Test split details validation of the transaction serializers."""
+
+    def setUp(self):
+        self.payer = create_user('payer@example.com')
+        self.friends = [create_user(f'friend{i}@example.com') for i in range(30)]
+        self.payer.friends.add(*self.friends)
+
+    def count_validation_queries(self, serializer):
+        with CaptureQueriesContext(connection) as context:
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        return len(context.captured_queries)
+
+    def test_add_validation_queries_do_not_grow_with_split_size(self):
+        """Test validating 30 participants costs as much as validating 3."""
+        small = AddTransactionSerializer(data=build_payload(self.payer, [self.payer, *self.friends[:2]]), context={'user': self.payer})
+        large = AddTransactionSerializer(data=build_payload(self.payer, [self.payer, *self.friends]), context={'user': self.payer})
+
+        self.assertEqual(self.count_validation_queries(small), self.count_validation_queries(large))
+
+    def test_modify_validation_queries_do_not_grow_with_split_size(self):
+        """Test modifying to 30 participants validates as cheaply as 3."""
+        serializer = AddTransactionSerializer(data=build_payload(self.payer, [self.payer, self.friends[0]]), context={'user': self.payer})
+        serializer.is_valid(raise_exception=True)
+        transaction = serializer.save()
+
+        small = ModifyTransactionSerializer(transaction, data=build_payload(self.payer, [self.payer, *self.friends[:2]]), context={'user': self.payer})
+        large = ModifyTransactionSerializer(transaction, data=build_payload(self.payer, [self.payer, *self.friends]), context={'user': self.payer})
+
+        self.assertEqual(self.count_validation_queries(small), self.count_validation_queries(large))
+
+    def test_non_friend_in_split_rejected(self):
+        """Test a participant who is not a friend of the payer is rejected."""
+        stranger = create_user('stranger@example.com')
+        serializer = AddTransactionSerializer(data=build_payload(self.payer, [self.payer, stranger]), context={'user': self.payer})
+
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['response_key'], ['ERR_FRIENDS_REQUIRED'])
+
+    def test_resolved_users_used_on_create_and_update(self):
+        """Test participants and balances are written from the resolved users."""
+        friend_a, friend_b, friend_c = self.friends[:3]
+        serializer = AddTransactionSerializer(data=build_payload(self.payer, [self.payer, friend_a, friend_b]), context={'user': self.payer})
+        serializer.is_valid(raise_exception=True)
+        transaction = serializer.save()
+
+        self.assertEqual(TransactionParticipant.objects.filter(transaction=transaction).count(), 3)
+        self.assertEqual(UserBalance.objects.get(initiator=self.payer, participant=friend_a).balance, Decimal('10'))
+
+        serializer = ModifyTransactionSerializer(transaction, data=build_payload(self.payer, [self.payer, friend_a, friend_c], amount=20), context={'user': self.payer})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        participant_ids = set(TransactionParticipant.objects.filter(transaction=transaction).values_list('user_id', flat=True))
+        self.assertEqual(participant_ids, {self.payer.id, friend_a.id, friend_c.id})
+        self.assertEqual(UserBalance.objects.get(initiator=self.payer, participant=friend_a).balance, Decimal('20'))
+        self.assertEqual(UserBalance.objects.get(initiator=self.payer, participant=friend_b).balance, Decimal('0'))
+        self.assertEqual(UserBalance.objects.get(initiator=self.payer, participant=friend_c).balance, Decimal('20'))
+        self.assertEqual(Transaction.objects.get(id=transaction.id).split_count, 3)
@@ -1,14 +1,260 @@
-from asgiref.sync import async_to_sync
+import base64
+import json
+import logging
+import time
+from collections import namedtuple
+from datetime import datetime
 from copy import deepcopy
-from channels.layers import get_channel_layer
 from decimal import Decimal
 from django.forms.models import model_to_dict
-from django.db.models import F
-from transaction.models import TransactionParticipant, UserBalance
+from django.db import connection, transaction as db_transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Q
+from django.utils import timezone
+from core.push import filter_online_users, send_user_message
+from transaction.models import Transaction, TransactionParticipant, UserBalance, UserBalanceSummary
+
+logger = logging.getLogger(__name__)
+
+BalanceDeltaResult = namedtuple('BalanceDeltaResult', ['rows_touched', 'elapsed_ms'])
+
+
+class UserBalanceDeltaApplier:
+    """
+    Applies accumulated UserBalance deltas inside the database.
+
+    All pair deltas of one write are pushed as a single statement, so the
+    read-modify-write happens under the row lock Postgres takes for the
+    conflicting row instead of in Python. Rows are sent in pair order to keep
+    the lock order stable between concurrent writers. The UserBalanceSummary
+    of every touched user is updated in the same database transaction.
+    """
+
+    DELTA_COLUMNS = (
+        'initiator_id', 'participant_id', 'balance', 'total_amount_paid',
+        'total_amount_received', 'transaction_count', 'new_transaction_count',
+    )
+    DELTA_PLACEHOLDER = '(%s, %s, %s::numeric, %s::numeric, %s::numeric, %s::integer, %s::integer)'
+
+    UPSERT_SQL = """
+        WITH deltas ({columns}) AS (VALUES {values})
+        INSERT INTO {table} AS ub (
+            initiator_id, participant_id, balance, total_amount_paid,
+            total_amount_received, transaction_count, last_transaction_date, is_active
+        )
+        SELECT initiator_id, participant_id, balance, total_amount_paid,
+               total_amount_received, new_transaction_count, %s, TRUE
+        FROM deltas
+        ORDER BY initiator_id, participant_id
+        ON CONFLICT (initiator_id, participant_id) DO UPDATE SET
+            balance = ub.balance + EXCLUDED.balance,
+            total_amount_paid = ub.total_amount_paid + EXCLUDED.total_amount_paid,
+            total_amount_received = ub.total_amount_received + EXCLUDED.total_amount_received,
+            transaction_count = ub.transaction_count + (
+                SELECT d.transaction_count FROM deltas d
+                WHERE d.initiator_id = EXCLUDED.initiator_id AND d.participant_id = EXCLUDED.participant_id
+            ),
+            last_transaction_date = EXCLUDED.last_transaction_date
+        RETURNING ub.initiator_id, ub.participant_id
+    """
+
+    UPDATE_SQL = """
+        WITH deltas ({columns}) AS (VALUES {values})
+        UPDATE {table} AS ub SET
+            balance = ub.balance + d.balance,
+            total_amount_paid = ub.total_amount_paid + d.total_amount_paid,
+            total_amount_received = ub.total_amount_received + d.total_amount_received,
+            transaction_count = ub.transaction_count + d.transaction_count
+        FROM deltas d
+        WHERE ub.initiator_id = d.initiator_id AND ub.participant_id = d.participant_id
+        RETURNING ub.initiator_id, ub.participant_id
+    """
+
+    SUMMARY_UPSERT_SQL = """
+        INSERT INTO {table} AS s (user_id, total_owed, total_due, net_balance, updated_at)
+        VALUES {values}
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_owed = s.total_owed + EXCLUDED.total_owed,
+            total_due = s.total_due + EXCLUDED.total_due,
+            net_balance = s.net_balance + EXCLUDED.net_balance,
+            updated_at = EXCLUDED.updated_at
+    """
+
+    SUMMARY_UPDATE_SQL = """
+        UPDATE {table} AS s SET
+            total_owed = s.total_owed + d.total_owed,
+            total_due = s.total_due + d.total_due,
+            net_balance = s.net_balance + d.net_balance,
+            updated_at = d.updated_at
+        FROM (VALUES {values}) AS d (user_id, total_owed, total_due, net_balance, updated_at)
+        WHERE s.user_id = d.user_id
+    """
+
+    @staticmethod
+    def to_decimal(value) -> Decimal:
+        return value if isinstance(value, Decimal) else Decimal(str(value))
+
+    @classmethod
+    def apply(cls, balance_changes, new_pair_transaction_count=None, insert_missing=True) -> BalanceDeltaResult:
+        """
+        Apply balance deltas to UserBalance rows.
+
+        Args:
+            balance_changes (dict): Deltas keyed by the sorted (initiator_id, participant_id) pair, each
+                holding `balance`, `total_amount_paid`, `total_amount_received` and `transaction_count`.
+            new_pair_transaction_count (int): Transaction count for rows created by this call. Defaults to
+                the delta's own `transaction_count`.
+            insert_missing (bool): Create rows for pairs without a UserBalance. When False, missing pairs
+                are left untouched.
+
+        Returns:
+            BalanceDeltaResult: Number of rows touched and time spent in milliseconds.
+        """
+        if not balance_changes:
+            return BalanceDeltaResult(rows_touched=0, elapsed_ms=0.0)
+
+        started_at = time.perf_counter()
+        params = []
+        for (initiator_id, participant_id), changes in sorted(balance_changes.items()):
+            transaction_count = int(changes['transaction_count'])
+            params.extend([
+                initiator_id,
+                participant_id,
+                cls.to_decimal(changes['balance']),
+                cls.to_decimal(changes['total_amount_paid']),
+                cls.to_decimal(changes['total_amount_received']),
+                transaction_count,
+                transaction_count if new_pair_transaction_count is None else new_pair_transaction_count,
+            ])
+
+        sql = (cls.UPSERT_SQL if insert_missing else cls.UPDATE_SQL).format(
+            columns=', '.join(cls.DELTA_COLUMNS),
+            values=', '.join([cls.DELTA_PLACEHOLDER] * len(balance_changes)),
+            table=connection.ops.quote_name(UserBalance._meta.db_table),
+        )
+        if insert_missing:
+            params.append(timezone.now())
+
+        with db_transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                touched_pairs = cursor.fetchall()
+            rows_touched = len(touched_pairs)
+            cls.apply_summary_deltas([
+                (initiator_id, participant_id, balance_changes[(initiator_id, participant_id)]['balance'])
+                for initiator_id, participant_id in touched_pairs
+            ])
+
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        logger.debug("Applied %d UserBalance deltas (%d rows touched) in %.2f ms", len(balance_changes), rows_touched, elapsed_ms)
+        return BalanceDeltaResult(rows_touched=rows_touched, elapsed_ms=elapsed_ms)
+
+    @classmethod
+    def apply_summary_deltas(cls, pair_deltas, insert_missing=True) -> None:
+        """
+        Roll UserBalance balance deltas up into the UserBalanceSummary of both users.
+
+        Args:
+            pair_deltas (list): (initiator_id, participant_id, balance_delta) tuples. The initiator's
+                total owed and the participant's total due move by the balance delta.
+            insert_missing (bool): Create summaries for users without one. When False, missing
+                summaries are left untouched.
+        """
+        user_deltas = {}
+        for initiator_id, participant_id, balance in pair_deltas:
+            balance = cls.to_decimal(balance)
+            if not balance:
+                continue
+            user_deltas.setdefault(initiator_id, [Decimal(0), Decimal(0)])[0] += balance
+            user_deltas.setdefault(participant_id, [Decimal(0), Decimal(0)])[1] += balance
+
+        if not user_deltas:
+            return
+
+        now = timezone.now()
+        params = []
+        for user_id, (owed, due) in sorted(user_deltas.items()):
+            params.extend([user_id, owed, due, owed - due, now])
+
+        sql = (cls.SUMMARY_UPSERT_SQL if insert_missing else cls.SUMMARY_UPDATE_SQL).format(
+            table=connection.ops.quote_name(UserBalanceSummary._meta.db_table),
+            values=', '.join(['(%s::bigint, %s::numeric, %s::numeric, %s::numeric, %s::timestamptz)'] * len(user_deltas)),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
 
 
 class TransactionHelper:
 
+    @staticmethod
+    def encode_history_cursor(transaction_date, transaction_id) -> str:
+        """Encode the position of the last transaction of a history page."""
+        position = json.dumps([transaction_date.isoformat(), transaction_id], separators=(',', ':'))
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    @staticmethod
+    def decode_history_cursor(cursor) -> tuple:
+        """
+        Decode a history cursor.
+
+        Raises:
+            ValueError: If the cursor was not produced by `encode_history_cursor`.
+        """
+        try:
+            transaction_date, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return datetime.fromisoformat(transaction_date), int(transaction_id)
+        except (TypeError, ValueError, UnicodeError) as error:
+            raise ValueError("Invalid cursor") from error
+
+    @staticmethod
+    def get_transaction_history(user_id, limit, cursor=None, counterparty=None, group=None, transaction_type=None,
+                                start_date=None, end_date=None) -> tuple:
+        """
+        Get one page of the active transactions of a user, newest first.
+
+        Pages are read with keyset pagination over the user's participant rows on
+        (transaction_date, transaction), so every page is an index range scan of
+        `limit` rows whatever its depth, and nothing is counted.
+
+        Args:
+            user_id (int): The user whose history is read.
+            limit (int): Number of transactions in the page.
+            cursor (tuple): (transaction_date, transaction_id) of the last transaction of the previous page.
+            counterparty (int): Only transactions shared with this user.
+            group (int): Only transactions of this group.
+            transaction_type (str): Only transactions of this type.
+            start_date (datetime): Only transactions on or after this date.
+            end_date (datetime): Only transactions on or before this date.
+
+        Returns:
+            tuple: (list of Transaction with prefetched participants, next cursor or None).
+        """
+        rows = TransactionParticipant.objects.filter(user_id=user_id)
+        if cursor:
+            cursor_date, cursor_id = cursor
+            rows = rows.filter(
+                Q(transaction_date__lt=cursor_date) | Q(transaction_date=cursor_date, transaction_id__lt=cursor_id)
+            )
+        if start_date:
+            rows = rows.filter(transaction_date__gte=start_date)
+        if end_date:
+            rows = rows.filter(transaction_date__lte=end_date)
+        if group:
+            rows = rows.filter(transaction__group_id=group)
+        if transaction_type:
+            rows = rows.filter(transaction__transaction_type=transaction_type)
+        if counterparty:
+            rows = rows.filter(Exists(TransactionParticipant.objects.filter(
+                transaction_id=OuterRef('transaction_id'), user_id=counterparty
+            )))
+
+        page = list(rows.order_by('-transaction_date', '-transaction_id').values_list('transaction_date', 'transaction_id')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+
+        transactions = Transaction.objects.prefetch_related('transactionparticipant_set').in_bulk([transaction_id for _, transaction_id in page])
+        next_cursor = TransactionHelper.encode_history_cursor(*page[-1]) if has_more else None
+        return [transactions[transaction_id] for _, transaction_id in page if transaction_id in transactions], next_cursor
+
     @staticmethod
     def transform_split_data(data) -> list:
         transformed_data = []
@@ -30,40 +276,29 @@ class TransactionHelper:
         If reverse=False → Adjust balances as if transaction is being deleted.
         If reverse=True  → Adjust balances as if transaction is being restored.
         """
-        payer_id = instance.payer.id
-        participants = TransactionParticipant.all_objects.filter(transaction=instance)
-        participant_user_ids = participants.values_list('user_id', flat=True)
-        user_balance_pairs = [tuple(sorted((payer_id, user_id))) for user_id in participant_user_ids]
-
-        initiator_ids = [data[0] for data in user_balance_pairs]
-        participant_ids = [data[1] for data in user_balance_pairs]
-
-        existing_balances = {
-            (balance.initiator.id, balance.participant.id): balance
-            for balance in UserBalance.objects.filter(
-                initiator_id__in=initiator_ids,
-                participant_id__in=participant_ids
-            )
-        }
-
+        payer_id = instance.payer_id
+        participants = TransactionParticipant.all_objects.filter(transaction=instance).values_list('user_id', 'amount_owed')
         factor = 1 if not reverse else -1
 
-        for (initiator, participant), balance in existing_balances.items():
-            is_initiator_payer = payer_id == initiator
-            transaction_participant = participants.filter(user=participant if is_initiator_payer else initiator).first()
+        balance_changes = {}
+        for user_id, amount_owed in participants:
+            if user_id == payer_id or not amount_owed:
+                continue
 
-            if transaction_participant:
-                amount_owed = transaction_participant.amount_owed * factor
+            key = tuple(sorted((payer_id, user_id)))
+            if key in balance_changes:
+                continue
 
-                if is_initiator_payer:
-                    balance.balance -= amount_owed
-                    balance.total_amount_paid -= amount_owed
-                else:
-                    balance.balance += amount_owed
-                    balance.total_amount_received -= amount_owed
+            amount_owed = amount_owed * factor
+            is_initiator_payer = payer_id == key[0]
+            balance_changes[key] = {
+                'balance': -amount_owed if is_initiator_payer else amount_owed,
+                'total_amount_paid': -amount_owed if is_initiator_payer else 0,
+                'total_amount_received': 0 if is_initiator_payer else -amount_owed,
+                'transaction_count': -factor,
+            }
 
-                balance.transaction_count -= factor if amount_owed else 0
-                balance.save()
+        UserBalanceDeltaApplier.apply(balance_changes, insert_missing=False)
 
     @staticmethod
     def get_group_data(group):
@@ -76,12 +311,11 @@ class TransactionHelper:
         Returns:
             dict: A dictionary representation of the group object.
         """
-        data = model_to_dict(group)
+        data = model_to_dict(group, exclude=['participants'])
         data['id'] = str(data.get('id', ''))
         data['created_by'] = str(data.get('created_by', ''))
         data['created_at'] = group.created_at.isoformat()
         data['updated_at'] = group.updated_at.isoformat()
-        data.pop('participants', None)
         return data
 
     @staticmethod
@@ -166,6 +400,11 @@ class TransactionHelper:
             detail.pop("balance", None)
             detail["amount"] = split_details_map.get(detail["id"], 0.0)
 
+        return TransactionHelper.get_transaction_fields(transaction_obj), detail_split_details_copy
+
+    @staticmethod
+    def get_transaction_fields(transaction_obj) -> dict:
+        """Get the fields of a transaction as sent in websocket pushes."""
         data = model_to_dict(transaction_obj)
         data['total_amount'] = float(data.get('total_amount', ''))
         data['transaction_date'] = data.get('transaction_date', '').isoformat()
@@ -175,7 +414,7 @@ class TransactionHelper:
         data['created_by'] = str(data.get('created_by', ''))
         data['created_at'] = transaction_obj.created_at.isoformat()
         data['updated_at'] = transaction_obj.updated_at.isoformat()
-        return data, detail_split_details_copy
+        return data
 
     @staticmethod
     def broadcast_transaction_message(model, method, transaction_obj, exclude_user, ledger_dict, split_details):
@@ -200,14 +439,13 @@ class TransactionHelper:
             group = transaction_obj.group
             group_details = TransactionHelper.get_group_data(group)
 
-        channel_layer = get_channel_layer()
-        for split in split_details:
-            user_id = str(split.get('user', ''))
-            if user_id in exclude_user_id_set:
-                continue
+        recipient_ids = [str(split.get('user', '')) for split in split_details]
+        recipient_ids = filter_online_users([user_id for user_id in recipient_ids if user_id not in exclude_user_id_set])
+        user_total_balances = UserBalance.get_user_balances(recipient_ids)
 
+        for user_id in recipient_ids:
             ledgers = ledger_dict.get(str(user_id))
-            user_total_balance = UserBalance.get_user_balance(user_id)
+            user_total_balance = user_total_balances[user_id]
 
             data = {
                 **transaction_dict,
@@ -224,10 +462,7 @@ class TransactionHelper:
                 'data': data
             }
 
-            async_to_sync(channel_layer.group_send)(
-                f"user_{user_id}",
-                final_data
-            )
+            send_user_message(user_id, final_data)
 
     @staticmethod
     def get_transaction_ws_data(transaction, user_id) -> dict:
@@ -241,6 +476,27 @@ class TransactionHelper:
         Returns:
             dict: Dictionary containing transaction data.
         """
+        return TransactionHelper.get_transaction_ws_data_for_users(transaction, [user_id])[user_id]
+
+    @staticmethod
+    def get_transaction_ws_data_for_users(transaction, user_ids) -> dict:
+        """
+        Get transaction websocket data for several users of the same transaction.
+
+        Participants, ledger, split details and group data are loaded once and
+        shared between users. Each user only gets its own ledger slice and the
+        total balances come from one batched query, so the number of queries
+        does not depend on the number of users.
+
+        Args:
+            transaction (Transaction): The transaction object.
+            user_ids (list): The user IDs for which data is to be fetched.
+
+        Returns:
+            dict: Transaction data keyed by the user ID as given.
+        """
+        if not user_ids:
+            return {}
 
         participants = set(TransactionParticipant.objects.filter(
             transaction=transaction, is_active=True
@@ -248,7 +504,11 @@ class TransactionHelper:
 
         user_balances = UserBalance.objects.filter(
             initiator__in=participants, participant__in=participants
-        ).exclude(initiator=F('participant'))
+        ).exclude(
+            initiator=F('participant')
+        ).select_related(
+            'initiator', 'participant'
+        ).order_by('last_transaction_date', 'id')
 
         user_balances_dict = TransactionHelper.pre_process_user_balance(filtered_records=user_balances)
 
@@ -261,15 +521,186 @@ class TransactionHelper:
         )
 
         group_details = TransactionHelper.get_group_data(transaction.group) if transaction.group else {}
+        user_total_balances = UserBalance.get_user_balances(user_ids)
 
-        user_str_id = str(user_id)
-        ledgers = user_balances_dict.get(user_str_id, {})
-        user_total_balance = UserBalance.get_user_balance(user_str_id)
+        return {
+            user_id: {
+                **transaction_dict,
+                'split_details': detail_split_details_copy,
+                'ledger_balance': user_balances_dict.get(str(user_id), {}),
+                'group_details': group_details,
+                'user_total_balance': user_total_balances[user_id]
+            }
+            for user_id in user_ids
+        }
+
+    @staticmethod
+    def get_transactions_ws_data_for_user(transactions, user_id) -> list:
+        """
+        Get transaction websocket data of several transactions for one user.
+
+        Produces the same data as calling `get_transaction_ws_data` for every
+        transaction, but payers, groups and participants of the whole page are
+        loaded together, the UserBalance rows between all participants come from
+        one query and the user's total balance is read once, so the number of
+        queries does not depend on the number of transactions.
+
+        Args:
+            transactions (list): The transaction objects, or their IDs.
+            user_id (str): The user ID for which data is to be fetched.
+
+        Returns:
+            list: Transaction data in the order of `transactions`.
+        """
+        transaction_ids = [getattr(transaction, 'pk', transaction) for transaction in transactions]
+        if not transaction_ids:
+            return []
+
+        loaded = Transaction.all_objects.select_related('payer', 'group').prefetch_related(
+            Prefetch('transactionparticipant_set', queryset=TransactionParticipant.objects.order_by('id'))
+        ).in_bulk(transaction_ids)
+        participants_by_transaction = {
+            transaction_id: {participant.user_id for participant in transaction.transactionparticipant_set.all()}
+            for transaction_id, transaction in loaded.items()
+        }
+
+        all_participants = set().union(*participants_by_transaction.values())
+        user_balances = list(UserBalance.objects.filter(
+            initiator__in=all_participants, participant__in=all_participants
+        ).exclude(
+            initiator=F('participant')
+        ).select_related(
+            'initiator', 'participant'
+        ).order_by('last_transaction_date', 'id'))
+        # Indexed by initiator with their query position, so each transaction only visits the rows of its members
+        balances_by_initiator = {}
+        for position, record in enumerate(user_balances):
+            balances_by_initiator.setdefault(record.initiator_id, []).append((position, record))
+
+        user_total_balance = UserBalance.get_user_balances([user_id])[user_id]
+        group_details_by_id = {}
+        data = []
+        for transaction_id in transaction_ids:
+            transaction = loaded[transaction_id]
+            participants = participants_by_transaction[transaction_id]
+            user_balances_dict = TransactionHelper.pre_process_user_balance(filtered_records=[
+                record for _, record in sorted(
+                    (position, record)
+                    for initiator_id in participants
+                    for position, record in balances_by_initiator.get(initiator_id, [])
+                    if record.participant_id in participants
+                )
+            ])
+
+            transaction_dict, detail_split_details_copy = TransactionHelper.convert_to_transaction_dict(
+                transaction_obj=transaction,
+                split_details=transaction.get_split_details(),
+                detail_split_details=user_balances_dict.get(str(transaction.payer_id), {})
+            )
+
+            group_details = {}
+            if transaction.group:
+                if transaction.group_id not in group_details_by_id:
+                    group_details_by_id[transaction.group_id] = TransactionHelper.get_group_data(transaction.group)
+                group_details = group_details_by_id[transaction.group_id]
+
+            data.append({
+                **transaction_dict,
+                'split_details': detail_split_details_copy,
+                'ledger_balance': user_balances_dict.get(str(user_id), {}),
+                'group_details': group_details,
+                'user_total_balance': user_total_balance
+            })
+        return data
+
+    @staticmethod
+    def get_transactions_delta_data(transactions, all_pairs=False) -> tuple:
+        """
+        Get the delta websocket data of transactions, shared by all their users.
 
+        Split details are sent as user ids and amounts, without the profiles
+        the client already has.
+
+        Args:
+            transactions (list): The transaction objects.
+            all_pairs (bool): Count every pair of members as changed, for modifications
+                that may have moved balances between any of them. Otherwise only the
+                pairs of the payer with each member changed.
+
+        Returns:
+            tuple: (transaction data keyed by transaction ID, set of changed (initiator_id, participant_id) pairs)
+        """
+        participants = TransactionParticipant.objects.filter(
+            transaction__in=transactions, is_active=True
+        ).order_by('id').values_list('transaction_id', 'user_id', 'amount_owed')
+        split_details = {transaction.id: [] for transaction in transactions}
+        for transaction_id, user_id, amount_owed in participants:
+            split_details[transaction_id].append({'id': str(user_id), 'amount': float(amount_owed)})
+
+        data, changed_pairs = {}, set()
+        for transaction in transactions:
+            data[transaction.id] = {
+                **TransactionHelper.get_transaction_fields(transaction),
+                'split_details': split_details[transaction.id],
+            }
+            members = {int(split['id']) for split in split_details[transaction.id]} | {transaction.payer_id}
+            for user_id in members:
+                others = members if all_pairs else {transaction.payer_id}
+                changed_pairs.update((min(user_id, other), max(user_id, other)) for other in others if other != user_id)
+        return data, changed_pairs
+
+    @staticmethod
+    def get_ledger_changes_for_users(changed_pairs, user_ids) -> dict:
+        """
+        Get the new balances of changed UserBalance pairs as seen by each user, and their totals.
+
+        Balances are absolute, so applying the same change twice is harmless.
+
+        Args:
+            changed_pairs (set): The changed (initiator_id, participant_id) pairs.
+            user_ids (list): The user IDs for which data is to be fetched.
+
+        Returns:
+            dict: `ledger_changes` and `user_total_balance` keyed by the user ID as given.
+        """
+        involved = {user_id for pair in changed_pairs for user_id in pair}
+        balances = UserBalance.objects.filter(
+            initiator__in=involved, participant__in=involved
+        ).order_by('id').values_list('initiator_id', 'participant_id', 'balance')
+
+        changes_by_user = {}
+        for initiator_id, participant_id, balance in balances:
+            if (initiator_id, participant_id) not in changed_pairs:
+                continue
+            changes_by_user.setdefault(initiator_id, []).append({'id': str(participant_id), 'balance': float(balance)})
+            changes_by_user.setdefault(participant_id, []).append({'id': str(initiator_id), 'balance': -float(balance)})
+
+        user_total_balances = UserBalance.get_user_balances(user_ids)
+        return {
+            user_id: {
+                'ledger_changes': changes_by_user.get(int(user_id), []),
+                'user_total_balance': user_total_balances[user_id]
+            }
+            for user_id in user_ids
+        }
+
+    @staticmethod
+    def get_ledger_snapshot(user_id) -> dict:
+        """
+        Get the full ledger of a user, what delta pushes are applied to.
+
+        Args:
+            user_id (int): The user ID for which the ledger is to be fetched.
+
+        Returns:
+            dict: The user's `ledger_balance` with every counterparty and its `user_total_balance`.
+        """
+        user_balances = UserBalance.objects.filter(
+            Q(initiator_id=user_id) | Q(participant_id=user_id)
+        ).select_related(
+            'initiator', 'participant'
+        ).order_by('last_transaction_date', 'id')
         return {
-            **transaction_dict,
-            'split_details': detail_split_details_copy,
-            'ledger_balance': ledgers,
-            'group_details': group_details,
-            'user_total_balance': user_total_balance
+            'ledger_balance': TransactionHelper.pre_process_user_balance(filtered_records=user_balances).get(str(user_id), []),
+            'user_total_balance': UserBalance.get_user_balances([user_id])[user_id]
         }
@@ -0,0 +1,180 @@
+"""
+Validators for Transaction API View
+"""
+from django.contrib.auth import get_user_model
+from rest_framework.exceptions import ValidationError
+from app.helper import Helper
+from group.models import Group, GroupParticipant
+
+User = get_user_model()
+
+
+class SplitDetailsValidator:
+    """
+    Validates the split details of a transaction set-wise.
+
+    Friendship, group membership and participant rows are loaded with one
+    query each, whatever the number of split rows, and the resolved users are
+    handed back so `create`/`update` don't need to look them up again.
+    """
+
+    def __init__(self, payer, split_details, total_amount, group=None, is_group=False,
+                 friend_ids=None, group_participant_ids=None, users=None):
+        self.payer = payer
+        self.split_details = split_details
+        self.total_amount = total_amount
+        self.group = group
+        self.is_group = is_group
+        # Lookups preloaded for a whole batch by BulkSplitDetailsValidator
+        self.friend_ids = friend_ids
+        self.group_participant_ids = group_participant_ids
+        self.users = users
+
+    def parse_split_details(self) -> list[int]:
+        """Check every split row and return the participant ids in order."""
+        user_ids = []
+        total_split_amount = 0
+
+        for split in self.split_details:
+            try:
+                participant_id = int(split['user'])
+                amount = float(split['amount'])
+                if amount < 0:
+                    raise ValueError
+            except (KeyError, TypeError, ValueError):
+                Helper.raise_validation_error("ERR_SPLIT_DETAILS_REQUIRED")
+
+            user_ids.append(participant_id)
+            total_split_amount += amount
+
+        if total_split_amount != self.total_amount:
+            Helper.raise_validation_error("ERR_SPLIT_MISMATCH")
+
+        return user_ids
+
+    def validate(self) -> dict:
+        """
+        Validate the split details.
+
+        Returns:
+            dict: Participant users keyed by user id.
+        """
+        if not self.split_details:
+            Helper.raise_validation_error("ERR_SPLIT_DETAILS_REQUIRED")
+
+        user_ids = self.parse_split_details()
+        split_users_set = set(user_ids)
+
+        if self.payer.id not in split_users_set:
+            Helper.raise_validation_error("ERR_PAYER_NOT_IN_SPLIT")
+
+        other_user_ids = split_users_set - {self.payer.id}
+        friend_ids = self.friend_ids
+        if friend_ids is None:
+            friend_ids = set(self.payer.friends.filter(id__in=other_user_ids).values_list('id', flat=True))
+        if other_user_ids - friend_ids:
+            Helper.raise_validation_error("ERR_FRIENDS_REQUIRED")
+
+        if self.is_group and not self.group:
+            Helper.raise_validation_error("ERR_GROUP_REQUIRED")
+
+        if self.is_group and self.group:
+            group_participants_ids = self.group_participant_ids
+            if group_participants_ids is None:
+                group_participants_ids = set(self.group.participants.values_list('id', flat=True))
+            if split_users_set != group_participants_ids:
+                Helper.raise_validation_error("ERR_NOT_ALL_GROUP_MEMBERS_INCLUDED")
+
+        if self.users is None:
+            split_users = User.objects.in_bulk(split_users_set)
+        else:
+            split_users = {user_id: self.users[user_id] for user_id in split_users_set if user_id in self.users}
+        missing_user_ids = split_users_set - split_users.keys()
+        if missing_user_ids:
+            Helper.raise_validation_error('ERR_PARTICIPANT_NOT_FOUND', {'participant_id': min(missing_user_ids)})
+
+        return split_users
+
+
+class BulkSplitDetailsValidator:
+    """
+    Validates the split details of a batch of transactions set-wise.
+
+    Payers, participants, friendships and group members of the whole batch are
+    loaded with one query each and every transaction is then checked by
+    `SplitDetailsValidator` against those lookups, so the number of queries
+    does not depend on the size of the batch.
+    """
+
+    def __init__(self, transactions):
+        self.transactions = transactions
+
+    def load_lookups(self) -> tuple:
+        """Load the users, friendships, groups and group members referenced by the batch."""
+        payer_ids, user_ids, group_ids = set(), set(), set()
+        for data in self.transactions:
+            payer_ids.add(data['payer_id'])
+            for split in data.get('split_details') or []:
+                try:
+                    user_ids.add(int(split['user']))
+                except (KeyError, TypeError, ValueError):
+                    continue
+            if data.get('group'):
+                group_ids.add(data['group'])
+
+        users = User.objects.in_bulk(payer_ids | user_ids)
+
+        friend_ids = {payer_id: set() for payer_id in payer_ids}
+        friendships = User.friends.through.objects.filter(
+            from_user_id__in=payer_ids, to_user_id__in=user_ids
+        ).values_list('from_user_id', 'to_user_id')
+        for payer_id, friend_id in friendships:
+            friend_ids[payer_id].add(friend_id)
+
+        groups = Group.objects.in_bulk(group_ids)
+        group_participant_ids = {group_id: set() for group_id in group_ids}
+        memberships = GroupParticipant.objects.filter(group_id__in=group_ids).values_list('group_id', 'user_id')
+        for group_id, user_id in memberships:
+            group_participant_ids[group_id].add(user_id)
+
+        return users, friend_ids, groups, group_participant_ids
+
+    def validate(self) -> list:
+        """
+        Validate the split details of every transaction of the batch.
+
+        Errors carry the `index` of the first transaction that failed.
+
+        Returns:
+            list: The transactions, with `payer`, `group` and `split_users` resolved.
+        """
+        users, friend_ids, groups, group_participant_ids = self.load_lookups()
+
+        validated = []
+        for index, data in enumerate(self.transactions):
+            payer = users.get(data['payer_id'])
+            if payer is None:
+                Helper.raise_validation_error('ERR_PARTICIPANT_NOT_FOUND', {'participant_id': data['payer_id'], 'index': index})
+
+            group_id = data.get('group')
+            group = groups.get(group_id) if group_id else None
+            if group_id and group is None:
+                Helper.raise_validation_error('ERR_GROUP_NOT_FOUND', {'index': index})
+
+            try:
+                split_users = SplitDetailsValidator(
+                    payer=payer,
+                    split_details=data.get('split_details', []),
+                    total_amount=data.get('total_amount'),
+                    group=group,
+                    is_group=data.get('is_group', False),
+                    friend_ids=friend_ids[payer.id],
+                    group_participant_ids=group_participant_ids.get(group_id),
+                    users=users,
+                ).validate()
+            except ValidationError as error:
+                error.detail['index'] = str(index)
+                raise
+
+            validated.append({**data, 'payer': payer, 'group': group, 'split_users': split_users})
+        return validated
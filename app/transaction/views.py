@@ -5,13 +5,17 @@ from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
 from django.core.paginator import Paginator
 from django.db.models import Q
+from user.authentication import StatelessJWTAuthentication
 from user.renderers import UserRenderer
 from transaction.models import Transaction
 from transaction.utils import TransactionHelper
+from transaction.idempotency import idempotent_response
 from transaction.serializers import (
     AddTransactionSerializer,
+    BulkAddTransactionSerializer,
     ModifyTransactionSerializer,
-    BulkTransactionSerializer
+    BulkTransactionSerializer,
+    TransactionHistorySerializer
 )
 
 
@@ -22,6 +26,9 @@ class AddTransactionView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
+        return idempotent_response(request, self.create_transaction)
+
+    def create_transaction(self, request):
         serializer = AddTransactionSerializer(data=request.data, context={'user': request.user})
         if serializer.is_valid():
             transaction = serializer.save()
@@ -32,6 +39,26 @@ class AddTransactionView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class BulkAddTransactionView(APIView):
+    """Create a batch of transactions in splitemate"""
+
+    renderer_classes = [UserRenderer]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        return idempotent_response(request, self.create_transactions)
+
+    def create_transactions(self, request):
+        serializer = BulkAddTransactionSerializer(data=request.data, context={'user': request.user})
+        if serializer.is_valid():
+            transactions = serializer.save()
+            return Response({
+                'message': 'Transactions created successfully.',
+                'transaction_ids': [transaction.id for transaction in transactions]
+            }, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
 class ModifyTransactionView(APIView):
     """ Modify existing transaction of splitemate """
 
@@ -50,6 +77,7 @@ class ModifyTransactionView(APIView):
 class GetExistingTransactionView(APIView):
     """Get existing transaction of splitemate"""
 
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
     renderer_classes = [UserRenderer]
 
@@ -131,7 +159,6 @@ class GetBulkTransactionView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            transaction_data = []
             transaction_ids = serializer.validated_data['transaction_ids']
             queryset = Transaction.objects.filter(
                 id__in=transaction_ids
@@ -142,9 +169,7 @@ class GetBulkTransactionView(APIView):
             paginator = Paginator(queryset, limit)
             page_object = paginator.get_page(page)
             entries = list(page_object.object_list)
-
-            for txn in entries:
-                transaction_data.append(TransactionHelper.get_transaction_ws_data(transaction=txn, user_id=request_user_id))
+            transaction_data = TransactionHelper.get_transactions_ws_data_for_user(transactions=entries, user_id=request_user_id)
 
             has_more = page_object.has_next()
 
@@ -154,3 +179,31 @@ class GetBulkTransactionView(APIView):
             }
             return Response(response_data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class TransactionHistoryView(APIView):
+    """Get the transaction history of the user, newest first, one cursor page at a time"""
+
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [UserRenderer]
+
+    def get(self, request):
+        serializer = TransactionHistorySerializer(data=request.query_params)
+        if serializer.is_valid():
+            params = serializer.validated_data
+            transactions, next_cursor = TransactionHelper.get_transaction_history(
+                user_id=request.user.id,
+                limit=params['limit'],
+                cursor=params.get('cursor'),
+                counterparty=params.get('counterparty'),
+                group=params.get('group'),
+                transaction_type=params.get('type'),
+                start_date=params.get('start_date'),
+                end_date=params.get('end_date'),
+            )
+            return Response({
+                "transactions": [transaction.get_transaction_data() for transaction in transactions],
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None,
+            }, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,105 @@
+"""
+Authentication of read-only views from the access token, without loading the user
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+# User fields put in tokens, enough for views that only read the user's own profile
+USER_CLAIMS = ('email', 'name', 'image_url', 'is_active')
+
+
+def get_user_claims(user) -> dict:
+    return {claim: getattr(user, claim) for claim in USER_CLAIMS}
+
+
+def get_claims_cache_key(user_id) -> str:
+    return f"user_claims:{user_id}"
+
+
+def cache_user_claims(user, **overrides) -> dict:
+    """
+    Keep the current claims of a user, which take over from the claims of tokens issued before.
+
+    Kept as long as an access token lives, the longest the claims of a token are trusted.
+    """
+    claims = {**get_user_claims(user), **overrides}
+    cache.set(get_claims_cache_key(user.id), claims, settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME'].total_seconds())
+    return claims
+
+
+class StatelessUser:
+    """
+    User built from its ID and claims, the `User` row is only loaded when another attribute is read.
+
+    Meant for views that use `request.user.id` and the claims. It is not a
+    model instance, so it cannot be passed to querysets or saved.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id, claims, user=None):
+        self.id = self.pk = user_id
+        for claim in USER_CLAIMS:
+            setattr(self, claim, claims[claim])
+        self._user = user
+
+    def get_user(self):
+        if self._user is None:
+            self._user = get_user_model().objects.get(pk=self.id)
+        return self._user
+
+    def __getattr__(self, name):
+        # Only reached for attributes that are not claims
+        if name.startswith('__') or name == '_user':
+            raise AttributeError(name)
+        return getattr(self.get_user(), name)
+
+    def __eq__(self, other):
+        if isinstance(other, (StatelessUser, get_user_model())):
+            return self.pk == other.pk
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return self.email
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that does not read `core_user` on every request.
+
+    Claims come from the cache kept fresh when a user is saved, see
+    core.signals, else from the token. Only access tokens issued at login
+    carry claims, so a change missed by the cache is served at most
+    ACCESS_TOKEN_LIFETIME. Tokens without claims, like access tokens
+    refreshed from a refresh token, load the user and cache its claims.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = None
+        claims = cache.get(get_claims_cache_key(user_id))
+        if claims is None and all(claim in validated_token for claim in USER_CLAIMS):
+            claims = {claim: validated_token[claim] for claim in USER_CLAIMS}
+        if claims is None:
+            user = get_user_model().objects.filter(pk=user_id).first()
+            if user is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            claims = cache_user_claims(user)
+
+        if not claims['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return StatelessUser(user_id, claims, user)
@@ -1,15 +1,82 @@
+import gzip
+from decimal import Decimal
+import orjson
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.functional import Promise
 from rest_framework import renderers
-import json
+from rest_framework.exceptions import ErrorDetail
+
+# Subclasses of dict, list and str are handed to `default`, which is how ErrorDetail strings are found
+ENCODE_OPTIONS = orjson.OPT_PASSTHROUGH_SUBCLASS | orjson.OPT_NON_STR_KEYS
+
+
+class ResponseEncoder:
+    """orjson `default` of one response, noting whether the data holds DRF errors."""
+
+    def __init__(self):
+        self.has_errors = False
+
+    def __call__(self, obj):
+        if isinstance(obj, ErrorDetail):
+            self.has_errors = True
+            return str(obj)
+        if isinstance(obj, dict):
+            return dict(obj)
+        if isinstance(obj, (list, tuple)):
+            return list(obj)
+        if isinstance(obj, (str, Promise)):
+            return str(obj)
+        if isinstance(obj, Decimal):
+            return float(obj)
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode_response(data) -> bytes:
+    """Encode response data, wrapped in `{"errors": ...}` when it holds DRF validation errors."""
+    encoder = ResponseEncoder()
+    content = orjson.dumps(data, default=encoder, option=ENCODE_OPTIONS)
+    if encoder.has_errors:
+        return b'{"errors":' + content + b'}'
+    return content
+
+
+def accepts_gzip(accept_encoding) -> bool:
+    """
+    Whether an Accept-Encoding header accepts gzip.
+
+    gzip is accepted when it is listed with a non-zero quality, or when it is
+    not listed and `*` is, with a non-zero quality.
+    """
+    qualities = {}
+    for coding in accept_encoding.split(','):
+        name, *params = [part.strip() for part in coding.split(';')]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            qualities[name.lower()] = quality
+    return qualities.get('gzip', qualities.get('*', 0.0)) > 0
 
 
 class UserRenderer(renderers.JSONRenderer):
     charset = 'utf-8'
 
     def render(self, data, accepted_media_type=None, renderer_context=None):
-        response = ''
-        if 'ErrorDetail' in str(data):
-            response = json.dumps({'errors': data})
-        else:
-            response = json.dumps(data)
+        content = encode_response(data)
+
+        min_size = getattr(settings, 'API_GZIP_MIN_SIZE', 0)
+        if min_size and len(content) >= min_size and renderer_context:
+            request, response = renderer_context.get('request'), renderer_context.get('response')
+            if request is not None and response is not None:
+                patch_vary_headers(response, ('Accept-Encoding',))
+                if accepts_gzip(request.headers.get('Accept-Encoding', '')):
+                    response['Content-Encoding'] = 'gzip'
+                    content = gzip.compress(content, compresslevel=5)
 
-        return response
+        return content
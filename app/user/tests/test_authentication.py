@@ -0,0 +1,107 @@
+"""
+Test for stateless JWT authentication of read-only views.
+"""
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from app.helper import Helper
+from user.authentication import StatelessUser
+from core.tests.utils import create_user
+
+PROFILE_URL = reverse("user:profile")
+SYNC_URL = reverse("activity:sync_activity")
+
+
+class StatelessJWTAuthenticationTests(TestCase):
+    """Test read-only views authenticate from the token claims."""
+
+    def setUp(self):
+        self.user = create_user("user@example.com")
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {Helper.get_tokens_for_user(self.user)['access']}")
+
+    def get_user_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url)
+        return res, [query['sql'] for query in queries if 'FROM "core_user"' in query['sql']]
+
+    def test_profile_without_user_query(self):
+        """Test the profile is served from the token claims without reading the user."""
+        res, user_queries = self.get_user_queries(PROFILE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["email"], "user@example.com")
+        self.assertEqual(user_queries, [])
+
+    def test_sync_without_user_query(self):
+        res, user_queries = self.get_user_queries(SYNC_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(user_queries, [])
+
+    def test_changed_user_overrides_token_claims(self):
+        """Test a user saved after its token was issued is served with its new fields."""
+        self.user.name = "Renamed"
+        self.user.save()
+
+        res, user_queries = self.get_user_queries(PROFILE_URL)
+
+        self.assertEqual(res.data["name"], "Renamed")
+        self.assertEqual(user_queries, [])
+
+    def test_deactivated_user_rejected(self):
+        """Test a token issued before the user was deactivated is rejected."""
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(PROFILE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_token_without_claims_loads_user_once(self):
+        """Test a token issued without claims reads the user once, then its cached claims."""
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+        _, first_queries = self.get_user_queries(PROFILE_URL)
+        res, second_queries = self.get_user_queries(PROFILE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual((len(first_queries), len(second_queries)), (1, 0))
+
+    def test_claims_only_on_access_token(self):
+        """Test the refresh token carries no claims, so access tokens refreshed from it do not either."""
+        tokens = Helper.get_tokens_for_user(self.user)
+
+        self.assertEqual(AccessToken(tokens["access"])["email"], "user@example.com")
+        self.assertNotIn("is_active", RefreshToken(tokens["refresh"]).payload)
+        self.assertNotIn("is_active", RefreshToken(tokens["refresh"]).access_token.payload)
+
+    def test_refreshed_token_rejects_user_deactivated_without_signal(self):
+        """Test a user deactivated by a queryset update is rejected once its token is refreshed."""
+        refresh = Helper.get_tokens_for_user(self.user)["refresh"]
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken(refresh).access_token}")
+
+        res = self.client.get(PROFILE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_other_attributes_loaded_lazily(self):
+        """Test attributes that are not claims are read from the user row."""
+        stateless_user = StatelessUser(self.user.id, {
+            "email": "user@example.com", "name": "user@example.com", "image_url": "", "is_active": True
+        })
+
+        with self.assertNumQueries(1):
+            self.assertEqual(stateless_user.invite_token, self.user.invite_token)
+            self.assertEqual(stateless_user.user_source, self.user.user_source)
+
+        self.assertEqual(stateless_user, self.user)
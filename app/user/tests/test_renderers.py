@@ -0,0 +1,99 @@
+"""
+Test for the JSON renderer of the API.
+"""
+import gzip
+import json
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+from rest_framework.views import APIView
+from user.renderers import UserRenderer, accepts_gzip
+
+
+class EchoView(APIView):
+    renderer_classes = [UserRenderer]
+    data = None
+
+    def get(self, request):
+        return Response(self.data)
+
+
+class UserRendererTests(SimpleTestCase):
+    """Test responses are encoded in one pass, with errors wrapped."""
+
+    def render(self, data):
+        return json.loads(UserRenderer().render(data))
+
+    def test_validation_errors_wrapped(self):
+        """Test data holding DRF errors, at any depth, is wrapped in `errors`."""
+        errors = ReturnDict({'split_details': [{'amount': [ErrorDetail('Invalid', code='invalid')]}]}, serializer=None)
+
+        self.assertEqual(self.render(errors), {'errors': {'split_details': [{'amount': ['Invalid']}]}})
+
+    def test_text_mentioning_error_detail_not_wrapped(self):
+        """Test only ErrorDetail values mark errors, not text that spells the class name."""
+        self.assertEqual(self.render({'description': 'ErrorDetail'}), {'description': 'ErrorDetail'})
+
+    def test_values_encoded(self):
+        """Test serializer containers, decimals and datetimes are encoded."""
+        data = ReturnList([{'amount': Decimal('10.50'), 'at': datetime(2025, 1, 1, tzinfo=timezone.utc), 1: 'x'}], serializer=None)
+
+        self.assertEqual(self.render(data), [{'amount': 10.5, 'at': '2025-01-01T00:00:00+00:00', '1': 'x'}])
+
+    @override_settings(API_GZIP_MIN_SIZE=100)
+    def test_large_body_gzipped_when_accepted(self):
+        """Test bodies over the threshold are gzipped for clients accepting it."""
+        EchoView.data = {'transactions': ['x' * 200]}
+        request = APIRequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        response = EchoView.as_view()(request)
+        response.render()
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content)), EchoView.data)
+
+    @override_settings(API_GZIP_MIN_SIZE=100)
+    def test_body_not_gzipped_when_not_accepted(self):
+        EchoView.data = {'transactions': ['x' * 200]}
+
+        response = EchoView.as_view()(APIRequestFactory().get('/'))
+        response.render()
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(json.loads(response.content), EchoView.data)
+
+    @override_settings(API_GZIP_MIN_SIZE=100)
+    def test_body_not_gzipped_when_refused(self):
+        """Test gzip refused with a zero quality, or only similar codings accepted, is not used."""
+        EchoView.data = {'transactions': ['x' * 200]}
+
+        for accept_encoding in ['gzip;q=0', 'identity, x-gzip', 'gzip;q=0, *']:
+            with self.subTest(accept_encoding=accept_encoding):
+                request = APIRequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+                response = EchoView.as_view()(request)
+                response.render()
+
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(json.loads(response.content), EchoView.data)
+
+    def test_accepts_gzip(self):
+        self.assertTrue(accepts_gzip('gzip, deflate'))
+        self.assertTrue(accepts_gzip('br;q=1.0, GZIP;q=0.5'))
+        self.assertTrue(accepts_gzip('*'))
+        self.assertFalse(accepts_gzip(''))
+        self.assertFalse(accepts_gzip('gzip;q=0.0'))
+        self.assertFalse(accepts_gzip('x-gzip'))
+        self.assertFalse(accepts_gzip('*;q=0'))
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_renderer', '--iterations', '2', stdout=out)
+
+        self.assertIn('50 transactions', out.getvalue())
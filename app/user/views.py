@@ -16,6 +16,7 @@ from user.serializers import (
 )
 from app.helper import Helper
 from django.contrib.auth import get_user_model
+from user.authentication import StatelessJWTAuthentication
 from user.renderers import UserRenderer
 from django.contrib.auth import authenticate
 from django.http import Http404
@@ -135,6 +136,7 @@ class UserProfileView(APIView):
     """Profile"""
 
     renderer_classes = [UserRenderer]
+    authentication_classes = [StatelessJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, format=None):